@@ -32,8 +32,9 @@
 
 from .experiment import Experiment
 from .source import Source
-from .particle import ParticleSphere, ParticleSpheroid, ParticleMap, ParticleAtoms
+from .particle import ParticleSphere, ParticleSpheroid, ParticleMap, ParticleAtoms, ParticleBeads, ParticleRadial, ParticleCylinder, ParticleCrystal
 from .detector import Detector
+from .schedule import ParameterSchedule
 import tests.test_all
 
 def _init():    
@@ -43,6 +43,7 @@ from condor.utils.log import log_and_raise_error,log_warning,log_info,log_debug
 
 import utils.resample
 from condor.utils.variation import Variation
+from condor.utils.rng import get_random_state
 from condor.utils.pixelmask import PixelMask
 from condor.utils.linalg import length
 import condor.utils.testing
@@ -298,7 +299,7 @@ class Detector:
             if tmp.sum() > 0:
                 self._mask[tmp] |= PixelMask.PIXEL_IS_MISSING
 
-    def get_mask(self,intensities=None, boolmask=False):
+    def get_mask(self,intensities=None, boolmask=False, out=None):
         """
         Return mask. The mask has information about the status of each individual detector pixel. The output can be either a CXI bitmask (default) or a boolean mask
     
@@ -308,11 +309,17 @@ class Detector:
           :intensities: Numpy array of photon intensities for masking saturated pixels (default ``None``)
 
           :boolmask (bool): If ``True`` the output will be a boolean array. Mask values are converted to ``True`` if no bit is set and to ``False`` otherwise
+
+          :out (array): Array of type ``numpy.uint16`` and of the shape of the mask the CXI bitmask is written into. If ``None`` a new array is allocated (default ``None``)
         """
         if intensities is not None:
             if not condor.utils.testing.same_shape(intensities, self._mask):
                 log_and_raise_error(logger, "Intensities and mask do not have the same shape")
-        M = self._mask.copy()
+        if out is None:
+            M = self._mask.copy()
+        else:
+            M = out
+            M[...] = self._mask
         if self.saturation_level is not None and intensities is not None:
             M[intensities >= self.saturation_level] |= PixelMask.PIXEL_IS_SATURATED
         if boolmask:
@@ -339,14 +346,20 @@ class Detector:
         else:
             return self.cy_mean
         
-    def get_next(self):
+    def get_next(self, values=None):
         """
         Iterate the parameters of the Detector instance and return them as a dictionary
+
+        Kwargs:
+          :values (dict): Parameters of this shot that were drawn in advance (see :meth:`condor.detector.Detector.get_next_batch`). If ``None`` the parameters are drawn (default ``None``)
         """
         O = {}
-        cx_mean = self.get_cx_mean_value()
-        cy_mean = self.get_cy_mean_value()
-        cx, cy = self._center_variation.get([cx_mean, cy_mean])
+        if values is None:
+            cx_mean = self.get_cx_mean_value()
+            cy_mean = self.get_cy_mean_value()
+            cx, cy = self._center_variation.get([cx_mean, cy_mean])
+        else:
+            cx, cy = values["cx"], values["cy"]
         O["cx"] = cx
         O["cy"] = cy
         O["nx"] = self._nx
@@ -358,7 +371,17 @@ class Detector:
             O["cy_xxx"] = utils.resample.downsample_pos(cy, self._ny, self.binning)
         return O
 
-    def get_pixel_solid_angle(self, x_off=0., y_off=0.):
+    def get_next_batch(self, n):
+        """
+        Iterate the varying parameters of the Detector instance ``n`` times at once and return them as a dictionary of arrays of length ``n``
+
+        Args:
+          :n (int): Number of shots
+        """
+        c = numpy.asarray(self._center_variation.get([self.get_cx_mean_value(), self.get_cy_mean_value()], n), dtype=numpy.float64)
+        return {"cx":c[:,0], "cy":c[:,1]}
+
+    def get_pixel_solid_angle(self, x_off=0., y_off=0., r_max=None):
         """
         Get the solid angle for a pixel at position ``x_off``, ``y_off`` with respect to the beam center
         
@@ -366,11 +389,14 @@ class Detector:
           :x_off: *x*-coordinate of the pixel position (center) in unit pixel with respect to the beam center (default 0.)
 
           :y_off: *y*-coordinate of the pixel position (center) in unit pixel with respect to the beam center (default 0.)
+
+          :r_max (float): Maximum distance of a pixel from the beam center in unit meter that decides whether the small angle approximation is used. If ``None`` the maximum distance of the given pixels (default ``None``)
         """
-        r_max = numpy.sqrt(x_off**2+y_off**2) * self.pixel_size
-        it = isinstance(r_max, collections.Iterable)
-        if it:
-            r_max = r_max.max()
+        it = isinstance(x_off, collections.Iterable)
+        if r_max is None:
+            r_max = numpy.sqrt(x_off**2+y_off**2) * self.pixel_size
+            if it:
+                r_max = r_max.max()
         if r_max/self.distance < 0.0001:
             # Small angle approximation (fast)
             omega = self.pixel_size**2 / self.distance**2
@@ -383,7 +409,7 @@ class Detector:
             omega = 4. * numpy.arcsin(numpy.sin(x_alpha/2.)*numpy.sin(y_alpha/2.))
         return omega
 
-    def get_all_pixel_solid_angles(self, cx, cy):
+    def get_all_pixel_solid_angles(self, cx, cy, pixels=None):
         """
         Return the solid angles of all detector pixels assuming a beam center at position (``cx``, ``cy``).
         
@@ -391,11 +417,22 @@ class Detector:
           :cx (float): *x*-coordinate of the center position in unit pixel
 
           :cy (float): *y*-coordinate of the center position in unit pixel
-        """
-        Y, X = numpy.meshgrid(numpy.float64(numpy.arange(self._ny))-cy,
-                              numpy.float64(numpy.arange(self._nx))-cx,
-                              indexing="ij")
-        return self.get_pixel_solid_angle(X, Y)
+
+        Kwargs:
+          :pixels (array): Flat indices of the pixels for which the solid angles are returned. If ``None`` all pixels (default ``None``)
+        """
+        if pixels is None:
+            Y, X = numpy.meshgrid(numpy.float64(numpy.arange(self._ny))-cy,
+                                  numpy.float64(numpy.arange(self._nx))-cx,
+                                  indexing="ij")
+            return self.get_pixel_solid_angle(X, Y)
+        Y = numpy.float64(pixels / self._nx) - cy
+        X = numpy.float64(pixels % self._nx) - cx
+        # The small angle approximation is chosen for the entire detector
+        x_max = abs(numpy.float64([0, self._nx-1]) - cx).max()
+        y_max = abs(numpy.float64([0, self._ny-1]) - cy).max()
+        r_max = numpy.sqrt(x_max**2+y_max**2) * self.pixel_size
+        return self.get_pixel_solid_angle(X, Y, r_max=r_max)
     
     def _get_xy_max_dist(self, cx = None, cy = None, center_variation = False):
         dist_max = []
@@ -403,8 +440,7 @@ class Detector:
                        [(cy if cy is not None else self.get_cy_mean_value()),self._center_variation.get_spread()[1],self._ny]]:
             lim = 0
             if center_variation:
-                lim = dc 
-                lim = lim*0.5 if lim is not None else 0.
+                lim = dc if dc is not None else 0.
                 cv_mode = self._center_variation.get_mode()
                 if cv_mode is not None:
                     if "normal" in cv_mode:
@@ -533,15 +569,20 @@ class Detector:
         res = numpy.pi / length(qmax)
         return res
 
-    def generate_xypix(self, cx=None, cy=None):
+    def generate_xypix(self, cx=None, cy=None, pixels=None):
+        if pixels is not None:
+            # Positions of the pixels with the given flat indices
+            Y = numpy.float64(pixels / self._nx)-(0. if cx is None else cx)
+            X = numpy.float64(pixels % self._nx)-(0. if cy is None else cy)
+            return X, Y
         Y, X = numpy.meshgrid(numpy.float64(numpy.arange(self._ny))-(0. if cx is None else cx),
                               numpy.float64(numpy.arange(self._nx))-(0. if cy is None else cy),
                               indexing="ij")
         return X, Y
         
-    def generate_qmap(self, wavelength, cx=None, cy=None, extrinsic_rotation=None, order='xyz'):
-        X, Y = self.generate_xypix(cx, cy)
-        return condor.utils.scattering_vector.generate_qmap(X, Y, self.pixel_size, self.distance, wavelength, extrinsic_rotation=extrinsic_rotation, order=order)
+    def generate_qmap(self, wavelength, cx=None, cy=None, extrinsic_rotation=None, order='xyz', pixels=None, dtype=numpy.float64):
+        X, Y = self.generate_xypix(cx, cy, pixels=pixels)
+        return condor.utils.scattering_vector.generate_qmap(X, Y, self.pixel_size, self.distance, wavelength, extrinsic_rotation=extrinsic_rotation, order=order, dtype=dtype)
 
     def generate_qmap_3d(self, wavelength, qn=None, qmax=None, extrinsic_rotation=None, order='xyz'):
         if qn is None and qmax is None:
@@ -557,39 +598,75 @@ class Detector:
     #def generate_rpix_3d(self, qmax, qn, wavelength):
     #    return condor.utils.scattering_vector.generate_rpix_3d(qn, qmax, wavelength, self.distance, self.pixel_size):
 
-    def calculate_polarization_factors(self, cx=None, cy=None, polarization="ignore"):
+    def calculate_polarization_factors(self, cx=None, cy=None, polarization="ignore", pixels=None):
         if polarization == "ignore":
-            P = numpy.ones(shape=(self._ny, self._nx))
+            P = numpy.ones(shape=(self._ny, self._nx) if pixels is None else (len(pixels),))
         else:
-            X, Y = self.generate_xypix(cx=cx, cy=cy)
+            X, Y = self.generate_xypix(cx=cx, cy=cy, pixels=pixels)
             P = condor.utils.diffraction.polarization_factor(X, Y, self.distance, polarization=polarization)
         return P
     
-    def detect_photons(self, I):
+    def detect_photons(self, I, mask_out=None):
         """
         Return measurement of intensities from an array of expectation values of intensities. This method also returns the mask of the pattern
 
+        Intensities in single precision (``numpy.float32``) are returned in single precision
+
         Args:
           :I (array): Intensity pattern represented as 2D array
+
+        Kwargs:
+          :mask_out (array): Array the mask is written into (see :meth:`get_mask`). If ``None`` a new array is allocated (default ``None``)
         """
         I_det = self._noise.get(I)
         if self._noise_filename is not None:
-            import h5py
-            with h5py.File(self._noise_filename,"r") as f:
-                ds = f[self._noise_dataset]
-                if len(list(ds.shape)) == 2:
-                    bg = ds[:,:]
-                else:
-                    bg = ds[numpy.random.randint(ds.shape[0]),:,:]
-            I_det = I_det + bg
+            I_det = I_det + self._get_background()
         if self.saturation_level is not None:
             I_det = numpy.clip(I_det, -numpy.inf, self.saturation_level)
+        if I.dtype == numpy.float32:
+            # The random number generators produce double precision values
+            I_det = numpy.asarray(I_det, dtype=numpy.float32)
         if I_det.ndim == 2:
-            M_det = self.get_mask(I_det)
+            M_det = self.get_mask(I_det, out=mask_out)
         else:
             M_det = None
         return I_det, M_det
 
+    def detect_photons_stack(self, I):
+        """
+        Return measurement of a stack of intensity patterns from their expectation values and the stack of masks of the patterns (see :meth:`detect_photons`)
+
+        The noise of the entire stack is drawn at once. If backgrounds are read from a stack of backgrounds in a file the background is drawn independently for every pattern
+
+        Args:
+          :I (array): Stack of intensity patterns represented as 3D array (array shape (n, ny, nx))
+        """
+        I_det = self._noise.get(I)
+        if self._noise_filename is not None:
+            I_det = I_det + self._get_background(n=I.shape[0])
+        if self.saturation_level is not None:
+            I_det = numpy.clip(I_det, -numpy.inf, self.saturation_level)
+        if I.dtype == numpy.float32:
+            I_det = numpy.asarray(I_det, dtype=numpy.float32)
+        M_det = numpy.empty(I_det.shape, dtype=numpy.uint16)
+        M_det[...] = self._mask
+        if self.saturation_level is not None:
+            M_det[I_det >= self.saturation_level] |= PixelMask.PIXEL_IS_SATURATED
+        return I_det, M_det
+
+    def _get_background(self, n=None):
+        # Background from file, either a single pattern or a random pattern of a stack of patterns (a stack of n random patterns if n is given)
+        import h5py
+        with h5py.File(self._noise_filename,"r") as f:
+            ds = f[self._noise_dataset]
+            if len(list(ds.shape)) == 2:
+                bg = ds[:,:]
+            elif n is None:
+                bg = ds[get_random_state().randint(ds.shape[0]),:,:]
+            else:
+                bg = numpy.array([ds[i,:,:] for i in get_random_state().randint(ds.shape[0], size=n)])
+        return bg
+
     def bin_photons(self, I_det, M_det):
         """
         Return the tuple of binned diffraction pattern and mask. If binning has not been specified a tuple ``(None, None)`` is returned
@@ -34,7 +34,8 @@
 # TO DO:
 # Take into account illumination profile
 
-import numpy, os, sys, copy
+import numpy, os, sys, copy, collections
+from scipy import constants
 
 import logging
 logger = logging.getLogger(__name__)
@@ -43,12 +44,23 @@ from condor.utils.log import log,log_execution_time
 from condor.utils.log import log_and_raise_error,log_warning,log_info,log_debug
 import condor.utils.config
 from condor.utils.pixelmask import PixelMask
+import condor.utils.diffraction
 import condor.utils.sphere_diffraction
 import condor.utils.spheroid_diffraction
+import condor.utils.bead_diffraction
+import condor.utils.cylinder_diffraction
+import condor.utils.lattice_diffraction
 import condor.utils.scattering_vector
+import condor.utils.symmetry
 import condor.utils.resample
-from condor.utils.rotation import Rotation
+import condor.utils.cxiwriter
+import condor.utils.buffers
+import condor.utils.diskcache
+import condor.utils.rng
+from condor.utils.variation import Variation
+from condor.utils.rotation import Rotation, Rotations, quat_mult, rotmx_from_quat
 import condor.particle
+import condor.schedule
 
 
 def experiment_from_configfile(configfile):
@@ -80,20 +92,14 @@ def experiment_from_configdict(configdict):
     source = condor.Source(**configdict["source"])
     # Particles
     particle_keys = [k for k in configdict.keys() if k.startswith("particle")]
+    # Unit cells of crystals are referenced by their section title and are not simulated on their own
+    unit_cell_keys = [configdict[k]["unit_cell"] for k in particle_keys if k.startswith("particle_crystal") and isinstance(configdict[k].get("unit_cell"), str)]
     particles = {}
     if len(particle_keys) == 0:
         log_and_raise_error(logger, "No particles defined.")
     for k in particle_keys:
-        if k.startswith("particle_sphere"):
-            particles[k] = condor.ParticleSphere(**configdict[k])
-        elif k.startswith("particle_spheroid"):
-            particles[k] = condor.ParticleSpheroid(**configdict[k])
-        elif k.startswith("particle_map"):
-            particles[k] = condor.ParticleMap(**configdict[k])
-        elif k.startswith("particle_atoms"):
-            particles[k] = condor.ParticleAtoms(**configdict[k])
-        else:
-            log_and_raise_error(logger,"Particle model for %s is not implemented." % k)
+        if k not in unit_cell_keys:
+            particles[k] = _particle_from_configdict(k, configdict)
     # Detector
     detector = condor.Detector(**configdict["detector"])
     experiment = Experiment(source, particles, detector)
@@ -101,6 +107,31 @@ def experiment_from_configdict(configdict):
 
 
 
+def _particle_from_configdict(k, configdict):
+    if k not in configdict:
+        log_and_raise_error(logger, "Particle section %s is not defined." % k)
+    if k.startswith("particle_sphere"):
+        return condor.ParticleSphere(**configdict[k])
+    elif k.startswith("particle_spheroid"):
+        return condor.ParticleSpheroid(**configdict[k])
+    elif k.startswith("particle_map"):
+        return condor.ParticleMap(**configdict[k])
+    elif k.startswith("particle_atoms"):
+        return condor.ParticleAtoms(**configdict[k])
+    elif k.startswith("particle_beads"):
+        return condor.ParticleBeads(**configdict[k])
+    elif k.startswith("particle_radial"):
+        return condor.ParticleRadial(**configdict[k])
+    elif k.startswith("particle_cylinder"):
+        return condor.ParticleCylinder(**configdict[k])
+    elif k.startswith("particle_crystal"):
+        conf = dict(configdict[k])
+        if isinstance(conf.get("unit_cell"), str):
+            conf["unit_cell"] = _particle_from_configdict(conf["unit_cell"], configdict)
+        return condor.ParticleCrystal(**conf)
+    else:
+        log_and_raise_error(logger,"Particle model for %s is not implemented." % k)
+
 class Experiment:
     """
     Class for X-ray diffraction experiment
@@ -112,8 +143,32 @@ class Experiment:
       :particles: Dictionary of particle instances
 
       :detector: Detector instance
+
+    Kwargs:
+
+      :precision (str): Floating point precision of the simulation, either ``'double'`` (float64/complex128) or ``'single'`` (float32/complex64). In single precision scattering vectors, form factors, phase factors, Fourier transforms of maps (transformed in double precision, stored in single precision) and detected intensities are carried in single precision. Amplitudes agree with double precision to a relative error of about 1E-5 of the maximum amplitude, phase factors of particles displaced by a distance r from the origin carry an additional phase error of about 1E-7 q r (default ``'double'``)
+
+      :reuse_buffers (bool): If ``True`` the arrays of :meth:`propagate` are allocated once and reused by the following calls (see :class:`condor.utils.buffers.BufferArena`). Scattering vectors, solid angles and polarization factors are calculated only once for a fixed geometry. The output arrays ``data_fourier``, ``data`` (if no noise is added) and ``mask`` of a call are overwritten by the next call, copy them if they shall be kept (default ``False``)
+
+      :cache_amplitudes (bool): If ``True`` the scattering amplitudes of the particles of a shot of :meth:`propagate` are kept for unit primary wave amplitude and without the phase factors of their positions. If in the next shot a particle differs only by its position or by the intensity that illuminates it (for example because only the pulse energy varies) its amplitudes are not calculated again but obtained by scaling and shifting the kept amplitudes. Amplitudes are kept only for the particles of the last shot. The output of :meth:`propagate` contains the numbers of calculated and reused amplitudes under ``"statistics"`` (default ``False``)
+
+      :pattern_memo_size (int): Maximum number of noise-free patterns (amplitudes and intensities on the detector) of :meth:`propagate` that are kept. If a shot repeats the parameters of a kept pattern (same source, particle and detector parameters, as for example on a grid of parameters of variation mode ``'range'`` that is traversed more than once) the amplitudes are not calculated again and only noise and saturation of the detector are applied to the kept pattern. Patterns that were not used for the longest time are discarded first. The particle models must not be changed while patterns are kept. The output of :meth:`propagate` tells under ``"statistics"`` whether the pattern was reused. ``0`` disables keeping patterns (default ``0``)
+
+      :cache_directory (str): If not ``None`` the noise-free amplitudes on the detector of the shots of :meth:`propagate` are stored in this directory (see :class:`condor.utils.diskcache.DiskCache`). Entries are addressed by a digest of the configuration of the experiment (see :meth:`get_conf`, including the arrays of map particles), the precision and the parameters of the shot. A repeated run of the same configuration with the same parameters of the shots (for example drawn from the same :class:`condor.schedule.ParameterSchedule` or from the same random seed) loads the amplitudes instead of calculating them, only noise and saturation of the detector are applied again. The configuration is digested at the first shot, the particle models must not be changed afterwards. The output of :meth:`propagate` tells under ``"statistics"`` whether the pattern was loaded (default ``None``)
+
+      :cache_max_size (int): Maximum size of the cache directory in bytes, the entries that were not used for the longest time are removed first (default ``1E9``)
+
+      :seed (int): If not ``None`` every shot draws its random numbers (parameter variations, random rotations, numbers of particles, noise) from a random state that depends only on the seed and the index of the shot (see :func:`condor.utils.rng.get_shot_random_state`), and the counters of variations of mode ``'range'``, of lists of rotations and of the schedule (see :meth:`set_schedule`) are set to the index of the shot. A shot can therefore be simulated without simulating the preceding shots by passing its index to :meth:`propagate`, shots can be distributed to several processes in any order, and a run can be resumed after the last shot that was written to file (see :class:`condor.utils.cxiwriter.CXIWriter`). The index of the shot is part of the output under ``"shot"``. Random states are kept per thread, shots can therefore also be simulated in parallel threads if every thread uses its own experiment with its own source, particle and detector instances (their counters are set at every shot). If ``None`` random numbers are drawn from the global random state of :mod:`numpy.random` (default ``None``)
+
+      :hit_rate (float): If not ``None`` every shot of :meth:`propagate` and :meth:`propagate_batch` is a hit with the probability ``hit_rate`` and otherwise a miss. The particles of a hit are drawn as usual (at least one particle), a miss has no particles and its frame is obtained by applying noise and background of the detector to an empty pattern without any calculation of amplitudes. The output tells under ``"hit"`` whether the shot is a hit. If ``None`` every shot is a hit (default ``None``)
     """
-    def __init__(self, source, particles, detector):
+    def __init__(self, source, particles, detector, precision="double", reuse_buffers=False, cache_amplitudes=False, pattern_memo_size=0, cache_directory=None, cache_max_size=1E9, seed=None, hit_rate=None):
+        if precision not in ["double", "single"]:
+            log_and_raise_error(logger, "precision=\"%s\" is invalid. Choose either \"double\" or \"single\"." % precision)
+            return
+        self.precision = precision
+        self._float_dtype   = numpy.dtype(numpy.float64 if precision == "double" else numpy.float32)
+        self._complex_dtype = numpy.dtype(numpy.complex128 if precision == "double" else numpy.complex64)
         self.source    = source
         for n,p in particles.items():
             if n.startswith("particle_sphere"):
@@ -128,11 +183,40 @@ class Experiment:
             elif n.startswith("particle_atoms"):
                 if not isinstance(p, condor.particle.ParticleAtoms):
                     log_and_raise_error(logger, "Particle %s is not a condor.particle.ParticleAtoms instance." % n)
+            elif n.startswith("particle_beads"):
+                if not isinstance(p, condor.particle.ParticleBeads):
+                    log_and_raise_error(logger, "Particle %s is not a condor.particle.ParticleBeads instance." % n)
+            elif n.startswith("particle_radial"):
+                if not isinstance(p, condor.particle.ParticleRadial):
+                    log_and_raise_error(logger, "Particle %s is not a condor.particle.ParticleRadial instance." % n)
+            elif n.startswith("particle_cylinder"):
+                if not isinstance(p, condor.particle.ParticleCylinder):
+                    log_and_raise_error(logger, "Particle %s is not a condor.particle.ParticleCylinder instance." % n)
+            elif n.startswith("particle_crystal"):
+                if not isinstance(p, condor.particle.ParticleCrystal):
+                    log_and_raise_error(logger, "Particle %s is not a condor.particle.ParticleCrystal instance." % n)
             else:
-                log_and_raise_error(logger, "The particle model name %s is invalid. The name has to start with either particle_sphere, particle_spheroid, particle_map or particle_atoms.")
+                log_and_raise_error(logger, "The particle model name %s is invalid. The name has to start with either particle_sphere, particle_spheroid, particle_map, particle_atoms, particle_beads, particle_radial, particle_cylinder or particle_crystal." % n)
         self.particles = particles
         self.detector  = detector
+        if hit_rate is not None and (hit_rate < 0. or hit_rate > 1.):
+            log_and_raise_error(logger, "hit_rate=%f is invalid. It has to be within 0 and 1." % hit_rate)
+            return
+        self.hit_rate  = hit_rate
         self._qmap_cache = {}
+        self._buffers = condor.utils.buffers.BufferArena() if reuse_buffers else None
+        self._amplitude_cache = {} if cache_amplitudes else None
+        self._amplitude_statistics = None
+        self._amplitudes_used = None
+        self._pattern_memo_size = int(pattern_memo_size)
+        self._pattern_memo = collections.OrderedDict() if self._pattern_memo_size > 0 else None
+        self._disk_cache = condor.utils.diskcache.DiskCache(cache_directory, max_size=cache_max_size) if cache_directory is not None else None
+        self._conf_digest = None
+        self._seed = seed
+        self._next_shot = 0
+        self._schedule = None
+        self._n_qmap_cache_hits   = 0
+        self._n_qmap_cache_misses = 0
 
     def get_conf(self):
         """
@@ -150,6 +234,58 @@ class Experiment:
         conf.update(self.detector.get_conf())
         return conf
 
+    def set_schedule(self, schedule):
+        """
+        Replay the shot parameters of a schedule that were drawn in advance. The following calls of :meth:`propagate` (and the other methods that iterate the shot parameters) take the parameters of the next shot of the schedule instead of drawing them
+
+        Args:
+          :schedule: Instance of :class:`condor.schedule.ParameterSchedule`. Set to ``None`` for drawing the parameters again at every shot
+        """
+        if schedule is not None:
+            for name in schedule.get_particle_names():
+                if name not in self.particles:
+                    log_and_raise_error(logger, "The particle model %s of the schedule is not part of this experiment." % name)
+                    return
+        self._schedule = schedule
+
+    def _begin_shot(self, shot=None):
+        """
+        Return the index and the random state of the next shot (see seed) and set the counters of the variations, rotations and the schedule to the index of the shot. If the experiment has no seed ``(None, None)`` is returned
+        """
+        if self._seed is None:
+            if shot is not None:
+                log_and_raise_error(logger, "Shots can only be selected by their index if the experiment has a seed.")
+            return None, None
+        if shot is None:
+            shot = self._next_shot
+        self._next_shot = shot + 1
+        for obj in [self.source, self.detector] + self.particles.values():
+            _set_counters(obj, shot)
+        if self._schedule is not None:
+            self._schedule.set_counter(shot)
+        return shot, condor.utils.rng.get_shot_random_state(self._seed, shot)
+
+    def _get_next_parameters(self, allow_miss=False):
+        """
+        Return the parameters of the next shot. If ``allow_miss`` is ``True`` the shot can be a miss (see hit_rate) with an empty dictionary of particles
+        """
+        if self._schedule is None:
+            D_source = self.source.get_next()
+            if allow_miss and self.hit_rate is not None and condor.utils.rng.get_random_state().rand() >= self.hit_rate:
+                log_debug(logger, "Miss - the pulse hits no particle")
+                D_particles = {}
+            else:
+                D_particles = self._get_next_particles()
+            return D_source, D_particles, self.detector.get_next()
+        v_source, v_particles, v_detector = self._schedule.get_next_values()
+        if len(v_particles) == 0 and not allow_miss:
+            log_and_raise_error(logger, "The shot of the schedule is a miss, which can not be simulated here.")
+            return
+        D_particles = {}
+        for i,(name, values) in enumerate(v_particles):
+            D_particles["particle_%02i" % i] = self.particles[name].get_next(values)
+        return self.source.get_next(v_source), D_particles, self.detector.get_next(v_detector)
+
     def _get_next_particles(self):
         D_particles = {}
         while len(D_particles) == 0:
@@ -167,13 +303,392 @@ class Experiment:
         return D_particles
 
     @log_execution_time(logger)
-    def propagate(self, save_map3d=False, save_qmap=False):
-        return self._propagate(save_map3d=save_map3d, save_qmap=save_qmap, ndim=2)
+    def propagate(self, save_map3d=False, save_qmap=False, tile_rows=None, shot=None):
+        """
+        Simulate the diffraction pattern of the next shot on the detector and return the output as a dictionary
+
+        Kwargs:
+          :save_map3d (bool): If ``True`` the refractive index maps of the particles are part of the output (default ``False``)
+
+          :save_qmap (bool): If ``True`` the scattering vectors of the particles are part of the output (default ``False``)
+
+          :tile_rows (int): If not ``None`` the detector is simulated in blocks of ``tile_rows`` rows, peak memory is then set by the size of the blocks (default ``None``)
+
+          :shot (int): Index of the shot, only if the experiment has a seed (see :class:`Experiment`). If ``None`` the shot that follows the previous shot (default ``None``)
+        """
+        shot, random_state = self._begin_shot(shot)
+        with condor.utils.rng.using_random_state(random_state):
+            O = self._propagate(save_map3d=save_map3d, save_qmap=save_qmap, ndim=2, tile_rows=tile_rows)
+        if shot is not None:
+            O["shot"] = shot
+        return O
+
+    def propagate_schedule(self, schedule, reorder=True, save_map3d=False, save_qmap=False, tile_rows=None):
+        """
+        Simulate all shots of a schedule by :meth:`propagate` and return the list of outputs in the order of the shots of the schedule and the cache hit rates of the run
+
+        If ``reorder`` is ``True`` the shots are simulated in the order that makes the most use of the caches: Shots are grouped by the parameters of the voxel maps of :class:`condor.particle.ParticleMap` instances (diameter), within those groups by the beam center position (scattering vectors, solid angles and polarization factors of the detector) and then by the orientations of the particles (rotated scattering vectors). The hit rates are returned as a dictionary with the keys of :meth:`get_cache_statistics` and the fraction of the lookups of the run that were served from the cache as values (``None`` if there were no lookups)
+
+        Args:
+          :schedule: Instance of :class:`condor.schedule.ParameterSchedule`
+
+        Kwargs:
+          :reorder (bool): Whether the shots shall be simulated in a cache friendly order (default ``True``)
 
-    def propagate3d(self, qn=None, qmax=None):
-        return self._propagate(ndim=3, qn=qn, qmax=qmax)
+          :save_map3d (bool): See :meth:`propagate` (default ``False``)
+
+          :save_qmap (bool): See :meth:`propagate` (default ``False``)
+
+          :tile_rows (int): See :meth:`propagate` (default ``None``)
+        """
+        n = schedule.get_number_of_shots()
+        if reorder:
+            order = sorted(range(n), key=lambda i: self._get_cache_key(*schedule.get_values(i)))
+        else:
+            order = range(n)
+        statistics = self.get_cache_statistics()
+        previous = self._schedule
+        if self._seed is None:
+            self.set_schedule(schedule.take(order))
+        else:
+            # Shots are selected by their index in the schedule and draw the same random numbers in any order
+            self.set_schedule(schedule)
+        outputs = [None] * n
+        try:
+            for i in order:
+                O = self.propagate(save_map3d=save_map3d, save_qmap=save_qmap, tile_rows=tile_rows, shot=None if self._seed is None else i)
+                # Reused buffers are overwritten by the next shot
+                outputs[i] = O if self._buffers is None else copy.deepcopy(O)
+        finally:
+            self._schedule = previous
+        if self._seed is not None:
+            self._next_shot = n
+        hit_rates = {}
+        for name, (hits, lookups) in self.get_cache_statistics().items():
+            hits    -= statistics[name][0]
+            lookups -= statistics[name][1]
+            hit_rates[name] = float(hits) / lookups if lookups > 0 else None
+            if lookups > 0:
+                log_info(logger, "Cache %s: %i of %i lookups served from the cache (hit rate %.1f%%)" % (name, hits, lookups, 100. * hits / lookups))
+        return outputs, hit_rates
+
+    def _get_cache_key(self, v_source, v_particles, v_detector):
+        maps = sorted([(name, values["diameter"]) for name, values in v_particles if isinstance(self.particles[name], condor.particle.ParticleMap)])
+        center = (v_detector["cx"], v_detector["cy"])
+        orientations = [tuple(values["extrinsic_quaternion"]) for name, values in v_particles]
+        return (maps, center, orientations)
+
+    def get_cache_statistics(self):
+        """
+        Return the numbers of cache hits and cache lookups since the initialisation of the experiment as a dictionary of tuples (hits, lookups) with the keys:
+
+          - ``'geometry'`` - Scattering vectors, solid angles and polarization factors of the detector (cached only if ``reuse_buffers=True``)
+
+          - ``'qmap'`` - Rotated scattering vectors (see :meth:`get_qmap`)
+
+          - ``'map'`` - Voxel maps of :class:`condor.particle.ParticleMap` instances
+        """
+        S = {}
+        if self._buffers is None:
+            S["geometry"] = (0, 0)
+        else:
+            S["geometry"] = (self._buffers.n_cache_hits, self._buffers.n_cache_hits + self._buffers.n_cache_misses)
+        S["qmap"] = (self._n_qmap_cache_hits, self._n_qmap_cache_hits + self._n_qmap_cache_misses)
+        maps = [p for p in self.particles.values() if isinstance(p, condor.particle.ParticleMap)]
+        S["map"] = (sum([p.n_cache_hits for p in maps]), sum([p.n_cache_hits + p.n_cache_misses for p in maps]))
+        return S
+
+    @log_execution_time(logger)
+    def propagate_batch(self, n):
+        """
+        Simulate n shots at once and return the results as stacked arrays (only for particles of the models :class:`condor.particle.ParticleSphere` and :class:`condor.particle.ParticleSpheroid`)
+
+        The parameters of all shots are drawn at once as arrays (see :func:`condor.schedule.schedule_from_experiment`) or taken from the schedule (see :meth:`set_schedule`). If the experiment has a seed the parameters and the noise of every shot are drawn from the random state of the shot as by :meth:`propagate`, only the calculation of the patterns is vectorised. Form factors, phase factors, intensities and noise of all shots are calculated as arrays of shape (n, ny, nx), the amplitudes of the spheroids are evaluated with a stack of their rotation matrices (see :func:`condor.utils.spheroid_diffraction.F_ellipsoids_diffraction`). Without noise the patterns are identical to those of n calls of :meth:`propagate` with the same parameters (up to rounding). Amplitudes of all particles are held in memory at once, memory grows with the number of particles times the number of pixels
+
+        The output has the structure of the output of :meth:`propagate` with stacks of patterns under ``"entry_1"``. The parameters are returned as dictionaries of arrays: under ``"source"`` and ``"detector"`` the varying parameters of the shots (arrays of length n), under ``"particles"`` the parameters of all particles of all shots ordered by shot, with the index of the pattern under ``"frame"`` and the key of the particle model under ``"name"`` (arrays of the length of the total number of particles, parameters that do not apply to a particle model are ``NaN``)
+
+        Args:
+          :n (int): Number of shots
+        """
+        for name, p in self.particles.items():
+            if not (isinstance(p, condor.particle.ParticleSphere) or isinstance(p, condor.particle.ParticleSpheroid)):
+                log_and_raise_error(logger, "propagate_batch supports only spheres and spheroids, particle %s is of another model." % name)
+                return
+        schedule, shot_states = self._get_batch_schedule(n)
+        shots     = schedule.shots
+        particles = schedule.particles
+        wavelength = self.source.photon.get_wavelength()
+
+        nx = self.detector.get_mask().shape[1]
+        ny = self.detector.get_mask().shape[0]
+        missing = (self.detector.get_mask() & PixelMask.PIXEL_IS_MISSING) != 0
+        # Misses keep empty patterns
+        F_tot = numpy.zeros(shape=(n, ny, nx), dtype=self._complex_dtype)
+        hits = numpy.flatnonzero(shots["number_of_particles"] > 0)
+        # Shots with the same beam position on the detector share scattering vectors, solid angles and polarization factors
+        centers, geometry = numpy.unique(shots["detector"]["cx"][hits] + 1.j*shots["detector"]["cy"][hits], return_inverse=True)
+        # Intensities and primary amplitudes of all particles
+        intensity = self.source.get_intensity(particles["position"].T, "ph/m2", pulse_energy=shots["source"]["pulse_energy"][particles["shot"]])
+        F0 = numpy.sqrt(intensity)*2*numpy.pi/wavelength**2
+        for g, center in enumerate(centers):
+            cx, cy = center.real, center.imag
+            frames = hits[geometry == g]
+            selected = numpy.in1d(particles["shot"], frames)
+            qmap0 = self.detector.generate_qmap(wavelength, cx=cx, cy=cy, extrinsic_rotation=None, dtype=self._float_dtype)
+            if self.detector.solid_angle_correction:
+                Omega_p = self.detector.get_all_pixel_solid_angles(cx, cy)
+            else:
+                Omega_p = self.detector.pixel_size**2 / self.detector.distance**2
+            sqrt_Omega_p = numpy.sqrt(numpy.asarray(Omega_p, dtype=self._float_dtype))
+            sqrt_P = numpy.sqrt(self.detector.calculate_polarization_factors(cx=cx, cy=cy, polarization=self.source.polarization).astype(self._float_dtype, copy=False))
+            F = self._get_batch_amplitudes(particles[selected], F0[selected], qmap0, wavelength)
+            F *= sqrt_Omega_p
+            # Phase factors of particles that are not at the origin
+            v = particles["position"][selected]
+            shifted = ~(abs(v) <= 1E-12).all(axis=1)
+            if shifted.any():
+                # Phases of all shifted particles by a single matrix product
+                phase = v[shifted].astype(self._float_dtype).dot(qmap0.reshape((ny*nx, 3)).T).reshape((shifted.sum(), ny, nx))
+                ramp = numpy.empty(phase.shape, dtype=self._complex_dtype)
+                ramp.real = numpy.cos(phase)
+                ramp.imag = -numpy.sin(phase)
+                F = F.astype(self._complex_dtype)
+                F[shifted] *= ramp
+            # Superposition of the amplitudes of the particles of each shot (particles are ordered by shot and every shot has at least one particle)
+            if len(F) > len(frames):
+                F = numpy.add.reduceat(F, numpy.searchsorted(particles["shot"][selected], frames), axis=0)
+            F_tot[frames] = sqrt_P * F
+        F_tot[:, missing] = 0.
+
+        # Photon detection
+        I_tot = F_tot.real**2
+        I_tot += F_tot.imag**2
+        if self._seed is None:
+            I_tot, M_tot = self.detector.detect_photons_stack(I_tot)
+        else:
+            # The noise of every shot continues the random numbers of its shot, as in propagate
+            detected = []
+            for i, (shot, random_state) in enumerate(shot_states):
+                with condor.utils.rng.using_random_state(random_state):
+                    detected.append(self.detector.detect_photons_stack(I_tot[i:i+1]))
+            I_tot = numpy.concatenate([I for I, M in detected])
+            M_tot = numpy.concatenate([M for I, M in detected])
+
+        O = {}
+        O["source"]    = dict([(k, shots["source"][k]) for k in shots["source"].dtype.names])
+        O["particles"] = dict([(k, particles[k]) for k in particles.dtype.names if k != "shot"])
+        O["particles"]["frame"] = particles["shot"]
+        O["detector"]  = dict([(k, shots["detector"][k]) for k in shots["detector"].dtype.names])
+        O["entry_1"] = {}
+        data_1 = {}
+        data_1["data_fourier"] = F_tot
+        data_1["data"]         = I_tot
+        data_1["mask"]         = M_tot
+        data_1["full_period_resolution"] = numpy.repeat(2 * self.detector.get_max_resolution(wavelength), n)
+        O["entry_1"]["data_1"] = data_1
+        if self.detector.binning is not None:
+            binned = [self.detector.bin_photons(I_tot[i], M_tot[i]) for i in range(n)]
+            data_2 = {}
+            data_2["data_fourier"] = numpy.array([condor.utils.resample.downsample(F_tot[i], self.detector.binning, mode="integrate", mask2d0=M_tot[i],
+                                                                                   bad_bits=PixelMask.PIXEL_IS_IN_MASK, min_N_pixels=1)[0] for i in range(n)])
+            data_2["data"]         = numpy.array([IXxX for IXxX, MXxX in binned])
+            data_2["mask"]         = numpy.array([MXxX for IXxX, MXxX in binned])
+            O["entry_1"]["data_2"] = data_2
+        if self._seed is not None:
+            O["shot"] = numpy.array([shot for shot, random_state in shot_states])
+        if self.hit_rate is not None:
+            O["hit"] = (shots["number_of_particles"] > 0).astype(numpy.int64)
+        return O
+
+    def _get_batch_schedule(self, n):
+        """
+        Return the parameters of the next n shots as an instance of :class:`condor.schedule.ParameterSchedule` and the list of the indices and random states of the shots (see :meth:`_begin_shot`)
+        """
+        shot_states = [(None, None)] * n
+        if self._seed is None:
+            if self._schedule is None:
+                schedule = condor.schedule.schedule_from_experiment(self, n)
+            else:
+                schedule = self._schedule.get_next_batch(n)
+            return schedule, shot_states
+        names = dict([(p, name) for name, p in self.particles.items()])
+        values = []
+        for i in range(n):
+            shot, random_state = self._begin_shot()
+            shot_states[i] = (shot, random_state)
+            if self._schedule is not None:
+                values.append(self._schedule.get_next_values())
+                continue
+            # Random states of different shots are independent, the parameters are therefore drawn shot by shot
+            with condor.utils.rng.using_random_state(random_state):
+                D_source, D_particles, D_detector = self._get_next_parameters(allow_miss=True)
+            v_particles = []
+            for k in sorted(D_particles.keys()):
+                D_particle = D_particles[k]
+                v_particle = dict([(key, D_particle[key]) for key in ["extrinsic_quaternion", "position", "diameter", "flattening"] if key in D_particle])
+                v_particles.append((names[D_particle["_class_instance"]], v_particle))
+            values.append(({"pulse_energy": D_source["pulse_energy"]}, v_particles, {"cx": D_detector["cx"], "cy": D_detector["cy"]}))
+        return condor.schedule.schedule_from_values(values), shot_states
+
+    def _get_batch_amplitudes(self, particles, F0, qmap0, wavelength):
+        """
+        Return the scattering amplitudes of spheres and spheroids given as particle records of a schedule with their primary amplitudes ``F0`` (without solid angles and phase factors) for the scattering vectors ``qmap0`` of the entire detector (array shape (len(particles), ny, nx))
+        """
+        F = numpy.empty(shape=(len(particles),) + qmap0.shape[:-1], dtype=self._float_dtype)
+        q = None
+        for name in set(particles["name"]):
+            p = self.particles[name]
+            j = numpy.flatnonzero(particles["name"] == name)
+            dn = p.get_dn(wavelength)
+            diameter = particles["diameter"][j]
+            R = diameter/2.
+            V = 4/3.*numpy.pi*R**3
+            if isinstance(p, condor.particle.ParticleSphere):
+                # All spheres are evaluated at once by broadcasting their parameters along the first axis
+                if q is None:
+                    q = numpy.sqrt((qmap0**2).sum(axis=-1))
+                K = (F0[j]*V*dn)**2
+                F[j] = condor.utils.sphere_diffraction.F_sphere_diffraction(K[:,numpy.newaxis,numpy.newaxis], q, R[:,numpy.newaxis,numpy.newaxis])
+            else:
+                K = (F0[j]*V*abs(dn))**2
+                flattening = particles["flattening"][j]
+                a = condor.utils.spheroid_diffraction.to_spheroid_semi_diameter_a(diameter, flattening)
+                c = condor.utils.spheroid_diffraction.to_spheroid_semi_diameter_c(diameter, flattening)
+                rotation_matrices = rotmx_from_quat(particles["extrinsic_quaternion"][j].T).transpose((2,0,1))
+                F[j] = condor.utils.spheroid_diffraction.F_ellipsoids_diffraction(K, qmap0, a, c, a, rotation_matrices=rotation_matrices, dtype=self._float_dtype)
+        return F
+
+    def propagate3d(self, qn=None, qmax=None, n_threads=1, use_symmetry=False, symmetry_check=0, use_friedel_symmetry=None, shot=None):
+        """
+        Simulate the 3D Fourier volume of the next shot on a Cartesian grid of scattering vectors and return the output as a dictionary (see :meth:`propagate`)
+
+        Kwargs:
+          :qn (int): Number of samples along each dimension of the volume. If ``None`` the larger detector dimension in pixels (default ``None``)
+
+          :qmax (float): Maximum scattering vector component in unit inverse meter. If ``None`` the scattering vector at the detector corner (default ``None``)
+
+          :n_threads (int): Number of threads that evaluate slabs of the volume in parallel (default ``1``)
+
+          :use_symmetry (bool): If ``True`` the amplitudes of particles with a known point group (spheroids, cylinders and maps of the geometries ``'icosahedron'``, ``'cube'``, ``'sphere'`` and ``'spheroid'``) are evaluated only on the asymmetric unit of the grid and filled in by the symmetry operations of the rotated particle that map the grid onto itself. Only signed permutations of the axes map the grid onto itself, an icosahedral particle therefore contributes at most 24 of its 120 operations (fewer if it is rotated). Voxel maps are limited to the operations of their own Cartesian grid (default ``False``)
+
+          :symmetry_check (int): Number of randomly chosen grid points at which the amplitudes obtained by symmetry are compared to direct evaluation, a warning is logged if they deviate (default ``0``)
+
+          :use_friedel_symmetry (bool): If ``True`` the Fourier transforms of refractive index maps are assumed to obey Friedel's law and only half of the grid is evaluated, if ``False`` Friedel's law is never exploited. If ``None`` Friedel's law is exploited for maps whose imaginary part (absorption) is at most 1E-6 times the maximum of their real part (default ``None``)
+
+          :shot (int): See :meth:`propagate` (default ``None``)
+        """
+        shot, random_state = self._begin_shot(shot)
+        with condor.utils.rng.using_random_state(random_state):
+            O = self._propagate(ndim=3, qn=qn, qmax=qmax, n_threads=n_threads, use_symmetry=use_symmetry, symmetry_check=symmetry_check, use_friedel_symmetry=use_friedel_symmetry)
+        if shot is not None:
+            O["shot"] = shot
+        return O
+
+    @log_execution_time(logger)
+    def evaluate_at_q(self, q_points, shot=None):
+        """
+        Return the scattering amplitudes of all particles of a newly drawn configuration at arbitrary scattering vectors
+
+        The amplitudes are scaled to the solid angle of a detector pixel on the beam axis (*pixel_size*:sup:`2` / *distance*:sup:`2`) and are not corrected for polarization. The output has the structure of the output of :meth:`propagate` with the amplitudes stored in ``["entry_1"]["data_1"]["data_fourier"]`` (array shape (N,))
+
+        Args:
+          :q_points (array): Scattering vectors [*qx*, *qy*, *qz*] in unit inverse meter. Array shape: (N, 3)
+
+        Kwargs:
+          :shot (int): See :meth:`propagate` (default ``None``)
+        """
+        q_points = numpy.asarray(q_points, dtype=self._float_dtype)
+        if q_points.ndim != 2 or q_points.shape[1] != 3:
+            log_and_raise_error(logger, "q_points has to be an array of shape (N, 3).")
+            return
+
+        # Iterate objects
+        shot, random_state = self._begin_shot(shot)
+        with condor.utils.rng.using_random_state(random_state):
+            D_source, D_particles, D_detector = self._get_next_parameters()
+
+        for D_particle in D_particles.values():
+            if _uses_spsim(D_particle):
+                log_and_raise_error(logger, "Atoms that are simulated with spsim can not be evaluated at arbitrary scattering vectors. Set as_map=True for the atoms and try again.")
+                return
+
+        F_tot, qmap_singles = self._get_amplitudes(D_source, D_particles, D_detector, q_points, ndim=2)
+
+        O = {}
+        O["source"]            = D_source
+        O["particles"]         = D_particles
+        O["detector"]          = D_detector
+        O["entry_1"] = {"data_1": {"data_fourier": F_tot}}
+        if shot is not None:
+            O["shot"] = shot
+        O = remove_from_dict(O, "_")
+        return O
+
+    @log_execution_time(logger)
+    def propagate3d_to_file(self, filename, qn=None, qmax=None, slab_size=4194304, gzip_compression=False, n_threads=1, shot=None):
+        """
+        Simulate a 3D Fourier volume slab by slab and write it directly to a CXI file
+
+        The volume is computed in slabs along the first (*z*) dimension and the datasets ``/entry_1/data_1/data_fourier`` and ``/entry_1/data_1/data`` are written to chunked HDF5 datasets (one chunk per slab), so that memory is bounded by the slab size and not by the volume. All other outputs of :meth:`propagate3d` are written as well and returned.
+
+        Args:
+          :filename (str): Name of the output CXI file
+
+        Kwargs:
+          :qn (int): Number of samples along each dimension of the volume. If ``None`` the larger detector dimension in pixels (default ``None``)
+
+          :qmax (float): Maximum scattering vector component in unit inverse meter. If ``None`` the scattering vector at the detector corner (default ``None``)
+
+          :slab_size (int): Maximum number of voxels that are computed at once (default ``4194304``)
+
+          :gzip_compression (bool): If ``True`` the datasets are compressed with gzip (default ``False``)
+
+          :n_threads (int): Number of threads that evaluate sub-slabs of each slab in parallel (default ``1``)
+
+          :shot (int): See :meth:`propagate` (default ``None``)
+        """
+        log_debug(logger, "Start propagation to file %s" % filename)
+
+        # Iterate objects
+        shot, random_state = self._begin_shot(shot)
+        with condor.utils.rng.using_random_state(random_state):
+            D_source, D_particles, D_detector = self._get_next_parameters()
+
+        for D_particle in D_particles.values():
+            if _uses_spsim(D_particle):
+                log_and_raise_error(logger, "Atoms that are simulated with spsim can not be propagated slab by slab. Set as_map=True for the atoms and try again.")
+                return
+
+        qgrid = self._get_qgrid_3d(D_source, D_detector, qn=qn, qmax=qmax, n_threads=n_threads)
+        shape = (qgrid.qn, qgrid.qn, qgrid.qn)
+        W = condor.utils.cxiwriter.CXIWriter(filename, chunksize=1, gzip_compression=gzip_compression)
+        n_z = max([1, slab_size/(qgrid.qn*qgrid.qn)])
+        for z0 in range(0, qgrid.qn, n_z):
+            z1 = min([z0+n_z, qgrid.qn])
+            log_debug(logger, "Propagating slab %i:%i" % (z0, z1))
+            F_slab, qmap_singles = self._get_amplitudes(D_source, D_particles, D_detector, qgrid.get_subgrid(z0, z1), ndim=3, qn=qgrid.qn, qmax=qgrid.qmax)
+            # Photon detection
+            with condor.utils.rng.using_random_state(random_state):
+                I_slab, M_slab = self.detector.detect_photons(abs(F_slab)**2)
+            W.write_slab("/entry_1/data_1/data_fourier", F_slab, z0, shape)
+            W.write_slab("/entry_1/data_1/data", I_slab, z0, shape)
+
+        O = {}
+        O["source"]            = D_source
+        O["particles"]         = D_particles
+        O["detector"]          = D_detector
+        O["entry_1"] = {}
+        O["entry_1"]["data_1"] = {}
+        O["entry_1"]["data_1"]["full_period_resolution"] = 2 * self.detector.get_max_resolution(D_source["wavelength"])
+        if shot is not None:
+            O["shot"] = shot
+        O = remove_from_dict(O, "_")
+
+        W.write(O)
+        W.close()
+        return O
     
-    def _propagate(self, save_map3d=False, save_qmap=False, ndim=2, qn=None, qmax=None):
+    def _propagate(self, save_map3d=False, save_qmap=False, ndim=2, qn=None, qmax=None, n_threads=1, use_symmetry=False, symmetry_check=0, use_friedel_symmetry=None, tile_rows=None):
 
         if ndim not in [2,3]:
             log_and_raise_error(logger, "ndim = %i is an invalid input. Has to be either 2 or 3." % ndim)
@@ -181,9 +696,10 @@ class Experiment:
         log_debug(logger, "Start propagation")
         
         # Iterate objects
-        D_source    = self.source.get_next()
-        D_particles = self._get_next_particles()
-        D_detector  = self.detector.get_next()
+        D_source, D_particles, D_detector = self._get_next_parameters(allow_miss=(ndim == 2))
+        miss = len(D_particles) == 0
+        self._amplitude_statistics = {"amplitudes_calculated": 0, "amplitudes_reused": 0}
+        self._amplitudes_used = {}
 
         # Pull out variables
         nx                  = D_detector["nx"]
@@ -194,192 +710,66 @@ class Experiment:
         detector_distance   = D_detector["distance"]
         wavelength          = D_source["wavelength"]
 
-        # Qmap without rotation
-        if ndim == 2:
-            qmap0 = self.detector.generate_qmap(wavelength, cx=cx, cy=cy, extrinsic_rotation=None)
-        else:
-            qmax = numpy.sqrt((self.detector.get_q_max(wavelength, pos="edge")**2).sum())
-            qn = max([nx, ny])
-            qmap0 = self.detector.generate_qmap_3d(wavelength, qn=qn, qmax=qmax, extrinsic_rotation=None, order='xyz')
-            if self.detector.solid_angle_correction:
-                log_and_raise_error(logger, "Carrying out solid angle correction for a simulation of a 3D Fourier volume does not make sense. Please set solid_angle_correction=False for your Detector and try again.")
-                return
-            
-        qmap_singles = {}
-        F_tot        = 0.
-        # Calculate patterns of all single particles individually
-        for particle_key, D_particle in D_particles.items():
-            p  = D_particle["_class_instance"]
-            # Intensity at interaction point
-            pos  = D_particle["position"]
-            D_particle["intensity"] = self.source.get_intensity(pos, "ph/m2", pulse_energy=D_source["pulse_energy"])
-            I_0 = D_particle["intensity"]
-            # Calculate primary wave amplitude
-            # F0 = sqrt(I_0) 2pi/wavelength^2
-            F0 = numpy.sqrt(I_0)*2*numpy.pi/wavelength**2
-            D_particle["F0"] = F0
-            # 3D Orientation
-            extrinsic_rotation = Rotation(values=D_particle["extrinsic_quaternion"], formalism="quaternion")
-
-            if isinstance(p, condor.particle.ParticleSphere) or isinstance(p, condor.particle.ParticleSpheroid) or isinstance(p, condor.particle.ParticleMap):
-                # Solid angles
-                if self.detector.solid_angle_correction:
-                    Omega_p = self.detector.get_all_pixel_solid_angles(cx, cy)
-                else:
-                    Omega_p = pixel_size**2 / detector_distance**2
-            
-            # UNIFORM SPHERE
-            if isinstance(p, condor.particle.ParticleSphere):
-                # Refractive index
-                dn = p.get_dn(wavelength)
-                # Scattering vectors
-                if ndim == 2:
-                    qmap = self.get_qmap(nx=nx, ny=ny, cx=cx, cy=cy, pixel_size=pixel_size, detector_distance=detector_distance, wavelength=wavelength, extrinsic_rotation=None)
-                else:
-                    qmap = qmap0
-                q = numpy.sqrt((qmap**2).sum(axis=ndim))
-                # Intensity scaling factor
-                R = D_particle["diameter"]/2.
-                V = 4/3.*numpy.pi*R**3
-                K = (F0*V*dn)**2
-                # Pattern
-                F = condor.utils.sphere_diffraction.F_sphere_diffraction(K, q, R) * numpy.sqrt(Omega_p)
-
-            # UNIFORM SPHEROID
-            elif isinstance(p, condor.particle.ParticleSpheroid):
-                if ndim == 3:
-                    log_and_raise_error(logger, "Spheroid simulation with ndim = 3 is not supported.")
-                    return
-                
-                # Refractive index
-                dn = p.get_dn(wavelength)
-                # Scattering vectors
-                qmap = self.get_qmap(nx=nx, ny=ny, cx=cx, cy=cy, pixel_size=pixel_size, detector_distance=detector_distance, wavelength=wavelength, extrinsic_rotation=None, order="xyz")
-                qx = qmap[:,:,0]
-                qy = qmap[:,:,1]
-                # Intensity scaling factor
-                R = D_particle["diameter"]/2.
-                V = 4/3.*numpy.pi*R**3
-                K = (F0*V*abs(dn))**2
-                # Geometrical factors
-                a = condor.utils.spheroid_diffraction.to_spheroid_semi_diameter_a(D_particle["diameter"], D_particle["flattening"])
-                c = condor.utils.spheroid_diffraction.to_spheroid_semi_diameter_c(D_particle["diameter"], D_particle["flattening"])
-                # Pattern
-                # Spheroid axis before rotation
-                v0 = numpy.array([0.,1.,0.])
-                v1 = extrinsic_rotation.rotate_vector(v0)
-                theta = numpy.arcsin(v1[2])
-                phi   = numpy.arctan2(-v1[0],v1[1])
-                F = condor.utils.spheroid_diffraction.F_spheroid_diffraction(K, qx, qy, a, c, theta, phi) * numpy.sqrt(Omega_p)
-
-            # MAP
-            elif isinstance(p, condor.particle.ParticleMap):
-                # Resolution
-                dx_required  = self.detector.get_resolution_element_r(wavelength, cx=cx, cy=cy, center_variation=False)
-                dx_suggested = self.detector.get_resolution_element_r(wavelength, center_variation=True)
-                # Scattering vectors (the nfft requires order z,y,x)
-                if ndim == 2:
-                    qmap = self.get_qmap(nx=nx, ny=ny, cx=cx, cy=cy, pixel_size=pixel_size, detector_distance=detector_distance, wavelength=wavelength, extrinsic_rotation=extrinsic_rotation, order="zyx")
-                else:
-                    qmap = self.detector.generate_qmap_3d(wavelength=wavelength, qn=qn, qmax=qmax, extrinsic_rotation=extrinsic_rotation, order="zyx")
-                # Generate map
-                map3d_dn, dx = p.get_new_dn_map(D_particle, dx_required, dx_suggested, wavelength)
-                log_debug(logger, "Sampling of map: dx_required = %e m, dx_suggested = %e m, dx = %e m" % (dx_required, dx_suggested, dx))
-                if save_map3d:
-                    D_particle["map3d_dn"] = map3d_dn
-                    D_particle["dx"] = dx
-                # Rescale and shape qmap for nfft
-                qmap_scaled = dx * qmap / (2. * numpy.pi)
-                qmap_shaped = qmap_scaled.reshape(qmap_scaled.size/3, 3)
-                # Check inputs
-                invalid_mask = ~((qmap_shaped>=-0.5) * (qmap_shaped<0.5))
-                if numpy.any(invalid_mask):
-                    qmap_shaped[invalid_mask] = 0.
-                    log_warning(logger, "%i invalid pixel positions." % invalid_mask.sum())
-                log_debug(logger, "Map3d input shape: (%i,%i,%i), number of dimensions: %i, sum %f" % (map3d_dn.shape[0], map3d_dn.shape[1], map3d_dn.shape[2], len(list(map3d_dn.shape)), abs(map3d_dn).sum()))
-                if (numpy.isfinite(abs(map3d_dn))==False).sum() > 0:
-                    log_warning(logger, "There are infinite values in the dn map of the object.")
-                log_debug(logger, "Scattering vectors shape: (%i,%i); Number of dimensions: %i" % (qmap_shaped.shape[0], qmap_shaped.shape[1], len(list(qmap_shaped.shape))))
-                if (numpy.isfinite(qmap_shaped)==False).sum() > 0:
-                    log_warning(logger, "There are infinite values in the scattering vectors.")
-                # NFFT
-                fourier_pattern = log_execution_time(logger)(condor.utils.nfft.nfft)(map3d_dn, qmap_shaped)
-                # Check output - masking in case of invalid values
-                if numpy.any(invalid_mask):
-                    fourier_pattern[invalid_mask.any(axis=1)] = numpy.nan
-                # reshaping
-                fourier_pattern = numpy.reshape(fourier_pattern, tuple(list(qmap_scaled.shape)[:-1]))
-                log_debug(logger, "Generated pattern of shape %s." % str(fourier_pattern.shape))
-                F = F0 * fourier_pattern * dx**3 * numpy.sqrt(Omega_p)
-
-            # ATOMS
-            elif isinstance(p, condor.particle.ParticleAtoms):
-                # Import here to make other functionalities of Condor independent of spsim
-                import spsim
-                # Check version
-                from distutils.version import StrictVersion
-                spsim_version_min = "0.1.0"
-                if not hasattr(spsim, "__version__") or StrictVersion(spsim.__version__) < StrictVersion(spsim_version_min):
-                    log_and_raise_error(logger, "Your spsim version is too old. Please install the newest spsim version and try again.")
-                    sys.exit(0)
-                # Create options struct
-                opts = condor.utils.config._conf_to_spsim_opts(D_source, D_particle, D_detector, ndim=ndim, qn=qn, qmax=qmax)
-                spsim.write_options_file("./spsim.confout",opts)
-                # Create molecule struct
-                mol = spsim.get_molecule_from_atoms(D_particle["atomic_numbers"], D_particle["atomic_positions"])
-                # Always recenter molecule
-                spsim.origin_to_center_of_mass(mol)
-                spsim.write_pdb_from_mol("./mol.pdbout", mol)
-                # Calculate diffraction pattern
-                pat = spsim.simulate_shot(mol, opts)
-                # Extract complex Fourier values from spsim output
-                F_img = spsim.make_cimage(pat.F, pat.rot, opts)
-                phot_img = spsim.make_image(opts.detector.photons_per_pixel, pat.rot, opts)
-                F = numpy.sqrt(abs(phot_img.image[:])) * numpy.exp(1.j * numpy.angle(F_img.image[:]))
-                spsim.sp_image_free(F_img)
-                spsim.sp_image_free(phot_img)
-                # Extract qmap from spsim output
-                if ndim == 2:
-                    qmap_img = spsim.sp_image_alloc(3, nx, ny)
-                else:
-                    qmap_img = spsim.sp_image_alloc(3*qn, qn, qn)
-                spsim.array_to_image(pat.HKL_list, qmap_img)
-                if ndim == 2:
-                    qmap = 2*numpy.pi * qmap_img.image.real
-                else:
-                    qmap = 2*numpy.pi * numpy.reshape(qmap_img.image.real, (qn, qn, qn, 3))
-                spsim.sp_image_free(qmap_img)
-                spsim.free_diffraction_pattern(pat)
-                spsim.free_output_in_options(opts)                
-            else:
-                log_and_raise_error(logger, "No valid particles initialized.")
-                sys.exit(0)
-
-            if save_qmap:
-                qmap_singles[particle_key] = qmap
-
-            v = D_particle["position"]
-            # Calculate phase factors if needed
-            if not numpy.allclose(v, numpy.zeros_like(v), atol=1E-12):
-                if ndim == 2:
-                    F = F * numpy.exp(-1.j*(v[0]*qmap0[:,:,0]+v[1]*qmap0[:,:,1]+v[2]*qmap0[:,:,2]))
-                else:
-                    F = F * numpy.exp(-1.j*(v[0]*qmap0[:,:,:,0]+v[1]*qmap0[:,:,:,1]+v[2]*qmap0[:,:,:,2]))
-            # Superimpose patterns
-            F_tot = F_tot + F
+        # Noise-free pattern of a previous shot with the same parameters (see pattern_memo_size and cache_directory)
+        pattern_key    = None
+        pattern_digest = None
+        pattern        = None
+        pattern_loaded = False
+        if ndim == 2 and not miss and not save_map3d and not save_qmap:
+            if self._pattern_memo is not None:
+                pattern_key = _get_pattern_key(D_source, D_particles, D_detector)
+                pattern = self._pattern_memo.pop(pattern_key, None)
+                if pattern is not None:
+                    # Most recently used pattern goes to the end
+                    self._pattern_memo[pattern_key] = pattern
+            if pattern is None and self._disk_cache is not None:
+                pattern_digest = self._get_pattern_digest(D_source, D_particles, D_detector)
+                arrays = self._disk_cache.get(pattern_digest)
+                if arrays is not None:
+                    I = numpy.absolute(arrays["F"])
+                    I *= I
+                    pattern = (arrays["F"], I)
+                    pattern_loaded = True
+                    if pattern_key is not None:
+                        self._keep_pattern(pattern_key, pattern)
 
-        # Polarization correction
-        if ndim == 2:
-            P = self.detector.calculate_polarization_factors(cx=cx, cy=cy, polarization=self.source.polarization)
+        if miss:
+            # Empty pattern, the frame consists of the noise and background of the detector only
+            F_tot = condor.utils.buffers.get_buffer(self._buffers, "F_tot", (ny, nx), self._complex_dtype)
+            F_tot[...] = 0.
+        elif pattern is not None:
+            self._set_primary_wave_amplitudes(D_source, D_particles)
+            F_tot = condor.utils.buffers.get_buffer(self._buffers, "F_tot", pattern[0].shape, pattern[0].dtype)
+            F_tot[...] = pattern[0]
+        elif ndim == 2:
+            # Superposition of the scattering amplitudes of all particles (with polarization correction)
+            F_tot = self._get_detector_amplitudes(D_source, D_particles, D_detector, save_map3d=save_map3d, save_qmap=save_qmap, tile_rows=tile_rows)
+            if self._amplitude_cache is not None:
+                # Only the amplitudes of the particles of this shot are kept
+                self._amplitude_cache = self._amplitudes_used
         else:
-            if self.source.polarization != "ignore":
-                log_and_raise_error(logger, "polarization=\"%s\" for a 3D propagation does not make sense. Set polarization=\"ignore\" in your Source configuration and try again." % self.source.polarization)
-                return
-            P = 1.
-        F_tot = numpy.sqrt(P) * F_tot
+            # Qmap without rotation
+            qmap0 = self._get_qgrid_3d(D_source, D_detector, qn=qn, qmax=qmax, n_threads=n_threads, use_symmetry=use_symmetry, symmetry_check=symmetry_check, use_friedel_symmetry=use_friedel_symmetry)
+            # Superposition of the scattering amplitudes of all particles (no polarization correction in 3D)
+            F_tot, qmap_singles = self._get_amplitudes(D_source, D_particles, D_detector, qmap0, ndim=ndim, qn=qmap0.qn, qmax=qmap0.qmax, save_map3d=save_map3d, save_qmap=save_qmap)
 
         # Photon detection
-        I_tot, M_tot = self.detector.detect_photons(abs(F_tot)**2)
+        buffers = self._buffers if ndim == 2 else None
+        I_tot = condor.utils.buffers.get_buffer(buffers, "I", F_tot.shape, F_tot.real.dtype)
+        if miss:
+            I_tot[...] = 0.
+        elif pattern is not None:
+            I_tot[...] = pattern[1]
+        else:
+            numpy.absolute(F_tot, out=I_tot)
+            I_tot *= I_tot
+            if pattern_key is not None:
+                # Copies, the arrays are handed out and may be overwritten by noise or by the next shot
+                self._keep_pattern(pattern_key, (F_tot.copy(), I_tot.copy()))
+            if pattern_digest is not None:
+                self._disk_cache.put(pattern_digest, F=F_tot)
+        M_tot = None if buffers is None else buffers.get("M", F_tot.shape, numpy.uint16)
+        I_tot, M_tot = self.detector.detect_photons(I_tot, mask_out=M_tot)
         
         if ndim == 2:
             M_tot_binary = M_tot == 0        
@@ -416,12 +806,494 @@ class Experiment:
 
             O["entry_1"]["data_2"] = data_2
 
+        if self._amplitude_cache is not None or self._pattern_memo is not None or self._disk_cache is not None:
+            O["statistics"] = self._amplitude_statistics
+            if self._pattern_memo is not None:
+                O["statistics"]["pattern_reused"] = int(pattern is not None and not pattern_loaded)
+            if self._disk_cache is not None:
+                O["statistics"]["pattern_loaded"] = int(pattern_loaded)
+
+        if self.hit_rate is not None:
+            O["hit"] = int(not miss)
+
         O = remove_from_dict(O, "_")
             
         return O
 
     
 
+    def _get_detector_amplitudes(self, D_source, D_particles, D_detector, save_map3d=False, save_qmap=False, tile_rows=None):
+        """
+        Return the superposition of the scattering amplitudes of all particles on the detector (with polarization correction)
+
+        Only pixels that are not missing are simulated, the amplitudes of missing pixels are set to zero. If ``tile_rows`` is given the detector is processed in blocks of ``tile_rows`` rows and peak memory is set by the size of the blocks
+
+        If buffers are reused (see :class:`Experiment`) arrays that only depend on the geometry are calculated once and the returned array is a buffer
+        """
+        cx         = D_detector["cx"]
+        cy         = D_detector["cy"]
+        wavelength = D_source["wavelength"]
+        spsim = any([_uses_spsim(D_particle) for D_particle in D_particles.values()])
+        if spsim and tile_rows is not None:
+            log_warning(logger, "spsim simulates the entire detector, tile_rows=%i is ignored." % tile_rows)
+        buffers = None if spsim else self._buffers
+        if buffers is not None and tile_rows is None:
+            # Arrays that are cached for the entire detector are recalculated if any of these parameters changes
+            geometry = (self.detector, wavelength, cx, cy, D_detector["pixel_size"], D_detector["distance"], self.source.polarization, self._float_dtype)
+        else:
+            geometry = None
+        missing = self._get_cached("missing", geometry, lambda: (self.detector.get_mask() & PixelMask.PIXEL_IS_MISSING) != 0)
+        if spsim or (tile_rows is None and not missing.any()):
+            qmap0 = self._get_cached("qmap0", geometry, lambda: self.detector.generate_qmap(wavelength, cx=cx, cy=cy, extrinsic_rotation=None, dtype=self._float_dtype))
+            F_tot, qmap_singles = self._get_amplitudes(D_source, D_particles, D_detector, qmap0, ndim=2, save_map3d=save_map3d, save_qmap=save_qmap, buffers=buffers, geometry=geometry)
+            sqrt_P = self._get_cached("sqrt_P", geometry, lambda: numpy.sqrt(self.detector.calculate_polarization_factors(cx=cx, cy=cy, polarization=self.source.polarization).astype(self._float_dtype, copy=False)))
+            if buffers is None:
+                return sqrt_P * F_tot
+            F_tot *= sqrt_P
+            return F_tot
+        ny, nx = missing.shape
+        if tile_rows is None:
+            tile_rows = ny
+        log_debug(logger, "Simulating %i pixels in blocks of %i rows (%i missing pixels are skipped)" % (nx*ny, tile_rows, missing.sum()))
+        if buffers is None:
+            F_tot = numpy.zeros(shape=(ny, nx), dtype=self._complex_dtype)
+        else:
+            F_tot = buffers.get("F_detector", (ny, nx), self._complex_dtype)
+            F_tot.fill(0.)
+        for y0 in range(0, ny, tile_rows):
+            pixels = self._get_cached("pixels", geometry, lambda: numpy.flatnonzero(~missing.flat[y0*nx:min([y0+tile_rows, ny])*nx]) + y0*nx)
+            if len(pixels) == 0:
+                continue
+            qmap0 = self._get_cached("qmap0", geometry, lambda: self.detector.generate_qmap(wavelength, cx=cx, cy=cy, extrinsic_rotation=None, pixels=pixels, dtype=self._float_dtype))
+            F, qmap_singles = self._get_amplitudes(D_source, D_particles, D_detector, qmap0, ndim=2, save_map3d=save_map3d, pixels=pixels, buffers=buffers, geometry=geometry)
+            sqrt_P = self._get_cached("sqrt_P", geometry, lambda: numpy.sqrt(self.detector.calculate_polarization_factors(cx=cx, cy=cy, polarization=self.source.polarization, pixels=pixels).astype(self._float_dtype, copy=False)))
+            if buffers is None:
+                F_tot.flat[pixels] = sqrt_P * F
+            else:
+                F *= sqrt_P
+                F_tot.flat[pixels] = F
+        return F_tot
+
+    def _get_cached(self, name, geometry, function):
+        """
+        Return ``function()``, the result is stored in the buffer arena under the given name and reused as long as ``geometry`` does not change. If ``geometry`` is ``None`` nothing is cached
+        """
+        if geometry is None:
+            return function()
+        return self._buffers.get_cached(name, geometry, function)
+
+    def _get_qgrid_3d(self, D_source, D_detector, qn=None, qmax=None, n_threads=1, use_symmetry=False, symmetry_check=0, use_friedel_symmetry=None):
+        """
+        Return the unrotated grid of scattering vectors of a 3D Fourier volume. By default the number of samples along each dimension equals the larger detector dimension in pixels and the grid extends to the scattering vector at the detector corner
+        """
+        if self.detector.solid_angle_correction:
+            log_and_raise_error(logger, "Carrying out solid angle correction for a simulation of a 3D Fourier volume does not make sense. Please set solid_angle_correction=False for your Detector and try again.")
+            return
+        if self.source.polarization != "ignore":
+            log_and_raise_error(logger, "polarization=\"%s\" for a 3D propagation does not make sense. Set polarization=\"ignore\" in your Source configuration and try again." % self.source.polarization)
+            return
+        if qmax is None:
+            qmax = numpy.sqrt((self.detector.get_q_max(D_source["wavelength"], pos="edge")**2).sum())
+        if qn is None:
+            qn = max([D_detector["nx"], D_detector["ny"]])
+        # Lazy grid, the full array of scattering vectors is only generated if needed
+        return condor.utils.scattering_vector.QGrid3D(qn=qn, qmax=qmax, n_threads=n_threads, use_symmetry=use_symmetry, symmetry_check=symmetry_check, use_friedel_symmetry=use_friedel_symmetry, dtype=self._float_dtype)
+
+    def _keep_pattern(self, pattern_key, pattern):
+        self._pattern_memo[pattern_key] = pattern
+        if len(self._pattern_memo) > self._pattern_memo_size:
+            # Discard the least recently used pattern
+            self._pattern_memo.popitem(last=False)
+
+    def _get_pattern_digest(self, D_source, D_particles, D_detector):
+        """
+        Return the digest that addresses the noise-free pattern of a shot in the cache directory (see cache_directory)
+        """
+        if self._conf_digest is None:
+            # Digesting the configuration includes the arrays of map particles and is therefore done only once
+            self._conf_digest = condor.utils.diskcache.get_digest((self.get_conf(), self.precision))
+        # Particle models are identified by their names, which persist between runs
+        names = dict([(id(p), n) for n, p in self.particles.items()])
+        pattern_key = _get_pattern_key(D_source, D_particles, D_detector, get_instance_key=lambda p: names.get(id(p), p.__class__.__name__))
+        return condor.utils.diskcache.get_digest((self._conf_digest, pattern_key))
+
+    def _set_primary_wave_amplitudes(self, D_source, D_particles):
+        """
+        Store the intensity and the primary wave amplitude at the positions of the particles in their dictionaries
+        """
+        for D_particle in D_particles.values():
+            # Intensity at interaction point
+            D_particle["intensity"] = self.source.get_intensity(D_particle["position"], "ph/m2", pulse_energy=D_source["pulse_energy"])
+            # Calculate primary wave amplitude
+            # F0 = sqrt(I_0) 2pi/wavelength^2
+            D_particle["F0"] = numpy.sqrt(D_particle["intensity"])*2*numpy.pi/D_source["wavelength"]**2
+
+    def _get_amplitudes(self, D_source, D_particles, D_detector, qmap0, ndim=2, qn=None, qmax=None, save_map3d=False, save_qmap=False, pixels=None, buffers=None, geometry=None):
+        """
+        Return the superposition of the scattering amplitudes of all particles (without polarization correction) and the scattering vectors of the individual particles (see :meth:`_get_particle_amplitude` for the arguments ``qmap0``, ``pixels``, ``buffers`` and ``geometry``)
+        """
+        wavelength = D_source["wavelength"]
+        qmap_singles = {}
+        F_tot        = None
+        self._set_primary_wave_amplitudes(D_source, D_particles)
+        # Group particles that share the same form factor (same model, size parameters and orientation)
+        groups = {}
+        for particle_key, D_particle in D_particles.items():
+            if _uses_spsim(D_particle):
+                # Amplitudes from spsim are not proportional to F0 and can not be shared
+                form_factor_key = (particle_key,)
+            else:
+                form_factor_key = _get_form_factor_key(D_particle)
+            groups.setdefault(form_factor_key, []).append(particle_key)
+
+        # Amplitudes of detector pixels can be kept for the next shot (see cache_amplitudes)
+        cache_amplitudes = self._amplitude_cache is not None and ndim == 2 and (qmap0.ndim == 3 or pixels is not None) and not save_map3d and not save_qmap
+        if cache_amplitudes:
+            amplitude_geometry = (wavelength, D_detector["cx"], D_detector["cy"], D_detector["pixel_size"], D_detector["distance"], qmap0.shape, qmap0.dtype.str,
+                                  None if pixels is None else pixels.tostring())
+
+        # Calculate patterns of all groups of particles individually
+        for form_factor_key, particle_keys in groups.items():
+            D_particle = D_particles[particle_keys[0]]
+            p  = D_particle["_class_instance"]
+            # 3D Orientation
+            extrinsic_rotation = Rotation(values=D_particle["extrinsic_quaternion"], formalism="quaternion")
+
+            F_unit = None
+            if cache_amplitudes and not _uses_spsim(D_particle):
+                amplitude_key = (form_factor_key, amplitude_geometry)
+                if amplitude_key in self._amplitude_cache:
+                    # Only positions and primary wave amplitudes changed
+                    F_unit = self._amplitude_cache[amplitude_key]
+                    self._amplitude_statistics["amplitudes_reused"] += 1
+                else:
+                    F_unit, qmap = self._get_particle_amplitude(p, D_particle, D_source, D_detector, extrinsic_rotation, qmap0=qmap0, F0=1., ndim=ndim, pixels=pixels, buffers=buffers, geometry=geometry)
+                    # F_unit may be a buffer that is reused by the next particle
+                    F_unit = F_unit if buffers is None else F_unit.copy()
+                    self._amplitude_statistics["amplitudes_calculated"] += 1
+                self._amplitudes_used[amplitude_key] = F_unit
+                qmap = None
+
+            if len(particle_keys) == 1:
+                # Scattering amplitudes
+                if F_unit is None:
+                    F, qmap = self._get_particle_amplitude(p, D_particle, D_source, D_detector, extrinsic_rotation, qmap0=qmap0, F0=D_particle["F0"], ndim=ndim, qn=qn, qmax=qmax, save_map3d=save_map3d, pixels=pixels, buffers=buffers, geometry=geometry)
+                else:
+                    F = F_unit * D_particle["F0"]
+                v = D_particle["position"]
+                # Calculate phase factors if needed
+                if not numpy.allclose(v, numpy.zeros_like(v), atol=1E-12):
+                    if ndim == 2:
+                        F = self._apply_phase_ramp_2d(F, qmap0, v, buffers=buffers)
+                    else:
+                        # Separable phase ramp (product of three 1D exponentials)
+                        F = qmap0.apply_phase_ramp(F, v)
+            else:
+                log_debug(logger, "Sharing form factor among %i particles" % len(particle_keys))
+                # Scattering amplitudes for unit primary wave amplitude (calculated only once for the whole group)
+                if F_unit is None:
+                    F, qmap = self._get_particle_amplitude(p, D_particle, D_source, D_detector, extrinsic_rotation, qmap0=qmap0, F0=1., ndim=ndim, qn=qn, qmax=qmax, save_map3d=save_map3d, pixels=pixels, buffers=buffers, geometry=geometry)
+                else:
+                    F = F_unit
+                # Structure factor weighted by the primary wave amplitudes at the positions of the particles
+                positions = numpy.array([D_particles[k]["position"] for k in particle_keys])
+                F0s = numpy.array([D_particles[k]["F0"] for k in particle_keys])
+                if ndim == 2:
+                    F = F * condor.utils.diffraction.structure_factor(qmap0, positions, F0s)
+                else:
+                    F = F * qmap0.get_structure_factor(positions, F0s)
+                if save_map3d and "map3d_dn" in D_particle:
+                    for k in particle_keys[1:]:
+                        D_particles[k]["map3d_dn"] = D_particle["map3d_dn"]
+                        D_particles[k]["dx"] = D_particle["dx"]
+
+            if save_qmap:
+                for k in particle_keys:
+                    qmap_singles[k] = qmap
+
+            if self.precision == "single":
+                # Quantities that are only available in double precision (e.g. tabulated form factors) are converted here
+                F = F.astype(numpy.complex64 if numpy.iscomplexobj(F) else numpy.float32, copy=False)
+
+            # Superimpose patterns
+            if F_tot is None:
+                # F may be a buffer that is reused by the next particle
+                F_tot = condor.utils.buffers.get_buffer(buffers, "F_tot", F.shape, F.dtype)
+                F_tot[...] = F
+            elif buffers is not None and numpy.result_type(F_tot, F) == F_tot.dtype:
+                F_tot += F
+            else:
+                F_tot = F_tot + F
+
+        return F_tot, qmap_singles
+
+    def _apply_phase_ramp_2d(self, F, qmap0, v, buffers=None):
+        """
+        Return the amplitudes F multiplied by the phase factors exp(-i q v) of a particle at position v (the result is a buffer if ``buffers`` is given)
+        """
+        phase = condor.utils.buffers.get_buffer(buffers, "phase", qmap0.shape[:-1], qmap0.dtype)
+        tmp = condor.utils.buffers.get_buffer(buffers, "phase_tmp", qmap0.shape[:-1], qmap0.dtype)
+        numpy.multiply(qmap0[...,0], v[0], out=phase)
+        phase += numpy.multiply(qmap0[...,1], v[1], out=tmp)
+        phase += numpy.multiply(qmap0[...,2], v[2], out=tmp)
+        ramp = condor.utils.buffers.get_buffer(buffers, "ramp", phase.shape, numpy.result_type(-1.j, phase))
+        numpy.multiply(phase, -1.j, out=ramp)
+        numpy.exp(ramp, out=ramp)
+        return numpy.multiply(F, ramp, out=ramp if numpy.result_type(F, ramp) == ramp.dtype else None)
+
+    def _get_particle_amplitude(self, p, D_particle, D_source, D_detector, extrinsic_rotation, qmap0, F0, ndim=2, qn=None, qmax=None, save_map3d=False, pixels=None, buffers=None, geometry=None):
+        """
+        Return the scattering amplitudes of a single particle (without the phase factor for its position) for the primary wave amplitude F0 and the scattering vectors they were calculated for
+
+        For ``ndim=2`` the unrotated scattering vectors ``qmap0`` are either given for the entire detector (array shape (ny, nx, 3)) or as a list of scattering vectors (array shape (N, 3)). In the latter case ``pixels`` are the flat indices of the corresponding detector pixels (``None`` for arbitrary scattering vectors)
+
+        If the :class:`condor.utils.buffers.BufferArena` instance ``buffers`` is given (only for ``ndim=2``) intermediate arrays are written into its buffers and the returned arrays may be buffers. Solid angles are cached in the arena if ``geometry`` is given (see :meth:`_get_detector_amplitudes`)
+        """
+        nx                  = D_detector["nx"]
+        ny                  = D_detector["ny"]
+        cx                  = D_detector["cx"]
+        cy                  = D_detector["cy"]
+        pixel_size          = D_detector["pixel_size"]
+        detector_distance   = D_detector["distance"]
+        wavelength          = D_source["wavelength"]
+
+        # Atoms that are gridded to a map are propagated like a map
+        as_map = isinstance(p, condor.particle.ParticleMap) or (isinstance(p, condor.particle.ParticleAtoms) and p.as_map)
+
+        if isinstance(p, condor.particle.ParticleSphere) or isinstance(p, condor.particle.ParticleSpheroid) or isinstance(p, condor.particle.ParticleBeads) or isinstance(p, condor.particle.ParticleRadial) or isinstance(p, condor.particle.ParticleCylinder) or as_map:
+            # Solid angles
+            def get_sqrt_Omega_p():
+                if self.detector.solid_angle_correction and ndim == 2 and qmap0.ndim == 3:
+                    Omega_p = self.detector.get_all_pixel_solid_angles(cx, cy)
+                elif self.detector.solid_angle_correction and pixels is not None:
+                    Omega_p = self.detector.get_all_pixel_solid_angles(cx, cy, pixels=pixels)
+                else:
+                    Omega_p = pixel_size**2 / detector_distance**2
+                return numpy.sqrt(numpy.asarray(Omega_p, dtype=self._float_dtype))
+            sqrt_Omega_p = self._get_cached("sqrt_Omega_p", geometry, get_sqrt_Omega_p)
+        
+        # CRYSTAL
+        if isinstance(p, condor.particle.ParticleCrystal):
+            D_cell = D_particle["unit_cell"]
+            # The unit cell is rotated in the frame of the lattice
+            q_cell = quat_mult(D_particle["extrinsic_quaternion"], D_cell["extrinsic_quaternion"])
+            rotation_cell = Rotation(values=q_cell, formalism="quaternion")
+            F, qmap = self._get_particle_amplitude(D_cell["_class_instance"], D_cell, D_source, D_detector, rotation_cell, qmap0=qmap0, F0=F0, ndim=ndim, qn=qn, qmax=qmax, save_map3d=save_map3d, pixels=pixels, buffers=buffers, geometry=geometry)
+            # Position of the unit cell content with respect to the lattice point
+            v = extrinsic_rotation.rotate_vector(numpy.asarray(D_cell["position"], dtype=numpy.float64))
+            if not numpy.allclose(v, numpy.zeros_like(v), atol=1E-12):
+                if ndim == 2:
+                    F = F * numpy.exp(-1.j*qmap0.dot(v))
+                else:
+                    F = qmap0.apply_phase_ramp(F, v)
+            # Lattice factor
+            if ndim == 2:
+                F = F * p.get_lattice_factor(qmap0, extrinsic_rotation=extrinsic_rotation)
+            else:
+                F = F * qmap0.evaluate(lambda q: p.get_lattice_factor(q, extrinsic_rotation=extrinsic_rotation))
+
+        # UNIFORM SPHERE
+        elif isinstance(p, condor.particle.ParticleSphere):
+            # Refractive index
+            dn = p.get_dn(wavelength)
+            # Scattering vectors
+            # Intensity scaling factor
+            R = D_particle["diameter"]/2.
+            V = 4/3.*numpy.pi*R**3
+            K = (F0*V*dn)**2
+            # Pattern
+            F_sphere = lambda q: condor.utils.sphere_diffraction.F_sphere_diffraction(K, q, R)
+            if ndim == 2:
+                qmap = self._get_qmap_2d(qmap0, D_detector, wavelength, extrinsic_rotation=None, buffers=buffers)
+                F = F_sphere(numpy.sqrt((qmap**2).sum(axis=-1)))
+            else:
+                qmap = qmap0
+                F = qmap0.evaluate_abs_q(F_sphere)
+            F = F * sqrt_Omega_p
+
+        # RADIAL PROFILE
+        elif isinstance(p, condor.particle.ParticleRadial):
+            # Scattering vectors
+            # Pattern
+            F_radial = lambda q: p.get_form_factor(q, D_particle["diameter"], wavelength)
+            if ndim == 2:
+                qmap = self._get_qmap_2d(qmap0, D_detector, wavelength, extrinsic_rotation=None, buffers=buffers)
+                F = F_radial(numpy.sqrt((qmap**2).sum(axis=-1)))
+            else:
+                qmap = qmap0
+                F = qmap0.evaluate_abs_q(F_radial)
+            F = F0 * F * sqrt_Omega_p
+
+        # UNIFORM SPHEROID
+        elif isinstance(p, condor.particle.ParticleSpheroid):
+            # Refractive index
+            dn = p.get_dn(wavelength)
+            # Scattering vectors
+            # Intensity scaling factor
+            R = D_particle["diameter"]/2.
+            V = 4/3.*numpy.pi*R**3
+            K = (F0*V*abs(dn))**2
+            # Geometrical factors
+            a = condor.utils.spheroid_diffraction.to_spheroid_semi_diameter_a(D_particle["diameter"], D_particle["flattening"])
+            c = condor.utils.spheroid_diffraction.to_spheroid_semi_diameter_c(D_particle["diameter"], D_particle["flattening"])
+            # Pattern
+            # Spheroid axis before rotation is parallel to the y-axis
+            F_spheroid = lambda q: condor.utils.spheroid_diffraction.F_ellipsoid_diffraction(K, q, a, c, a, extrinsic_rotation=extrinsic_rotation, dtype=q.dtype)
+            if ndim == 2:
+                qmap = self._get_qmap_2d(qmap0, D_detector, wavelength, extrinsic_rotation=None, order="xyz", buffers=buffers)
+                F = F_spheroid(qmap)
+            else:
+                qmap = qmap0
+                F = qmap0.evaluate(F_spheroid, dtype=qmap0.dtype, symmetry=_get_grid_symmetry(p, D_particle, extrinsic_rotation, qmap0))
+            F = F * sqrt_Omega_p
+
+        # UNIFORM CYLINDER
+        elif isinstance(p, condor.particle.ParticleCylinder):
+            # Refractive index
+            dn = p.get_dn(wavelength)
+            # Scattering vectors
+            # Intensity scaling factor
+            R = D_particle["diameter"]/2.
+            L = D_particle["length"]
+            V = condor.utils.cylinder_diffraction.to_cylinder_volume(R, L)
+            K = (F0*V*abs(dn))**2
+            # Pattern
+            # Cylinder axis before rotation is parallel to the y-axis
+            F_cylinder = lambda q: condor.utils.cylinder_diffraction.F_cylinder_diffraction(K, q, R, L, extrinsic_rotation=extrinsic_rotation)
+            if ndim == 2:
+                qmap = self._get_qmap_2d(qmap0, D_detector, wavelength, extrinsic_rotation=None, order="xyz", buffers=buffers)
+                F = F_cylinder(qmap)
+            else:
+                qmap = qmap0
+                F = qmap0.evaluate(F_cylinder, dtype=qmap0.dtype, symmetry=_get_grid_symmetry(p, D_particle, extrinsic_rotation, qmap0))
+            F = F * sqrt_Omega_p
+
+        # MAP
+        elif as_map:
+            # Resolution
+            dx_required  = self.detector.get_resolution_element_r(wavelength, cx=cx, cy=cy, center_variation=False)
+            dx_suggested = self.detector.get_resolution_element_r(wavelength, center_variation=True)
+            # Generate map
+            map3d_dn, dx = p.get_new_dn_map(D_particle, dx_required, dx_suggested, wavelength)
+            log_debug(logger, "Sampling of map: dx_required = %e m, dx_suggested = %e m, dx = %e m" % (dx_required, dx_suggested, dx))
+            if save_map3d:
+                D_particle["map3d_dn"] = map3d_dn
+                D_particle["dx"] = dx
+            log_debug(logger, "Map3d input shape: (%i,%i,%i), number of dimensions: %i, sum %f" % (map3d_dn.shape[0], map3d_dn.shape[1], map3d_dn.shape[2], len(list(map3d_dn.shape)), abs(map3d_dn).sum()))
+            if (numpy.isfinite(abs(map3d_dn))==False).sum() > 0:
+                log_warning(logger, "There are infinite values in the dn map of the object.")
+            # Scattering vectors (the nfft requires order z,y,x)
+            if ndim == 2:
+                qmap = self._get_qmap_2d(qmap0, D_detector, wavelength, extrinsic_rotation=extrinsic_rotation, order="zyx", buffers=buffers)
+                fourier_pattern = self._get_map_fourier_pattern(map3d_dn, dx, qmap, buffers=buffers)
+            else:
+                # The scattering vectors are generated and transformed slab by slab
+                qmap = qmap0.rotated(extrinsic_rotation)
+                # The map is symmetric about the centre of the array, the nfft origin lies at index N/2
+                v = ((numpy.array(map3d_dn.shape[::-1])-1)/2. - numpy.array(map3d_dn.shape[::-1])/2) * dx
+                v = extrinsic_rotation.rotate_vector(v)
+                fourier_pattern = qmap.evaluate(lambda q: self._get_map_fourier_pattern(map3d_dn, dx, q), order="zyx",
+                                                symmetry=_get_grid_symmetry(p, D_particle, extrinsic_rotation, qmap0), symmetry_origin=v,
+                                                friedel=_uses_friedel_symmetry(map3d_dn, qmap0))
+            log_debug(logger, "Generated pattern of shape %s." % str(fourier_pattern.shape))
+            # The Fourier pattern is a new array or a buffer and is scaled in place
+            F = fourier_pattern
+            F *= F0
+            F *= dx**3
+            F *= sqrt_Omega_p
+            if isinstance(p, condor.particle.ParticleAtoms):
+                # Undo the attenuation by the grid part of the atomic kernels
+                q = numpy.sqrt((qmap**2).sum(axis=-1)) if ndim == 2 else qmap0.get_abs_q()
+                F = F * p.get_gridding_correction(q, dx)
+
+        # GAUSSIAN BEADS
+        elif isinstance(p, condor.particle.ParticleBeads):
+            # Scattering vectors
+            # Sum of Gaussian form factors weighted by the numbers of electrons
+            F_sum = lambda q: condor.utils.bead_diffraction.F_bead_diffraction(q, D_particle["bead_positions"], p.get_bead_sigmas(), D_particle["bead_electrons"])
+            if ndim == 2:
+                qmap = self._get_qmap_2d(qmap0, D_detector, wavelength, extrinsic_rotation=extrinsic_rotation, order="xyz", buffers=buffers)
+                F_beads = F_sum(qmap)
+            else:
+                qmap = qmap0.rotated(extrinsic_rotation)
+                F_beads = qmap.evaluate(F_sum)
+            # F = F0 r_0 wavelength^2 / (2pi) sum(...) = sqrt(I_0) r_0 sum(...)
+            F = F0 * constants.value("classical electron radius") * wavelength**2 / (2*numpy.pi) * F_beads * sqrt_Omega_p
+
+        # ATOMS
+        elif isinstance(p, condor.particle.ParticleAtoms):
+            # Import here to make other functionalities of Condor independent of spsim
+            import spsim
+            # Check version
+            from distutils.version import StrictVersion
+            spsim_version_min = "0.1.0"
+            if not hasattr(spsim, "__version__") or StrictVersion(spsim.__version__) < StrictVersion(spsim_version_min):
+                log_and_raise_error(logger, "Your spsim version is too old. Please install the newest spsim version and try again.")
+                sys.exit(0)
+            # Create options struct
+            opts = condor.utils.config._conf_to_spsim_opts(D_source, D_particle, D_detector, ndim=ndim, qn=qn, qmax=qmax)
+            spsim.write_options_file("./spsim.confout",opts)
+            # Create molecule struct
+            mol = spsim.get_molecule_from_atoms(D_particle["atomic_numbers"], D_particle["atomic_positions"])
+            # Always recenter molecule
+            spsim.origin_to_center_of_mass(mol)
+            spsim.write_pdb_from_mol("./mol.pdbout", mol)
+            # Calculate diffraction pattern
+            pat = spsim.simulate_shot(mol, opts)
+            # Extract complex Fourier values from spsim output
+            F_img = spsim.make_cimage(pat.F, pat.rot, opts)
+            phot_img = spsim.make_image(opts.detector.photons_per_pixel, pat.rot, opts)
+            F = numpy.sqrt(abs(phot_img.image[:])) * numpy.exp(1.j * numpy.angle(F_img.image[:]))
+            spsim.sp_image_free(F_img)
+            spsim.sp_image_free(phot_img)
+            # Extract qmap from spsim output
+            if ndim == 2:
+                qmap_img = spsim.sp_image_alloc(3, nx, ny)
+            else:
+                qmap_img = spsim.sp_image_alloc(3*qn, qn, qn)
+            spsim.array_to_image(pat.HKL_list, qmap_img)
+            if ndim == 2:
+                qmap = 2*numpy.pi * qmap_img.image.real
+            else:
+                qmap = 2*numpy.pi * numpy.reshape(qmap_img.image.real, (qn, qn, qn, 3))
+            spsim.sp_image_free(qmap_img)
+            spsim.free_diffraction_pattern(pat)
+            spsim.free_output_in_options(opts)                
+        else:
+            log_and_raise_error(logger, "No valid particles initialized.")
+            sys.exit(0)
+
+        return F, qmap
+
+    def _get_map_fourier_pattern(self, map3d_dn, dx, qmap, buffers=None):
+        """
+        Return the NFFT of the refractive index map for the given scattering vectors in order z,y,x (the output has the shape qmap.shape[:-1]). If ``buffers`` is given intermediate arrays and the output are buffers
+        """
+        get_buffer = condor.utils.buffers.get_buffer
+        # Rescale and shape qmap for nfft
+        qmap_scaled = numpy.multiply(qmap, dx, out=get_buffer(buffers, "qmap_scaled", qmap.shape, qmap.dtype))
+        qmap_scaled /= 2. * numpy.pi
+        qmap_shaped = qmap_scaled.reshape(qmap_scaled.size/3, 3)
+        # Check inputs
+        invalid_mask = numpy.greater_equal(qmap_shaped, -0.5, out=get_buffer(buffers, "invalid_mask", qmap_shaped.shape, bool))
+        tmp_mask = numpy.less(qmap_shaped, 0.5, out=get_buffer(buffers, "tmp_mask", qmap_shaped.shape, bool))
+        invalid_mask *= tmp_mask
+        numpy.logical_not(invalid_mask, out=invalid_mask)
+        if numpy.any(invalid_mask):
+            qmap_shaped[invalid_mask] = 0.
+            log_warning(logger, "%i invalid pixel positions." % invalid_mask.sum())
+        log_debug(logger, "Scattering vectors shape: (%i,%i); Number of dimensions: %i" % (qmap_shaped.shape[0], qmap_shaped.shape[1], len(list(qmap_shaped.shape))))
+        if not numpy.isfinite(qmap_shaped, out=tmp_mask).all():
+            log_warning(logger, "There are infinite values in the scattering vectors.")
+        # NFFT (the output has the precision of the map)
+        fourier_pattern = get_buffer(buffers, "fourier_pattern", (qmap_shaped.shape[0],), self._complex_dtype)
+        log_execution_time(logger)(condor.utils.nfft.nfft_inplace)(map3d_dn.astype(self._complex_dtype, copy=False), qmap_shaped, fourier_pattern)
+        # Check output - masking in case of invalid values
+        if numpy.any(invalid_mask):
+            fourier_pattern[invalid_mask.any(axis=1)] = numpy.nan
+        # reshaping
+        return numpy.reshape(fourier_pattern, tuple(list(qmap_scaled.shape)[:-1]))
+
     @log_execution_time(logger)
     def get_qmap(self, nx, ny, cx, cy, pixel_size, detector_distance, wavelength, extrinsic_rotation=None, order="xyz"):
         calculate = False
@@ -436,12 +1308,16 @@ class Experiment:
             calculate = calculate or detector_distance != self._qmap_cache["detector_distance"]
             calculate = calculate or wavelength != self._qmap_cache["wavelength"]
             calculate = calculate or order != self._qmap_cache["order"]
-            if extrinsic_rotation is not None:
+            calculate = calculate or self._qmap_cache["qmap"].dtype != self._float_dtype
+            if extrinsic_rotation is None or self._qmap_cache["extrinsic_rotation"] is None:
+                calculate = calculate or extrinsic_rotation is not self._qmap_cache["extrinsic_rotation"]
+            else:
                 calculate = calculate or not extrinsic_rotation.is_similar(self._qmap_cache["extrinsic_rotation"])
         if calculate:
             log_debug(logger,  "Calculating qmap")
+            self._n_qmap_cache_misses += 1
             self._qmap_cache = {
-                "qmap"              : self.detector.generate_qmap(wavelength, cx=cx, cy=cx, extrinsic_rotation=extrinsic_rotation, order=order),
+                "qmap"              : self.detector.generate_qmap(wavelength, cx=cx, cy=cy, extrinsic_rotation=extrinsic_rotation, order=order, dtype=self._float_dtype),
                 "nx"                : nx,
                 "ny"                : ny,
                 "cx"                : cx,
@@ -452,8 +1328,23 @@ class Experiment:
                 "extrinsic_rotation": copy.deepcopy(extrinsic_rotation),
                 "order"             : order,
             }            
+        else:
+            self._n_qmap_cache_hits += 1
         return self._qmap_cache["qmap"]
 
+    def _get_qmap_2d(self, qmap0, D_detector, wavelength, extrinsic_rotation=None, order="xyz", buffers=None):
+        """
+        Return the scattering vectors of a 2D propagation in the frame of the rotated particle. Scattering vectors of the entire detector are cached, lists of scattering vectors (array shape (N, 3)) are rotated directly. If ``buffers`` is given ``qmap0`` is rotated into a buffer
+        """
+        if buffers is not None:
+            if extrinsic_rotation is None and order == "xyz":
+                return qmap0
+            return condor.utils.scattering_vector.rotate_qmap(qmap0, extrinsic_rotation=extrinsic_rotation, order=order, out=buffers.get("qmap_" + order, qmap0.shape, qmap0.dtype))
+        if qmap0.ndim == 3:
+            return self.get_qmap(nx=D_detector["nx"], ny=D_detector["ny"], cx=D_detector["cx"], cy=D_detector["cy"], pixel_size=D_detector["pixel_size"],
+                                 detector_distance=D_detector["distance"], wavelength=wavelength, extrinsic_rotation=extrinsic_rotation, order=order)
+        return condor.utils.scattering_vector.rotate_qmap(qmap0, extrinsic_rotation=extrinsic_rotation, order=order)
+
     def get_qmap_from_cache(self):
         if self._qmap_cache == {} or not "qmap" in self._qmap_cache:
             log_and_raise_error(logger, "Cache empty!")
@@ -554,6 +1445,85 @@ class Experiment:
     # ------------------------------------------------------------------------------------------------
 
 
+def _uses_spsim(D_particle):
+    p = D_particle["_class_instance"]
+    if isinstance(p, condor.particle.ParticleCrystal):
+        return _uses_spsim(D_particle["unit_cell"])
+    return isinstance(p, condor.particle.ParticleAtoms) and not p.as_map
+
+def _get_grid_symmetry(p, D_particle, extrinsic_rotation, qgrid):
+    """
+    Return the symmetry operations of the rotated particle that map the 3D grid of scattering vectors onto itself (``None`` if symmetry is not exploited or unknown)
+    """
+    if not qgrid.use_symmetry:
+        return None
+    point_group = None
+    if isinstance(p, (condor.particle.ParticleSpheroid, condor.particle.ParticleCylinder)):
+        point_group = "uniaxial"
+    elif isinstance(p, condor.particle.ParticleMap):
+        # A voxelised sphere has only the symmetry of its Cartesian grid
+        point_group = {"icosahedron": "icosahedral", "cube": "cubic", "sphere": "cubic", "spheroid": "uniaxial"}.get(D_particle["geometry"])
+    if point_group is None:
+        return None
+    operations = condor.utils.symmetry.get_grid_symmetry_operations(point_group, extrinsic_rotation)
+    if isinstance(p, condor.particle.ParticleMap):
+        # Voxel maps are only invariant under operations that also map their own Cartesian grid (in the frame of the particle) onto itself
+        cubic = condor.utils.symmetry.get_grid_symmetry_operations("cubic", extrinsic_rotation)
+        operations = [P for P in operations if any([(P == C).all() for C in cubic])]
+    return operations
+
+def _uses_friedel_symmetry(map3d_dn, qgrid):
+    """
+    Return whether the Fourier transform of the refractive index map obeys Friedel's law on the 3D grid of scattering vectors (the map is real, i.e. there is no absorption)
+    """
+    if qgrid.use_friedel_symmetry is not None:
+        return qgrid.use_friedel_symmetry
+    if not numpy.iscomplexobj(map3d_dn):
+        return True
+    return abs(map3d_dn.imag).max() <= 1E-6 * abs(map3d_dn.real).max()
+
+def _get_form_factor_key(D_particle, exclude=("position", "intensity", "F0"), get_instance_key=id):
+    """
+    Return a hashable key that is equal for particles with the same scattering amplitudes up to the phase factor of the position and the primary wave amplitude. The particle model instance enters the key as ``get_instance_key(instance)``
+    """
+    if isinstance(D_particle["_class_instance"], (condor.particle.ParticleSphere, condor.particle.ParticleRadial)):
+        # Orientation does not matter for spherically symmetric particles
+        exclude = tuple(exclude) + ("extrinsic_quaternion",)
+    items = []
+    for k in sorted(D_particle.keys()):
+        if k in exclude:
+            continue
+        v = D_particle[k]
+        if k == "_class_instance":
+            v = get_instance_key(v)
+        elif isinstance(v, dict):
+            # The position of a nested particle (e.g. a unit cell) does change the form factor
+            v = _get_form_factor_key(v, exclude=("intensity", "F0"), get_instance_key=get_instance_key)
+        elif isinstance(v, (numpy.ndarray, list, tuple)):
+            a = numpy.asarray(v)
+            v = (a.dtype.str, a.shape, a.tostring())
+        items.append((k, v))
+    return tuple(items)
+
+def _set_counters(obj, i):
+    """
+    Set the counters of all variations and rotations of a source, detector or particle model (including particle models that are part of it, e.g. the unit cell of a crystal) to ``i``
+    """
+    for v in obj.__dict__.values():
+        if isinstance(v, (Variation, Rotations)):
+            v.set_counter(i)
+        elif isinstance(v, condor.particle.particle_abstract.AbstractParticle):
+            _set_counters(v, i)
+
+def _get_pattern_key(D_source, D_particles, D_detector, get_instance_key=id):
+    """
+    Return a hashable key that is equal for shots with the same noise-free pattern (see :func:`_get_form_factor_key` for ``get_instance_key``)
+    """
+    k_source = (D_source["pulse_energy"], D_source["wavelength"])
+    k_particles = tuple([(k, _get_form_factor_key(D_particles[k], exclude=("intensity", "F0"), get_instance_key=get_instance_key)) for k in sorted(D_particles.keys())])
+    k_detector = tuple(sorted(D_detector.items()))
+    return (k_source, k_particles, k_detector)
+
 def remove_from_dict(D, startswith="_"):
     for k,v in D.items():
         if k.startswith(startswith):
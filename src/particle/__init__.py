@@ -2,3 +2,7 @@ from particle_sphere import ParticleSphere
 from particle_spheroid import ParticleSpheroid
 from particle_map import ParticleMap
 from particle_atoms import ParticleAtoms
+from particle_beads import ParticleBeads
+from particle_radial import ParticleRadial
+from particle_cylinder import ParticleCylinder
+from particle_crystal import ParticleCrystal
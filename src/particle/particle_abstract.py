@@ -48,6 +48,7 @@ from scipy import constants
 import condor
 from condor.utils.material import AtomDensityMaterial, ElectronDensityMaterial
 from condor.utils.variation import Variation
+from condor.utils.rng import get_random_state
 
 import condor.utils.diffraction
 
@@ -85,25 +86,53 @@ class AbstractParticle:
         self.number = number
         self.arrival = arrival
 
-    def get_next_number_of_particles(self):
+    def get_next_number_of_particles(self, n=None):
         """
         Iterate the number of partices
+
+        Kwargs:
+          :n (int): If not ``None`` the numbers of particles of ``n`` shots are returned as an integer array of length ``n`` (default ``None``)
         """
         if self.arrival == "random":
-            return int(numpy.random.poisson(self.number))
+            if n is None:
+                return int(get_random_state().poisson(self.number))
+            else:
+                return get_random_state().poisson(self.number, n).astype(numpy.int64)
         elif self.arrival == "synchronised":
-            return int(numpy.round(self.number))
+            if n is None:
+                return int(numpy.round(self.number))
+            else:
+                return numpy.repeat(numpy.int64(numpy.round(self.number)), n)
         else:
             log_and_raise_error(logger, "self.arrival=%s is invalid. Has to be either \'synchronised\' or \'random\'." % self.arrival)
         
-    def get_next(self):
+    def get_next(self, values=None):
         """
         Iterate the parameters of the Particle instance and return them as a dictionary
+
+        Kwargs:
+          :values (dict): Parameters of this particle that were drawn in advance (see :meth:`condor.particle.particle_abstract.AbstractParticle.get_next_batch`). If ``None`` the parameters are drawn (default ``None``)
         """
         O = {}
         O["_class_instance"]      = self
-        O["extrinsic_quaternion"] = self._get_next_extrinsic_rotation().get_as_quaternion()
-        O["position"]             = self._get_next_position()
+        if values is None:
+            O["extrinsic_quaternion"] = self._get_next_extrinsic_rotation().get_as_quaternion()
+            O["position"]             = self._get_next_position()
+        else:
+            O["extrinsic_quaternion"] = values["extrinsic_quaternion"]
+            O["position"]             = values["position"]
+        return O
+
+    def get_next_batch(self, n):
+        """
+        Iterate the varying parameters of ``n`` particles at once and return them as a dictionary of arrays of length ``n``
+
+        Args:
+          :n (int): Number of particles
+        """
+        O = {}
+        O["extrinsic_quaternion"] = self._get_next_extrinsic_quaternions(n)
+        O["position"]             = numpy.asarray(self._get_next_position(n), dtype=numpy.float64).reshape((n, 3))
         return O
 
     def get_current_rotation(self):
@@ -163,15 +192,21 @@ class AbstractParticle:
             rotation.invert()
         return rotation
 
-    def _get_next_position(self):
-        return self._position_variation.get(self.position_mean)
+    def _get_next_extrinsic_quaternions(self, n):
+        q = self._rotations.get_next_quaternions(n)
+        if self._rotation_mode == "intrinsic":
+            q[:,1:] = -q[:,1:]
+        return q
+
+    def _get_next_position(self, n=None):
+        return self._position_variation.get(self.position_mean, n)
     
     def get_conf(self):
         """
         Get configuration in form of a dictionary
         """
         conf = {}
-        conf.update(self._get_conf_rotation())
+        conf.update(self._get_conf_alignment())
         conf.update(self._get_conf_position_variation())
         conf["number"] = self.number
         conf["arrival"]        = self.arrival
@@ -189,7 +224,7 @@ class AbstractParticle:
     def _get_conf_position_variation(self):
         A = {
             "position_variation":        self._position_variation.get_mode(),
-            "position_variation_spread": self._position_variation.get_spread(),
+            "position_spread":           self._position_variation.get_spread(),
             "position_variation_n":      self._position_variation.n
         }
         return A
@@ -267,12 +302,26 @@ class AbstractContinuousParticle(AbstractParticle):
         conf.update(self._get_material_conf())
         return conf
         
-    def get_next(self):
+    def get_next(self, values=None):
         """
         Iterate the parameters of the Particle instance and return them as a dictionary
+
+        Kwargs:
+          :values (dict): See :meth:`condor.particle.particle_abstract.AbstractParticle.get_next` (default ``None``)
+        """
+        O = AbstractParticle.get_next(self, values)
+        O["diameter"] = self._get_next_diameter() if values is None else values["diameter"]
+        return O
+
+    def get_next_batch(self, n):
+        """
+        Iterate the varying parameters of ``n`` particles at once and return them as a dictionary of arrays of length ``n``
+
+        Args:
+          :n (int): Number of particles
         """
-        O = AbstractParticle.get_next(self)
-        O["diameter"] = self._get_next_diameter()
+        O = AbstractParticle.get_next_batch(self, n)
+        O["diameter"] = numpy.asarray(self._get_next_diameter(n), dtype=numpy.float64)
         return O
 
     def set_diameter_variation(self, diameter_variation, diameter_spread, diameter_variation_n):
@@ -301,19 +350,23 @@ class AbstractContinuousParticle(AbstractParticle):
         """
         self._diameter_variation = Variation(diameter_variation, diameter_spread, diameter_variation_n)       
 
-    def _get_next_diameter(self):
-        d = self._diameter_variation.get(self.diameter_mean)
+    def _get_next_diameter(self, n=None):
+        d = self._diameter_variation.get(self.diameter_mean, n)
         # Non-random diameter
         if self._diameter_variation._mode in [None,"range"]:
-            if d <= 0:
+            if numpy.any(d <= 0):
                 log_and_raise_error(logger,"Sample diameter smaller-equals zero. Change your configuration.")
             else:
                 return d
         # Random diameter
         else:
-            if d <= 0.:
+            if numpy.any(d <= 0.):
                 log_warning(logger, "Sample diameter smaller-equals zero. Try again.")
-                return self._get_next_diameter()
+                if n is None:
+                    return self._get_next_diameter()
+                else:
+                    d[d <= 0.] = self._get_next_diameter((d <= 0.).sum())
+                    return d
             else:
                 return d
 
@@ -33,6 +33,7 @@
 import os,sys
 import numpy
 import tempfile
+from scipy import constants
 
 import logging
 logger = logging.getLogger(__name__)
@@ -40,6 +41,8 @@ logger = logging.getLogger(__name__)
 import condor
 import condor.utils.log
 from condor.utils.log import log_and_raise_error,log_warning,log_info,log_debug
+import condor.utils.material
+import condor.utils.bodies
 
 from particle_abstract import AbstractParticle
 
@@ -77,19 +80,25 @@ class ParticleAtoms(AbstractParticle):
       :position_spread (float): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_position_variation` (default ``None``)
 
       :position_variation_n (int): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_position_variation` (default ``None``)
+
+      :as_map (bool): If ``True`` the atoms are gridded to a refractive index map (see :meth:`get_dn_map`) and the diffraction pattern is calculated with the NFFT like for :class:`condor.particle.particle_map.ParticleMap` instead of summing up the contributions of all atoms with spsim (default ``False``)
+
+      :map_oversampling (float): Oversampling of the gridded map with respect to the resolution that is required by the detector. Takes only effect if ``as_map=True`` (default ``2.``)
     """
     def __init__(self,
                  pdb_filename = None, pdb_id = None,
                  atomic_numbers = None, atomic_positions = None,
                  rotation_values = None, rotation_formalism = None, rotation_mode = "extrinsic",
                  number = 1., arrival = "synchronised",
-                 position = None,  position_variation = None, position_spread = None, position_variation_n = None):
-        try:
-            import spsim
-        except Exception,e:
-            print str(e)
-            log_and_raise_error(logger, "Cannot import spsim module. This module is necessary to simulate diffraction for particle model of discrete atoms. Please install spsim from https://github.com/FilipeMaia/spsim and try again.")
-            return
+                 position = None,  position_variation = None, position_spread = None, position_variation_n = None,
+                 as_map = False, map_oversampling = 2.):
+        if not as_map or pdb_filename is not None or pdb_id is not None:
+            try:
+                import spsim
+            except Exception,e:
+                print str(e)
+                log_and_raise_error(logger, "Cannot import spsim module. This module is necessary to simulate diffraction for particle model of discrete atoms. Please install spsim from https://github.com/FilipeMaia/spsim and try again.")
+                return
         # Initialise base class
         AbstractParticle.__init__(self,
                                   rotation_values=rotation_values, rotation_formalism=rotation_formalism, rotation_mode=rotation_mode,                                            
@@ -99,6 +108,9 @@ class ParticleAtoms(AbstractParticle):
         self._atomic_numbers    = None
         self._pdb_filename      = None
         self._diameter_mean    = None
+        self.as_map            = as_map
+        self.map_oversampling  = map_oversampling
+        self._cache            = {}
         if pdb_filename is not None:
             log_debug(logger, "Attempt reading atoms from PDB file %s." % pdb_filename)
             if (pdb_id is not None or atomic_numbers is not None or atomic_positions is not None):
@@ -132,9 +144,11 @@ class ParticleAtoms(AbstractParticle):
           P1 = condor.ParticleAtoms(**conf) # P1: new ParticleMolcule instance with the same configuration as P0  
         """
         conf = {}
-        conf.update(AbstractParticle.get_conf())
+        conf.update(AbstractParticle.get_conf(self))
         conf["atomic_numbers"]   = self.get_atomic_numbers()
         conf["atomic_positions"] = self.get_atomic_positions()
+        conf["as_map"]           = self.as_map
+        conf["map_oversampling"] = self.map_oversampling
         return conf
 
     def set_atoms_from_pdb_id(self, pdb_id):
@@ -179,6 +193,7 @@ class ParticleAtoms(AbstractParticle):
             log_and_raise_error(logger, "Cannot set atoms. atomic_numbers and atomic_positions have to have the same length")
         self._atomic_positions = numpy.array(atomic_positions)
         self._atomic_numbers   = numpy.array(atomic_numbers)
+        self._cache = {}
 
     def get_atomic_numbers(self):
         """
@@ -198,7 +213,7 @@ class ParticleAtoms(AbstractParticle):
         """
         Z = self.get_atomic_numbers()
         names = [condor.utils.material.atomic_names[z-1] for z in Z]
-        M = numpy.array([condor.utils.material.atomic_masses[n] for n in names], dtype=numpy.float64)
+        M = numpy.array([condor.utils.material.get_atomic_mass(n) for n in names], dtype=numpy.float64)
         return M
     
     def get_radius_of_gyration(self):
@@ -209,10 +224,10 @@ class ParticleAtoms(AbstractParticle):
 
         :math:`R_g = \fract{ \sqrt{ \sum_{i=0}^N{ \vec{r}_i-\vec{r}_{\text{COM}} } } }{ \sum_{i=0}^N{ m_i }}`
         """
-        M = self.get_atomic_masses()
+        M = self.get_atomic_standard_weights()
         r = self.get_atomic_positions()
         r_com = self.get_center_of_mass()
-        r_g = numpy.sqrt( (M*(r-r_com)**2).sum() / M.sum() )
+        r_g = numpy.sqrt( (M[:,numpy.newaxis]*(r-r_com)**2).sum() / M.sum() )
         return r_g
 
     def get_center_of_mass(self):
@@ -223,9 +238,9 @@ class ParticleAtoms(AbstractParticle):
 
         :math:`\vec{r}_{\text{COM}} = \frac{\sum_{i=0}^N{m_i \, \vec{r}_i}}{\sum_{i=0}^N{m_i}}`
         """
-        M = self.get_atomic_masses()
+        M = self.get_atomic_standard_weights()
         r = self.get_atomic_positions()
-        r_com = (r*M).sum() / M.sum()
+        r_com = (r*M[:,numpy.newaxis]).sum(axis=0) / M.sum()
         return r_com
             
     @property
@@ -234,14 +249,117 @@ class ParticleAtoms(AbstractParticle):
         Return the two times the radius of gyration as an estimate for the extent (diameter) of the atomic structure
         """
         self._diameter_mean = 2*self.get_radius_of_gyration()
+        return self._diameter_mean
             
-    def get_next(self):
+    def get_next(self, values=None):
         """
         Iterate the parameters and return them as a dictionary
+
+        Kwargs:
+          :values (dict): See :meth:`condor.particle.particle_abstract.AbstractParticle.get_next` (default ``None``)
         """
-        O = AbstractParticle.get_next(self)
+        O = AbstractParticle.get_next(self, values)
         O["particle_model"]   = "atoms"
         O["atomic_numbers"]   = self.get_atomic_numbers()
         O["atomic_positions"] = self.get_atomic_positions()
         return O
 
+
+    def get_atomic_kernel_widths(self):
+        r"""
+        Return the standard deviations of the Gaussian kernels that represent the electron clouds of the atoms in a gridded map
+
+        The width is approximated by the Thomas-Fermi screening length :math:`a_{TF} = 0.8853 \, a_0 \, Z^{-1/3}` with :math:`a_0` denoting the Bohr radius and :math:`Z` the atomic number
+        """
+        a_0 = constants.value("Bohr radius")
+        Z = numpy.float64(self.get_atomic_numbers())
+        return 0.8853 * a_0 * Z**(-1/3.)
+
+    def get_dn_map(self, dx, photon_wavelength):
+        r"""
+        Return the refractive index map (:math:`\delta n`) of the atoms gridded on a regular grid and its grid spacing
+
+        Every atom is represented by a Gaussian kernel that integrates to its complex forward scattering factor :math:`f_j` (Henke tables, see :func:`condor.utils.material.get_f_element`). The kernel width combines the electron cloud width (see :meth:`get_atomic_kernel_widths`) and the grid spacing :math:`dx`. The attenuation caused by the latter can be undone in Fourier space with :meth:`get_gridding_correction`.
+
+        .. math::
+
+          \delta n(\vec{r}) = \frac{r_0 \lambda^2}{2\pi} \sum_j f_j \, g_j(\vec{r}-\vec{r}_j)
+
+        The centre of mass of the atoms is placed at the voxel with index [*N*/2, *N*/2, *N*/2], which is the origin of the NFFT.
+
+        Args:
+          :dx (float): Grid spacing in unit meter
+
+          :photon_wavelength (float): Photon wavelength in unit meter
+        """
+        if self._cache.get("dx") == dx and self._cache.get("photon_wavelength") == photon_wavelength:
+            log_debug(logger, "No need for gridding the atoms again. Reading map from cache.")
+            return self._cache["map3d_dn"], dx
+        r_0 = constants.value("classical electron radius")
+        photon_energy_eV = constants.h*constants.c/photon_wavelength/constants.e
+        Z = self.get_atomic_numbers()
+        f = numpy.zeros(len(Z), dtype=numpy.complex128)
+        for z in numpy.unique(Z):
+            f[Z == z] = condor.utils.material.get_f_element(condor.utils.material.atomic_names[z-1], photon_energy_eV)
+        sigmas = numpy.sqrt(self.get_atomic_kernel_widths()**2 + dx**2) / dx
+        # Atomic positions in pixel with respect to the centre of mass in array order (z,y,x)
+        r = ((self.get_atomic_positions() - self.get_center_of_mass()) / dx)[:,::-1]
+        truncation = 3.
+        N = 2 * int(numpy.ceil(abs(r).max() + truncation*sigmas.max())) + 4
+        log_debug(logger, "Gridding %i atoms onto %i x %i x %i voxels (dx = %e m)." % (len(Z), N, N, N, dx))
+        m = condor.utils.bodies.make_gaussian_map(N, r + N/2, sigmas, f, truncation=truncation)
+        map3d_dn = r_0/(2*numpy.pi) * photon_wavelength**2 * m / dx**3
+        self._cache = {
+            "map3d_dn"          : map3d_dn,
+            "dx"                : dx,
+            "photon_wavelength" : photon_wavelength,
+        }
+        return map3d_dn, dx
+
+    def get_new_dn_map(self, O, dx_required, dx_suggested, photon_wavelength):
+        """
+        Return the gridded refractive index map and its grid spacing for a given resolution requirement (same interface as :meth:`condor.particle.particle_map.ParticleMap.get_new_dn_map`)
+
+        The grid spacing is the smaller one of ``dx_required`` and ``dx_suggested`` divided by ``map_oversampling``.
+
+        Args:
+          :O (dict): Parameter dictionary as returned from :meth:`get_next`
+
+          :dx_required (float): Required resolution (grid spacing) of the map
+
+          :dx_suggested (float): Suggested resolution (grid spacing) of the map
+
+          :photon_wavelength (float): Photon wavelength in unit meter
+        """
+        dx = min([dx_required, dx_suggested]) / self.map_oversampling
+        if self._cache.get("photon_wavelength") == photon_wavelength and self._cache.get("dx") <= dx:
+            dx = self._cache["dx"]
+        return self.get_dn_map(dx, photon_wavelength)
+
+    def get_gridding_correction(self, q, dx):
+        r"""
+        Return the factor that compensates the attenuation of the Fourier amplitudes caused by the grid part of the Gaussian kernels (see :meth:`get_dn_map`)
+
+        Args:
+          :q (float/array): Length of the scattering vector in unit inverse meter
+
+          :dx (float): Grid spacing of the map in unit meter
+        """
+        return numpy.exp(0.5*(q*dx)**2)
+
+    def get_particle_map(self, dx, photon_wavelength):
+        """
+        Return a :class:`condor.particle.particle_map.ParticleMap` instance with the gridded refractive index map of the atoms (see :meth:`get_dn_map`)
+
+        Rotation, number and position parameters are copied from this instance.
+
+        Args:
+          :dx (float): Grid spacing in unit meter
+
+          :photon_wavelength (float): Photon wavelength in unit meter
+        """
+        map3d_dn, dx = self.get_dn_map(dx, photon_wavelength)
+        return condor.ParticleMap(geometry="custom", map3d=map3d_dn, dx=dx, material_type=None,
+                                  rotation_values=self._rotations.get_all_values(), rotation_formalism=self._rotations.get_formalism(), rotation_mode=self._rotation_mode,
+                                  number=self.number, arrival=self.arrival, position=self.position_mean,
+                                  position_variation=self._position_variation.get_mode(), position_spread=self._position_variation.get_spread(), position_variation_n=self._position_variation.n)
@@ -0,0 +1,178 @@
+# -----------------------------------------------------------------------------------------------------
+# CONDOR
+# Simulator for diffractive single-particle imaging experiments with X-ray lasers
+# http://xfel.icm.uu.se/condor/
+# -----------------------------------------------------------------------------------------------------
+# Copyright 2016 Max Hantke, Filipe R.N.C. Maia, Tomas Ekeberg
+# Condor is distributed under the terms of the BSD 2-Clause License
+# -----------------------------------------------------------------------------------------------------
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------------------------------
+# General note:
+# All variables are in SI units by default. Exceptions explicit by variable name.
+# -----------------------------------------------------------------------------------------------------
+
+import numpy
+
+import logging
+logger = logging.getLogger(__name__)
+
+import condor
+import condor.utils.log
+from condor.utils.log import log_and_raise_error,log_warning,log_info,log_debug
+
+from particle_abstract import AbstractParticle
+
+class ParticleBeads(AbstractParticle):
+    r"""
+    Class for a particle model
+
+    *Model:* Coarse-grained structure of Gaussian beads (for example residues or subunits)
+
+    Every bead is represented by an isotropic Gaussian electron density with the standard deviation :math:`\sigma_j = R_j/\sqrt{5}`, which matches the radius of gyration of a uniform sphere with radius :math:`R_j`. The scattering amplitude is calculated analytically (see :func:`condor.utils.bead_diffraction.F_bead_diffraction`).
+
+    Args:
+      :bead_positions (array): Bead centres [*x*, *y*, *z*] in unit meter with respect to the particle origin. Array shape: (:math:`N`, 3,) with :math:`N` denoting the number of beads
+
+      :bead_radii (float/array): Bead radii :math:`R_j` in unit meter. Array shape: (:math:`N`,)
+
+      :bead_electrons (array): Number of electrons of each bead. Array shape: (:math:`N`,)
+
+    Kwargs:
+      :rotation_values (array): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_alignment` (default ``None``)
+
+      :rotation_formalism (str): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_alignment` (default ``None``)
+
+      :rotation_mode (str): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_alignment` (default ``None``)
+
+      :number (float): Expectation value for the number of particles in the interaction volume. (defaukt ``1.``)
+
+      :arrival (str): Arrival of particles at the interaction volume can be either ``'random'`` or ``'synchronised'``. If ``sync`` at every event the number of particles in the interaction volume equals the rounded value of ``number``. If ``'random'`` the number of particles is Poissonian and ``number`` is the expectation value. (default ``'synchronised'``)
+
+      :position (array): See :class:`condor.particle.particle_abstract.AbstractParticle` (default ``None``)
+
+      :position_variation (str): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_position_variation` (default ``None``)
+
+      :position_spread (float): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_position_variation` (default ``None``)
+
+      :position_variation_n (int): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_position_variation` (default ``None``)
+    """
+    def __init__(self,
+                 bead_positions, bead_radii, bead_electrons,
+                 rotation_values = None, rotation_formalism = None, rotation_mode = "extrinsic",
+                 number = 1., arrival = "synchronised",
+                 position = None,  position_variation = None, position_spread = None, position_variation_n = None):
+        # Initialise base class
+        AbstractParticle.__init__(self,
+                                  rotation_values=rotation_values, rotation_formalism=rotation_formalism, rotation_mode=rotation_mode,
+                                  number=number, arrival=arrival,
+                                  position=position, position_variation=position_variation, position_spread=position_spread, position_variation_n=position_variation_n)
+        self.set_beads(bead_positions, bead_radii, bead_electrons)
+
+    def get_conf(self):
+        """
+        Get configuration in form of a dictionary. Another identically configured ParticleBeads instance can be initialised by:
+
+        .. code-block:: python
+
+          conf = P0.get_conf()              # P0: already existing ParticleBeads instance
+          P1 = condor.ParticleBeads(**conf) # P1: new ParticleBeads instance with the same configuration as P0  
+        """
+        conf = {}
+        conf.update(AbstractParticle.get_conf(self))
+        conf["bead_positions"] = self.get_bead_positions()
+        conf["bead_radii"]     = self.get_bead_radii()
+        conf["bead_electrons"] = self.get_bead_electrons()
+        return conf
+
+    def set_beads(self, bead_positions, bead_radii, bead_electrons):
+        """
+        Specify the beads
+
+        Args:
+          :bead_positions (array): See :class:`condor.particle.particle_beads.ParticleBeads`
+
+          :bead_radii (float/array): See :class:`condor.particle.particle_beads.ParticleBeads`
+
+          :bead_electrons (array): See :class:`condor.particle.particle_beads.ParticleBeads`
+        """
+        positions = numpy.array(bead_positions, dtype=numpy.float64)
+        if positions.ndim != 2 or positions.shape[1] != 3:
+            log_and_raise_error(logger, "Cannot set beads. bead_positions has to be an array of shape (N, 3).")
+            return
+        N = len(positions)
+        radii     = numpy.array(bead_radii, dtype=numpy.float64) * numpy.ones(N)
+        electrons = numpy.array(bead_electrons) * numpy.ones(N)
+        if len(radii) != N or len(electrons) != N:
+            log_and_raise_error(logger, "Cannot set beads. bead_positions, bead_radii and bead_electrons have to have the same length.")
+            return
+        if (radii < 0).any():
+            log_and_raise_error(logger, "Cannot set beads. Bead radii have to be positive.")
+            return
+        self._bead_positions = positions
+        self._bead_radii     = radii
+        self._bead_electrons = electrons
+
+    def get_bead_positions(self):
+        """
+        Return the array of bead positions
+        """
+        return self._bead_positions.copy()
+
+    def get_bead_radii(self):
+        """
+        Return the array of bead radii
+        """
+        return self._bead_radii.copy()
+
+    def get_bead_electrons(self):
+        """
+        Return the array of the numbers of electrons per bead
+        """
+        return self._bead_electrons.copy()
+
+    def get_bead_sigmas(self):
+        r"""
+        Return the standard deviations :math:`\sigma_j = R_j/\sqrt{5}` of the Gaussian beads
+        """
+        return self._bead_radii / numpy.sqrt(5.)
+
+    @property
+    def diameter_mean(self):
+        """
+        Return the diameter of the smallest sphere around the particle origin that encloses all beads
+        """
+        r = numpy.sqrt((self._bead_positions**2).sum(axis=1))
+        return 2*(r + self._bead_radii).max()
+
+    def get_next(self, values=None):
+        """
+        Iterate the parameters and return them as a dictionary
+
+        Kwargs:
+          :values (dict): See :meth:`condor.particle.particle_abstract.AbstractParticle.get_next` (default ``None``)
+        """
+        O = AbstractParticle.get_next(self, values)
+        O["particle_model"] = "beads"
+        O["bead_positions"] = self.get_bead_positions()
+        O["bead_radii"]     = self.get_bead_radii()
+        O["bead_electrons"] = self.get_bead_electrons()
+        return O
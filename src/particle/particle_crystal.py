@@ -0,0 +1,201 @@
+# -----------------------------------------------------------------------------------------------------
+# CONDOR
+# Simulator for diffractive single-particle imaging experiments with X-ray lasers
+# http://xfel.icm.uu.se/condor/
+# -----------------------------------------------------------------------------------------------------
+# Copyright 2016 Max Hantke, Filipe R.N.C. Maia, Tomas Ekeberg
+# Condor is distributed under the terms of the BSD 2-Clause License
+# -----------------------------------------------------------------------------------------------------
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------------------------------
+# General note:
+# All variables are in SI units by default. Exceptions explicit by variable name.
+# -----------------------------------------------------------------------------------------------------
+
+import numpy
+
+import logging
+logger = logging.getLogger(__name__)
+
+import condor
+import condor.utils.log
+from condor.utils.log import log_and_raise_error,log_warning,log_info,log_debug
+import condor.utils.lattice_diffraction
+
+from particle_abstract import AbstractParticle
+
+class ParticleCrystal(AbstractParticle):
+    r"""
+    Class for a particle model
+
+    *Model:* Finite crystal of identical unit cells
+
+    The unit cell is described by any other particle model instance. Its scattering amplitude is calculated only once per pattern and multiplied by the lattice factor of the crystal (see :func:`condor.utils.lattice_diffraction.F_lattice_diffraction`), which is evaluated in closed form with Laue functions or - for crystals with an arbitrary shape - with the NFFT of an occupancy mask. The lattice points are centred around the position of the crystal. The rotation of the unit cell particle is applied in the frame of the lattice before the rotation of the crystal.
+
+    Args:
+      :unit_cell: Particle model instance that represents the content of one unit cell (for example :class:`condor.particle.particle_map.ParticleMap`)
+
+      :lattice_vectors (array): Lattice vectors :math:`\vec{a}`, :math:`\vec{b}`, :math:`\vec{c}` [*x*, *y*, *z*] in unit meter as rows of a 3 x 3 array. A length-3 array is interpreted as the edge lengths of an orthorhombic unit cell
+
+    Kwargs:
+      :shape (array): Number of unit cells :math:`[N_a, N_b, N_c]` along the lattice vectors. A single integer is used for all three dimensions. If ``None`` the shape of ``mask`` is used (default ``None``)
+
+      :mask (array): Boolean occupancy mask of the lattice that defines the crystal shape. If ``None`` all unit cells of the :math:`N_a \times N_b \times N_c` block are occupied (default ``None``)
+
+      :rotation_values (array): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_alignment` (default ``None``)
+
+      :rotation_formalism (str): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_alignment` (default ``None``)
+
+      :rotation_mode (str): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_alignment` (default ``None``)
+
+      :number (float): Expectation value for the number of particles in the interaction volume. (defaukt ``1.``)
+
+      :arrival (str): Arrival of particles at the interaction volume can be either ``'random'`` or ``'synchronised'``. If ``sync`` at every event the number of particles in the interaction volume equals the rounded value of ``number``. If ``'random'`` the number of particles is Poissonian and ``number`` is the expectation value. (default ``'synchronised'``)
+
+      :position (array): See :class:`condor.particle.particle_abstract.AbstractParticle` (default ``None``)
+
+      :position_variation (str): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_position_variation` (default ``None``)
+
+      :position_spread (float): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_position_variation` (default ``None``)
+
+      :position_variation_n (int): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_position_variation` (default ``None``)
+    """
+    def __init__(self,
+                 unit_cell, lattice_vectors, shape = None, mask = None,
+                 rotation_values = None, rotation_formalism = None, rotation_mode = "extrinsic",
+                 number = 1., arrival = "synchronised",
+                 position = None,  position_variation = None, position_spread = None, position_variation_n = None):
+        # Initialise base class
+        AbstractParticle.__init__(self,
+                                  rotation_values=rotation_values, rotation_formalism=rotation_formalism, rotation_mode=rotation_mode,
+                                  number=number, arrival=arrival,
+                                  position=position, position_variation=position_variation, position_spread=position_spread, position_variation_n=position_variation_n)
+        if not isinstance(unit_cell, AbstractParticle) or isinstance(unit_cell, ParticleCrystal):
+            log_and_raise_error(logger, "Cannot initialise crystal. The unit cell has to be a particle model instance other than ParticleCrystal.")
+            return
+        self.unit_cell = unit_cell
+        self.set_lattice(lattice_vectors=lattice_vectors, shape=shape, mask=mask)
+
+    def get_conf(self):
+        """
+        Get configuration in form of a dictionary. Another identically configured ParticleCrystal instance can be initialised by:
+
+        .. code-block:: python
+
+          conf = P0.get_conf()                # P0: already existing ParticleCrystal instance
+          P1 = condor.ParticleCrystal(**conf) # P1: new ParticleCrystal instance with the same configuration as P0  
+        """
+        conf = {}
+        conf.update(AbstractParticle.get_conf(self))
+        conf["unit_cell"]       = self.unit_cell
+        conf["lattice_vectors"] = self.lattice_vectors.copy()
+        conf["shape"]           = list(self.shape)
+        conf["mask"]            = None if self.mask is None else self.mask.copy()
+        return conf
+
+    def set_lattice(self, lattice_vectors, shape = None, mask = None):
+        """
+        Set the lattice of the crystal
+
+        Args:
+          :lattice_vectors (array): See :class:`condor.particle.particle_crystal.ParticleCrystal`
+
+        Kwargs:
+          :shape (array): See :class:`condor.particle.particle_crystal.ParticleCrystal` (default ``None``)
+
+          :mask (array): See :class:`condor.particle.particle_crystal.ParticleCrystal` (default ``None``)
+        """
+        A = numpy.array(lattice_vectors, dtype=numpy.float64)
+        if A.shape == (3,):
+            A = numpy.diag(A)
+        if A.shape != (3, 3):
+            log_and_raise_error(logger, "Cannot set lattice. lattice_vectors has to be an array of shape (3, 3) or (3,).")
+            return
+        if abs(numpy.linalg.det(A)) == 0.:
+            log_and_raise_error(logger, "Cannot set lattice. The lattice vectors are linearly dependent.")
+            return
+        if mask is not None:
+            mask = numpy.array(mask, dtype=numpy.bool)
+            if mask.ndim != 3:
+                log_and_raise_error(logger, "Cannot set lattice. The mask has to be a 3D array.")
+                return
+            if shape is not None and not numpy.all(numpy.array(shape)*numpy.ones(3, dtype=numpy.int) == numpy.array(mask.shape)):
+                log_and_raise_error(logger, "Cannot set lattice. The shape %s does not match the shape of the mask %s." % (str(shape), str(mask.shape)))
+                return
+            shape = mask.shape
+        elif shape is None:
+            log_and_raise_error(logger, "Cannot set lattice. Either shape or mask has to be specified.")
+            return
+        shape = numpy.array(shape, dtype=numpy.int) * numpy.ones(3, dtype=numpy.int)
+        if (shape < 1).any():
+            log_and_raise_error(logger, "Cannot set lattice. The number of unit cells has to be positive in all dimensions.")
+            return
+        self.lattice_vectors = A
+        self.shape = tuple(shape)
+        self.mask = mask
+
+    def get_number_of_unit_cells(self):
+        """
+        Return the number of occupied unit cells
+        """
+        if self.mask is None:
+            return int(numpy.prod(self.shape))
+        else:
+            return int(self.mask.sum())
+
+    @property
+    def diameter_mean(self):
+        """
+        Return the length of the diagonal of the crystal block as an estimate for the extent (diameter) of the crystal
+        """
+        return numpy.sqrt(((numpy.array(self.shape)[:,numpy.newaxis] * self.lattice_vectors).sum(axis=0)**2).sum())
+
+    def get_lattice_factor(self, qmap, extrinsic_rotation=None):
+        """
+        Return the lattice factor for the given scattering vectors (see :func:`condor.utils.lattice_diffraction.F_lattice_diffraction`)
+
+        Args:
+          :qmap (array): Scattering vectors [*qx*, *qy*, *qz*] in unit inverse meter. Array shape: (..., 3)
+
+        Kwargs:
+          :extrinsic_rotation (:class:`condor.utils.rotation.Rotation`): Extrinsic rotation of the crystal. If ``None`` no rotation is applied (default ``None``)
+        """
+        return condor.utils.lattice_diffraction.F_lattice_diffraction(qmap, self.lattice_vectors, self.shape, mask=self.mask, extrinsic_rotation=extrinsic_rotation)
+
+    def get_next(self, values=None):
+        """
+        Iterate the parameters and return them as a dictionary
+
+        Kwargs:
+          :values (dict): See :meth:`condor.particle.particle_abstract.AbstractParticle.get_next` (default ``None``)
+        """
+        O = AbstractParticle.get_next(self, values)
+        O["particle_model"]  = "crystal"
+        O["unit_cell"]       = self.unit_cell.get_next()
+        O["lattice_vectors"] = self.lattice_vectors.copy()
+        O["shape"]           = self.shape
+        return O
+
+    def get_next_batch(self, n):
+        """
+        Not supported for crystals because the parameters of the unit cell are iterated by the unit cell particle
+        """
+        log_and_raise_error(logger, "Parameters of crystal particles cannot be drawn in advance.")
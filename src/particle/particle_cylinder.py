@@ -0,0 +1,209 @@
+# -----------------------------------------------------------------------------------------------------
+# CONDOR
+# Simulator for diffractive single-particle imaging experiments with X-ray lasers
+# http://xfel.icm.uu.se/condor/
+# -----------------------------------------------------------------------------------------------------
+# Copyright 2016 Max Hantke, Filipe R.N.C. Maia, Tomas Ekeberg
+# Condor is distributed under the terms of the BSD 2-Clause License
+# -----------------------------------------------------------------------------------------------------
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------------------------------
+# General note:
+# All variables are in SI units by default. Exceptions explicit by variable name.
+# -----------------------------------------------------------------------------------------------------
+
+import numpy
+
+import logging
+logger = logging.getLogger(__name__)
+
+import condor
+import condor.utils.log
+from condor.utils.log import log_and_raise_error,log_warning,log_info,log_debug
+
+from particle_abstract import AbstractContinuousParticle
+
+from condor.utils.variation import Variation
+
+
+class ParticleCylinder(AbstractContinuousParticle):
+    """
+    Class for a particle model
+
+    *Model:* Uniformly filled finite cylinder (rod) particle (continuum approximation)
+
+    Before applying rotations the cylinder axis is parallel to the the *y*-axis
+
+    Args:
+      :diameter (float): (Mean) cylinder diameter in unit meter
+
+    Kwargs:
+      :length (float): (Mean) cylinder length in unit meter. If ``None`` the length is set equal to the diameter (default ``None``)
+
+      :length_variation (str): See :meth:`condor.particle.particle_cylinder.ParticleCylinder.set_length_variation` (default ``None``)
+
+      :length_spread (float): See :meth:`condor.particle.particle_cylinder.ParticleCylinder.set_length_variation` (default ``None``)
+    
+      :length_variation_n (int): See :meth:`condor.particle.particle_cylinder.ParticleCylinder.set_length_variation` (default ``None``)
+
+      :diameter_variation (str): See :meth:`condor.particle.particle_abstract.AbstractContinuousParticle.set_diameter_variation` (default ``None``)
+
+      :diameter_spread (float): See :meth:`condor.particle.particle_abstract.AbstractContinuousParticle.set_diameter_variation` (default ``None``)
+
+      :diameter_variation_n (int): See :meth:`condor.particle.particle_abstract.AbstractContinuousParticle.set_diameter_variation` (default ``None``)
+
+      :rotation_values (array): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_alignment` (default ``None``)
+
+      :rotation_formalism (str): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_alignment` (default ``None``)
+
+      :rotation_mode (str): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_alignment` (default ``None``)
+
+      :number (float): Expectation value for the number of particles in the interaction volume. (defaukt ``1.``)
+
+      :arrival (str): Arrival of particles at the interaction volume can be either ``'random'`` or ``'synchronised'``. If ``sync`` at every event the number of particles in the interaction volume equals the rounded value of ``number``. If ``'random'`` the number of particles is Poissonian and ``number`` is the expectation value. (default ``'synchronised'``)
+
+      :position (array): See :class:`condor.particle.particle_abstract.AbstractParticle` (default ``None``)
+
+      :position_variation (str): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_position_variation` (default ``None``)
+
+      :position_spread (float): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_position_variation` (default ``None``)
+
+      :position_variation_n (int): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_position_variation` (default ``None``)
+
+      :material_type (str): See :meth:`condor.particle.particle_abstract.AbstractContinuousParticle.set_material` (default ``\'water\'``)
+
+      :massdensity (float): See :meth:`condor.particle.particle_abstract.AbstractContinuousParticle.set_material` (default ``None``)
+
+      :atomic_composition (dict): See :meth:`condor.particle.particle_abstract.AbstractContinuousParticle.set_material` (default ``None``)
+
+      :electron_density (float): See :meth:`condor.particle.particle_abstract.AbstractContinuousParticle.set_material` (default ``None``)
+    """
+    def __init__(self,
+                 diameter,
+                 diameter_variation = None, diameter_spread = None, diameter_variation_n = None,
+                 length = None, length_variation = None, length_spread = None, length_variation_n = None,
+                 rotation_values = None, rotation_formalism = None, rotation_mode = "extrinsic",
+                 number = 1., arrival = "synchronised",
+                 position = None, position_variation = None, position_spread = None, position_variation_n = None,
+                 material_type = 'water', massdensity = None, atomic_composition = None, electron_density = None):
+
+        # Initialise base class
+        AbstractContinuousParticle.__init__(self,
+                                            diameter=diameter, diameter_variation=diameter_variation, diameter_spread=diameter_spread, diameter_variation_n=diameter_variation_n,
+                                            rotation_values=rotation_values, rotation_formalism=rotation_formalism, rotation_mode=rotation_mode,
+                                            number=number, arrival=arrival,
+                                            position=position, position_variation=position_variation, position_spread=position_spread, position_variation_n=position_variation_n,
+                                            material_type=material_type, massdensity=massdensity, atomic_composition=atomic_composition, electron_density=electron_density)
+        self.length_mean = length if length is not None else diameter
+        self.set_length_variation(length_variation=length_variation, length_spread=length_spread, length_variation_n=length_variation_n)
+
+    def get_conf(self):
+        """
+        Get configuration in form of a dictionary. Another identically configured ParticleCylinder instance can be initialised by:
+
+        .. code-block:: python
+
+          conf = P0.get_conf()                 # P0: already existing ParticleCylinder instance
+          P1 = condor.ParticleCylinder(**conf) # P1: new ParticleCylinder instance with the same configuration as P0  
+        """
+        conf = {}
+        conf.update(AbstractContinuousParticle.get_conf(self))
+        conf["length"] = self.length_mean
+        lvar = self._length_variation.get_conf()
+        conf["length_variation"] = lvar["mode"]
+        conf["length_spread"] = lvar["spread"]
+        conf["length_variation_n"] = lvar["n"]
+        return conf
+        
+    def get_next(self, values=None):
+        """
+        Iterate the parameters and return them as a dictionary
+
+        Kwargs:
+          :values (dict): See :meth:`condor.particle.particle_abstract.AbstractParticle.get_next` (default ``None``)
+        """
+        O = AbstractContinuousParticle.get_next(self, values)
+        O["particle_model"] = "cylinder"
+        O["length"] = self._get_next_length() if values is None else values["length"]
+        return O
+
+    def get_next_batch(self, n):
+        """
+        Iterate the varying parameters of ``n`` particles at once and return them as a dictionary of arrays of length ``n``
+
+        Args:
+          :n (int): Number of particles
+        """
+        O = AbstractContinuousParticle.get_next_batch(self, n)
+        O["length"] = numpy.asarray(self._get_next_length(n), dtype=numpy.float64)
+        return O
+        
+    def set_length_variation(self, length_variation, length_spread, length_variation_n):
+        """
+        Set the variation scheme of the cylinder length
+        
+        Args:
+          :length_variation (str): Variation of the cylinder length
+
+            *Choose one of the following options:*
+              
+              - ``None`` - No variation
+
+              - ``\'normal\'`` - Normal (*Gaussian*) variation
+
+              - ``\'uniform\'`` - Uniformly distributed lengths
+
+              - ``\'range\'`` - Equidistant sequence of cylinder-length samples within the spread limits. ``length_variation_n`` defines the number of samples within the range
+
+          :length_spread (float): Statistical spread of the parameter
+
+          :length_variation_n (int): Number of cylinder-length samples within the specified range
+
+            .. note:: The argument ``length_variation_n`` takes effect only if ``length_variation=\'range\'``
+        """
+        self._length_variation = Variation(length_variation, length_spread, length_variation_n)       
+
+    def _get_next_length(self, n=None):
+        l = self._length_variation.get(self.length_mean, n)
+        # Non-random 
+        if self._length_variation._mode in [None, "range"]:
+            if numpy.any(l <= 0):
+                log_and_raise_error(logger, "Cylinder length smaller-equals zero. Change your configuration.")
+            else:
+                return l
+        # Random 
+        else:
+            if numpy.any(l <= 0.):
+                log_warning(logger, "Cylinder length smaller-equals zero. Try again.")
+                if n is None:
+                    return self._get_next_length()
+                else:
+                    l[l <= 0.] = self._get_next_length((l <= 0.).sum())
+                    return l
+            else:
+                return l
+
+    def get_dn(self, photon_wavelength):
+        if self.materials is None:
+            dn = 0.
+        else:
+            dn = numpy.array([m.get_dn(photon_wavelength) for m in self.materials]).sum()
+        return dn
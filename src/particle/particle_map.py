@@ -151,6 +151,8 @@ class ParticleMap(AbstractContinuousParticle):
 
         # Init chache
         self._cache = {}
+        self.n_cache_hits            = 0
+        self.n_cache_misses          = 0
         self._dx_orig                = None
         self._map3d_orig             = None
 
@@ -212,11 +214,14 @@ class ParticleMap(AbstractContinuousParticle):
             conf["flattening"] = self.flattening
         return conf
 
-    def get_next(self):
+    def get_next(self, values=None):
         """
         Iterate the parameters and return them as a dictionary
+
+        Kwargs:
+          :values (dict): See :meth:`condor.particle.particle_abstract.AbstractParticle.get_next` (default ``None``)
         """
-        O = AbstractContinuousParticle.get_next(self)
+        O = AbstractContinuousParticle.get_next(self, values)
         O["particle_model"] = "map"
         O["geometry"]       = self.geometry
         if self.geometry == "spheroid":
@@ -444,6 +449,7 @@ class ParticleMap(AbstractContinuousParticle):
             
             if not self._is_map_in_cache(O, dx_required):
 
+                self.n_cache_misses += 1
                 dx = dx_suggested
                 n_mat = len(self.materials)
                 
@@ -476,6 +482,7 @@ class ParticleMap(AbstractContinuousParticle):
             else:
 
                 log_debug(logger, "No need for calculating a new map. Reading map from cache.")
+                self.n_cache_hits += 1
                 m  = self._cache["map3d"]
                 dx = self._cache["dx"]
 
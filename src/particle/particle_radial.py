@@ -0,0 +1,231 @@
+# -----------------------------------------------------------------------------------------------------
+# CONDOR
+# Simulator for diffractive single-particle imaging experiments with X-ray lasers
+# http://xfel.icm.uu.se/condor/
+# -----------------------------------------------------------------------------------------------------
+# Copyright 2016 Max Hantke, Filipe R.N.C. Maia, Tomas Ekeberg
+# Condor is distributed under the terms of the BSD 2-Clause License
+# -----------------------------------------------------------------------------------------------------
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------------------------------
+# General note:
+# All variables are in SI units by default. Exceptions explicit by variable name.
+# -----------------------------------------------------------------------------------------------------
+
+import numpy
+
+import logging
+logger = logging.getLogger(__name__)
+
+import condor
+import condor.utils.log
+from condor.utils.log import log_and_raise_error,log_warning,log_info,log_debug
+import condor.utils.sphere_diffraction
+
+from particle_abstract import AbstractContinuousParticle
+
+class ParticleRadial(AbstractContinuousParticle):
+    r"""
+    Class for a particle model
+
+    *Model:* Spherically symmetric particle with a radial refractive index profile (continuum approximation)
+
+    The profile is specified either by concentric uniform layers (for example core-shell particles) or by a sampled radial density. All radii are given relative to the particle radius and scale with the (varying) particle diameter. The form factor is calculated on a 1D table of :math:`q\cdot r` values with either :func:`condor.utils.sphere_diffraction.f_layered_sphere` or :func:`condor.utils.sphere_diffraction.f_radial_profile` and interpolated onto the detector.
+
+    Args:
+      :diameter (float): (Mean) outer particle diameter in unit meter
+
+    Kwargs:
+      :layer_radii (array): Outer radii of the layers relative to the particle radius in increasing order (the last value should be ``1.``). The layers are made of the materials in the order specified by the material arguments, one material per layer. If ``None`` and no sampled profile is given the particle is a single uniform layer (default ``None``)
+
+      :profile_radii (array): Radii of the samples of the radial density profile relative to the particle radius in increasing order (default ``None``)
+
+      :profile_densities (array): Densities of the radial profile samples relative to the density of the material. If more than one material is specified the refractive index decrements of all materials are summed up like for :class:`condor.particle.particle_sphere.ParticleSphere` (default ``None``)
+
+      .. note:: Specify either ``layer_radii`` or ``profile_radii`` and ``profile_densities``.
+
+      :diameter_variation (str): See :meth:`condor.particle.particle_abstract.AbstractContinuousParticle.set_diameter_variation` (default ``None``)
+
+      :diameter_spread (float): See :meth:`condor.particle.particle_abstract.AbstractContinuousParticle.set_diameter_variation` (default ``None``)
+
+      :diameter_variation_n (int): See :meth:`condor.particle.particle_abstract.AbstractContinuousParticle.set_diameter_variation` (default ``None``)
+
+      :number (float): Expectation value for the number of particles in the interaction volume. (defaukt ``1.``)
+
+      :arrival (str): Arrival of particles at the interaction volume can be either ``'random'`` or ``'synchronised'``. If ``sync`` at every event the number of particles in the interaction volume equals the rounded value of ``number``. If ``'random'`` the number of particles is Poissonian and ``number`` is the expectation value. (default ``'synchronised'``)
+
+      :position (array): See :class:`condor.particle.particle_abstract.AbstractParticle` (default ``None``)
+
+      :position_variation (str): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_position_variation` (default ``None``)
+
+      :position_spread (float): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_position_variation` (default ``None``)
+
+      :position_variation_n (int): See :meth:`condor.particle.particle_abstract.AbstractParticle.set_position_variation` (default ``None``)
+
+      :material_type (str/list): See :meth:`condor.particle.particle_abstract.AbstractContinuousParticle.set_material` (default ``\'water\'``)
+
+      :massdensity (float/list): See :meth:`condor.particle.particle_abstract.AbstractContinuousParticle.set_material` (default ``None``)
+
+      :atomic_composition (dict/list): See :meth:`condor.particle.particle_abstract.AbstractContinuousParticle.set_material` (default ``None``)
+
+      :electron_density (float/list): See :meth:`condor.particle.particle_abstract.AbstractContinuousParticle.set_material` (default ``None``)
+    """
+    def __init__(self,
+                 diameter, layer_radii = None, profile_radii = None, profile_densities = None,
+                 diameter_variation = None, diameter_spread = None, diameter_variation_n = None,
+                 number = 1., arrival = "synchronised",
+                 position = None, position_variation = None, position_spread = None, position_variation_n = None,
+                 material_type = 'water', massdensity = None, atomic_composition = None, electron_density = None):
+
+        # Initialise base class
+        AbstractContinuousParticle.__init__(self,
+                                            diameter=diameter, diameter_variation=diameter_variation, diameter_spread=diameter_spread, diameter_variation_n=diameter_variation_n,
+                                            rotation_values=None, rotation_formalism=None, rotation_mode="extrinsic",
+                                            number=number, arrival=arrival,
+                                            position=position, position_variation=position_variation, position_spread=position_spread, position_variation_n=position_variation_n,
+                                            material_type=material_type, massdensity=massdensity, atomic_composition=atomic_composition, electron_density=electron_density)
+        self.set_profile(layer_radii=layer_radii, profile_radii=profile_radii, profile_densities=profile_densities)
+
+    def get_conf(self):
+        """
+        Get configuration in form of a dictionary. Another identically configured ParticleRadial instance can be initialised by:
+
+        .. code-block:: python
+
+          conf = P0.get_conf()               # P0: already existing ParticleRadial instance
+          P1 = condor.ParticleRadial(**conf) # P1: new ParticleRadial instance with the same configuration as P0  
+        """
+        conf = {}
+        conf.update(AbstractContinuousParticle.get_conf(self))
+        conf.pop("rotation_values")
+        conf.pop("rotation_formalism")
+        conf.pop("rotation_mode")
+        conf["layer_radii"]       = self.layer_radii
+        conf["profile_radii"]     = self.profile_radii
+        conf["profile_densities"] = self.profile_densities
+        return conf
+
+    def set_profile(self, layer_radii = None, profile_radii = None, profile_densities = None):
+        """
+        Set the radial profile of the particle
+
+        Args:
+          :layer_radii (array): See :class:`condor.particle.particle_radial.ParticleRadial` (default ``None``)
+
+          :profile_radii (array): See :class:`condor.particle.particle_radial.ParticleRadial` (default ``None``)
+
+          :profile_densities (array): See :class:`condor.particle.particle_radial.ParticleRadial` (default ``None``)
+        """
+        N_materials = 0 if self.materials is None else len(self.materials)
+        if layer_radii is not None:
+            if profile_radii is not None or profile_densities is not None:
+                log_and_raise_error(logger, "Radial profile is ambiguous. Specify either layer_radii or profile_radii and profile_densities.")
+                return
+            layer_radii = list(numpy.array(layer_radii, dtype=numpy.float64).ravel())
+            if len(layer_radii) != N_materials:
+                log_and_raise_error(logger, "Cannot set radial profile. The number of layers (%i) does not match the number of materials (%i)." % (len(layer_radii), N_materials))
+                return
+            if (numpy.diff(layer_radii) <= 0).any() or layer_radii[0] <= 0:
+                log_and_raise_error(logger, "Cannot set radial profile. Layer radii have to be positive and increasing.")
+                return
+        elif profile_radii is not None or profile_densities is not None:
+            if profile_radii is None or profile_densities is None:
+                log_and_raise_error(logger, "Cannot set radial profile. Both profile_radii and profile_densities have to be specified.")
+                return
+            profile_radii     = list(numpy.array(profile_radii, dtype=numpy.float64).ravel())
+            profile_densities = list(numpy.array(profile_densities, dtype=numpy.float64).ravel())
+            if len(profile_radii) != len(profile_densities) or len(profile_radii) < 2:
+                log_and_raise_error(logger, "Cannot set radial profile. profile_radii and profile_densities have to have the same length (at least 2).")
+                return
+            if (numpy.diff(profile_radii) <= 0).any() or profile_radii[0] < 0:
+                log_and_raise_error(logger, "Cannot set radial profile. Profile radii have to be positive and increasing.")
+                return
+        self.layer_radii       = layer_radii
+        self.profile_radii     = profile_radii
+        self.profile_densities = profile_densities
+        self._cache = {}
+
+    def get_next(self, values=None):
+        """
+        Iterate the parameters and return them as a dictionary
+
+        Kwargs:
+          :values (dict): See :meth:`condor.particle.particle_abstract.AbstractParticle.get_next` (default ``None``)
+        """
+        O = AbstractContinuousParticle.get_next(self, values)
+        O["particle_model"] = "radial"
+        return O
+
+    def get_dn(self, photon_wavelength):
+        """
+        Return the refractive index decrement of every layer (or the single refractive index decrement of the material of a sampled profile)
+
+        Args:
+          :photon_wavelength (float): Photon wavelength in unit meter
+        """
+        if self.materials is None:
+            return numpy.zeros(1 if self.layer_radii is None else len(self.layer_radii))
+        dn = numpy.array([m.get_dn(photon_wavelength) for m in self.materials])
+        if self.layer_radii is None:
+            dn = numpy.array([dn.sum()])
+        return dn
+
+    def get_form_factor(self, q, diameter, photon_wavelength):
+        r"""
+        Return the form factor :math:`f(q) = \int \delta n(\vec{r}) \, e^{-i \vec{q}\cdot\vec{r}} \, d^3r` in unit cubic meter
+
+        The form factor of the particle with radius :math:`R` is obtained from the tabulated form factor :math:`f_1` of the particle with unit radius by scaling, :math:`f_R(q) = R^3 f_1(qR)`. The table is cached and only extended if larger values of :math:`qR` are requested.
+
+        Args:
+          :q (float/array): Length of scattering vector in unit inverse meter
+
+          :diameter (float): Outer particle diameter in unit meter
+
+          :photon_wavelength (float): Photon wavelength in unit meter
+        """
+        R = diameter/2.
+        s = numpy.asarray(q)*R
+        s_max = s.max() if s.size > 0 else 0.
+        # Local reference, the table may be replaced concurrently when slabs are evaluated in threads
+        cache = self._cache
+        if cache.get("photon_wavelength") != photon_wavelength or cache.get("s_max", -1.) < s_max:
+            # Sampling well below the fringe spacing of the outermost surface (pi in units of s)
+            s_max = 1.5*s_max
+            ds = numpy.pi / 200.
+            s_table = numpy.linspace(0., s_max, int(numpy.ceil(s_max/ds))+2)
+            dn = self.get_dn(photon_wavelength)
+            if self.profile_radii is None:
+                radii = [1.] if self.layer_radii is None else self.layer_radii
+                f_table = condor.utils.sphere_diffraction.f_layered_sphere(s_table, radii, dn)
+            else:
+                f_table = condor.utils.sphere_diffraction.f_radial_profile(s_table, self.profile_radii, dn[0]*numpy.array(self.profile_densities))
+            log_debug(logger, "Tabulated radial form factor for %i values of qR up to %e." % (len(s_table), s_max))
+            cache = {
+                "photon_wavelength" : photon_wavelength,
+                "s_max"             : s_max,
+                "s_table"           : s_table,
+                "f_table"           : f_table,
+            }
+            self._cache = cache
+        s_table = cache["s_table"]
+        f_table = cache["f_table"]
+        f = numpy.interp(s, s_table, f_table.real) + 1.j*numpy.interp(s, s_table, f_table.imag)
+        return R**3 * f
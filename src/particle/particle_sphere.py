@@ -91,15 +91,18 @@ class ParticleSphere(AbstractContinuousParticle):
                                             position=position, position_variation=position_variation, position_spread=position_spread, position_variation_n=position_variation_n,
                                             material_type=material_type, massdensity=massdensity, atomic_composition=atomic_composition, electron_density=electron_density)
         
-    def get_next(self):
+    def get_next(self, values=None):
         """
         Iterate the parameters and return them as a dictionary
+
+        Kwargs:
+          :values (dict): See :meth:`condor.particle.particle_abstract.AbstractParticle.get_next` (default ``None``)
         """
-        O = AbstractContinuousParticle.get_next(self)
+        O = AbstractContinuousParticle.get_next(self, values)
         O["particle_model"] = "sphere"
         return O
 
-    def get_conf(sef):
+    def get_conf(self):
         """
         Get configuration in form of a dictionary. Another identically configured ParticleMap instance can be initialised by:
 
@@ -136,13 +136,27 @@ class ParticleSpheroid(AbstractContinuousParticle):
         conf["flattening_variation_n"] = fvar["n"]
         return conf
         
-    def get_next(self):
+    def get_next(self, values=None):
         """
         Iterate the parameters and return them as a dictionary
+
+        Kwargs:
+          :values (dict): See :meth:`condor.particle.particle_abstract.AbstractParticle.get_next` (default ``None``)
         """
-        O = AbstractContinuousParticle.get_next(self)
+        O = AbstractContinuousParticle.get_next(self, values)
         O["particle_model"] = "spheroid"
-        O["flattening"] = self._get_next_flattening()
+        O["flattening"] = self._get_next_flattening() if values is None else values["flattening"]
+        return O
+
+    def get_next_batch(self, n):
+        """
+        Iterate the varying parameters of ``n`` particles at once and return them as a dictionary of arrays of length ``n``
+
+        Args:
+          :n (int): Number of particles
+        """
+        O = AbstractContinuousParticle.get_next_batch(self, n)
+        O["flattening"] = numpy.asarray(self._get_next_flattening(n), dtype=numpy.float64)
         return O
         
     def set_flattening_variation(self, flattening_variation, flattening_spread, flattening_variation_n):
@@ -170,19 +184,23 @@ class ParticleSpheroid(AbstractContinuousParticle):
         """
         self._flattening_variation = Variation(flattening_variation, flattening_spread, flattening_variation_n)       
 
-    def _get_next_flattening(self):
-        f = self._flattening_variation.get(self.flattening_mean)
+    def _get_next_flattening(self, n=None):
+        f = self._flattening_variation.get(self.flattening_mean, n)
         # Non-random 
         if self._flattening_variation._mode in [None, "range"]:
-            if f <= 0:
+            if numpy.any(f <= 0):
                 log_and_raise_error(logger, "Spheroid flattening smaller-equals zero. Change your configuration.")
             else:
                 return f
         # Random 
         else:
-            if f <= 0.:
+            if numpy.any(f <= 0.):
                 log_warning(logger, "Spheroid flattening smaller-equals zero. Try again.")
-                return self._get_next_flattening()
+                if n is None:
+                    return self._get_next_flattening()
+                else:
+                    f[f <= 0.] = self._get_next_flattening((f <= 0.).sum())
+                    return f
             else:
                 return f
 
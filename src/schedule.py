@@ -0,0 +1,284 @@
+# -----------------------------------------------------------------------------------------------------
+# CONDOR
+# Simulator for diffractive single-particle imaging experiments with X-ray lasers
+# http://xfel.icm.uu.se/condor/
+# -----------------------------------------------------------------------------------------------------
+# Copyright 2016 Max Hantke, Filipe R.N.C. Maia, Tomas Ekeberg
+# Condor is distributed under the terms of the BSD 2-Clause License
+# -----------------------------------------------------------------------------------------------------
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------------------------------
+# General note:
+# All variables are in SI units by default. Exceptions explicit by variable name.
+# -----------------------------------------------------------------------------------------------------
+
+"""
+Shot parameters that are drawn in advance for all shots of a run
+"""
+
+import numpy
+
+import logging
+logger = logging.getLogger(__name__)
+
+from condor.utils.log import log_and_raise_error,log_warning,log_info,log_debug
+from condor.utils.rng import get_random_state
+
+
+def schedule_from_experiment(experiment, n):
+    """
+    Draw the parameters of ``n`` shots of an experiment at once and return them as an instance of :class:`condor.schedule.ParameterSchedule`
+
+    The parameters (pulse energy, beam center position, number of particles, orientation, position, diameter, flattening and length of the particles) follow the same distributions as the parameters drawn by :meth:`condor.experiment.Experiment.propagate`. Every distribution is sampled by one call for all shots. Shots without any particle in the interaction volume are drawn again. If the experiment has a hit rate (see :class:`condor.experiment.Experiment`) the misses are drawn first and have no particles.
+
+    Args:
+      :experiment: Instance of :class:`condor.experiment.Experiment`
+
+      :n (int): Number of shots
+    """
+    names = list(experiment.particles.keys())
+    # Numbers of particles of every particle model (rows) and shot (columns)
+    numbers = numpy.zeros(shape=(len(names), n), dtype=numpy.int64)
+    if experiment.hit_rate is None:
+        hit = numpy.ones(n, dtype=bool)
+    else:
+        hit = get_random_state().random_sample(n) < experiment.hit_rate
+    # Hits without particles so far
+    miss = hit.copy()
+    while miss.any():
+        numbers[:,miss] = [experiment.particles[name].get_next_number_of_particles(miss.sum()) for name in names]
+        miss = hit & (numbers.sum(axis=0) == 0)
+        if miss.any():
+            if not any([experiment.particles[name].arrival == "random" for name in names]):
+                log_and_raise_error(logger, "No particles in the interaction volume. Change your configuration.")
+                return
+            log_debug(logger, "%i misses - no particles in the interaction volume. Shooting again..." % miss.sum())
+    # Source and detector parameters
+    source   = experiment.source.get_next_batch(n)
+    detector = experiment.detector.get_next_batch(n)
+    shots = numpy.zeros(n, dtype=[("number_of_particles", numpy.int64),
+                                  ("source",   _get_record_dtype(source)),
+                                  ("detector", _get_record_dtype(detector))])
+    shots["number_of_particles"] = numbers.sum(axis=0)
+    for k,v in source.items():
+        shots["source"][k] = v
+    for k,v in detector.items():
+        shots["detector"][k] = v
+    # Particle parameters
+    batches = []
+    for j,name in enumerate(names):
+        m = numbers[j].sum()
+        if m > 0:
+            batches.append((j, name, numpy.repeat(numpy.arange(n), numbers[j]), experiment.particles[name].get_next_batch(m)))
+    fields = {}
+    for j, name, shot, values in batches:
+        for k,v in values.items():
+            fields[k] = v
+    dtype = [("shot", numpy.int64), ("name", "S%i" % max([len(name) for name in names]))] + _get_record_dtype(fields)
+    particles = numpy.zeros(numbers.sum(), dtype=dtype)
+    for k in fields:
+        particles[k] = numpy.nan
+    model = numpy.zeros(numbers.sum(), dtype=numpy.int64)
+    i = 0
+    for j, name, shot, values in batches:
+        particles["shot"][i:i+len(shot)] = shot
+        particles["name"][i:i+len(shot)] = name
+        for k,v in values.items():
+            particles[k][i:i+len(shot)] = v
+        model[i:i+len(shot)] = j
+        i += len(shot)
+    # Order particles by shot and within a shot by particle model (like propagate)
+    particles = particles[numpy.lexsort((model, particles["shot"]))]
+    return ParameterSchedule(shots, particles)
+
+def schedule_from_values(values):
+    """
+    Create an instance of :class:`condor.schedule.ParameterSchedule` from the parameters of a sequence of shots
+
+    Args:
+      :values (list): Parameters of every shot as a tuple in the format returned by :meth:`condor.schedule.ParameterSchedule.get_values`. Parameters that do not apply to a particle model are ``NaN`` in the schedule
+    """
+    n = len(values)
+    source   = _stack_values([v_source for v_source, v_particles, v_detector in values])
+    detector = _stack_values([v_detector for v_source, v_particles, v_detector in values])
+    shots = numpy.zeros(n, dtype=[("number_of_particles", numpy.int64),
+                                  ("source",   _get_record_dtype(source)),
+                                  ("detector", _get_record_dtype(detector))])
+    shots["number_of_particles"] = [len(v_particles) for v_source, v_particles, v_detector in values]
+    for k,v in source.items():
+        shots["source"][k] = v
+    for k,v in detector.items():
+        shots["detector"][k] = v
+    v_particles = [v for v_source, v_particles_i, v_detector in values for v in v_particles_i]
+    fields = _stack_values([v for name, v in v_particles])
+    dtype = [("shot", numpy.int64), ("name", "S%i" % max([1] + [len(name) for name, v in v_particles]))] + _get_record_dtype(fields)
+    particles = numpy.zeros(len(v_particles), dtype=dtype)
+    particles["shot"] = numpy.repeat(numpy.arange(n), shots["number_of_particles"])
+    particles["name"] = [name for name, v in v_particles]
+    for k,v in fields.items():
+        particles[k] = v
+    return ParameterSchedule(shots, particles)
+
+def schedule_from_file(filename):
+    """
+    Load an instance of :class:`condor.schedule.ParameterSchedule` from an HDF5 file that was written by :meth:`condor.schedule.ParameterSchedule.save`
+
+    Args:
+      :filename (str): Filename
+    """
+    import h5py
+    with h5py.File(filename, "r") as f:
+        return ParameterSchedule(f["shots"][...], f["particles"][...])
+
+class ParameterSchedule:
+    """
+    Class for the parameters of a sequence of shots that were drawn in advance
+
+    Instances are created by :func:`condor.schedule.schedule_from_experiment` or :func:`condor.schedule.schedule_from_file` and replayed shot by shot by :meth:`condor.experiment.Experiment.set_schedule`.
+
+    Args:
+      :shots (array): Record array with one record per shot with the fields ``\'number_of_particles\'``, ``\'source\'`` and ``\'detector\'`` (the latter two are records of the varying parameters of the source and the detector)
+
+      :particles (array): Record array with one record per particle ordered by shot with the fields ``\'shot\'`` (index of the shot), ``\'name\'`` (key of the particle model in the experiment) and the varying parameters of the particle (``NaN`` if a parameter does not apply to the particle model)
+    """
+    def __init__(self, shots, particles):
+        self.shots     = shots
+        self.particles = particles
+        self._first    = numpy.concatenate([[0], numpy.cumsum(shots["number_of_particles"])])
+        if self._first[-1] != len(particles):
+            log_and_raise_error(logger, "The number of particle records (%i) does not match the total number of particles of all shots (%i)." % (len(particles), self._first[-1]))
+            return
+        self.reset_counter()
+
+    def reset_counter(self):
+        """
+        Set counter back to zero
+        """
+        self._i = 0
+
+    def set_counter(self, i):
+        """
+        Set counter to the given value, the next shot is then the shot with index ``i``
+
+        Args:
+          :i (int): Index of the next shot
+        """
+        self._i = i
+
+    def get_number_of_shots(self):
+        """
+        Return the number of shots
+        """
+        return len(self.shots)
+
+    def get_particle_names(self):
+        """
+        Return the sorted list of keys of the particle models that occur in the schedule
+        """
+        return sorted(set(self.particles["name"]))
+
+    def get_values(self, i):
+        """
+        Return the parameters of a shot as a tuple of the source parameters (dictionary), the particle parameters (list of tuples of the key of the particle model and a dictionary) and the detector parameters (dictionary)
+
+        Args:
+          :i (int): Index of the shot
+        """
+        shot = self.shots[i]
+        v_source   = _record_to_dict(shot["source"])
+        v_detector = _record_to_dict(shot["detector"])
+        v_particles = [(p["name"], _record_to_dict(p, exclude=("shot", "name"))) for p in self.particles[self._first[i]:self._first[i+1]]]
+        return v_source, v_particles, v_detector
+
+    def take(self, indices):
+        """
+        Return a new schedule of the shots with the given indices (in the given order)
+
+        Args:
+          :indices (array): Indices of the shots
+        """
+        indices = numpy.asarray(indices, dtype=numpy.int64)
+        shots = self.shots[indices]
+        numbers = shots["number_of_particles"]
+        # Indices of the particle records of the selected shots
+        offsets = numpy.cumsum(numbers) - numbers
+        i = numpy.arange(numbers.sum()) - numpy.repeat(offsets, numbers) + numpy.repeat(self._first[indices], numbers)
+        particles = self.particles[i]
+        particles["shot"] = numpy.repeat(numpy.arange(len(indices)), numbers)
+        return ParameterSchedule(shots, particles)
+
+    def get_next_values(self):
+        """
+        Iterate and return the parameters of the next shot (see :meth:`condor.schedule.ParameterSchedule.get_values`)
+        """
+        if self._i >= len(self.shots):
+            log_and_raise_error(logger, "All %i shots of the schedule have been iterated." % len(self.shots))
+            return
+        values = self.get_values(self._i)
+        self._i += 1
+        return values
+
+    def get_next_batch(self, n):
+        """
+        Iterate the parameters of the next ``n`` shots at once and return them as a new schedule (see :meth:`condor.schedule.ParameterSchedule.take`)
+
+        Args:
+          :n (int): Number of shots
+        """
+        if self._i + n > len(self.shots):
+            log_and_raise_error(logger, "Only %i of the %i shots of the schedule are left, %i shots were requested." % (len(self.shots) - self._i, len(self.shots), n))
+            return
+        schedule = self.take(numpy.arange(self._i, self._i + n))
+        self._i += n
+        return schedule
+
+    def save(self, filename):
+        """
+        Save the schedule to an HDF5 file (datasets ``\'shots\'`` and ``\'particles\'``)
+
+        Args:
+          :filename (str): Filename
+        """
+        import h5py
+        with h5py.File(filename, "w") as f:
+            f["shots"]     = self.shots
+            f["particles"] = self.particles
+
+def _get_record_dtype(values):
+    return [(k, numpy.float64, numpy.shape(v)[1:]) for k,v in sorted(values.items())]
+
+def _stack_values(dicts):
+    # Arrays of the values of all dictionaries, values that are missing in a dictionary are NaN
+    shapes = {}
+    for D in dicts:
+        for k,v in D.items():
+            shapes[k] = numpy.shape(v)
+    stacked = {}
+    for k, shape in shapes.items():
+        stacked[k] = numpy.array([D[k] if k in D else numpy.tile(numpy.nan, shape) for D in dicts], dtype=numpy.float64).reshape((len(dicts),) + shape)
+    return stacked
+
+def _record_to_dict(record, exclude=()):
+    D = {}
+    for k in record.dtype.names:
+        if k not in exclude:
+            D[k] = record[k].copy() if numpy.ndim(record[k]) > 0 else record[k]
+    return D
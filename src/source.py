@@ -174,28 +174,44 @@ class Source:
             return
         return I
 
-    def get_next(self):
+    def get_next(self, values=None):
         """
         Iterate the parameters of the Source instance and return them as a dictionary
+
+        Kwargs:
+          :values (dict): Parameters of this shot that were drawn in advance (see :meth:`condor.source.Source.get_next_batch`). If ``None`` the parameters are drawn (default ``None``)
         """
-        return {"pulse_energy":self._get_next_pulse_energy(),
+        return {"pulse_energy":self._get_next_pulse_energy() if values is None else values["pulse_energy"],
                 "wavelength":self.photon.get_wavelength(),
                 "photon_energy":self.photon.get_energy(),
                 "photon_energy_eV":self.photon.get_energy_eV()}
 
-    def _get_next_pulse_energy(self):
-        p = self._pulse_energy_variation.get(self.pulse_energy_mean)
+    def get_next_batch(self, n):
+        """
+        Iterate the varying parameters of the Source instance ``n`` times at once and return them as a dictionary of arrays of length ``n``
+
+        Args:
+          :n (int): Number of shots
+        """
+        return {"pulse_energy":numpy.asarray(self._get_next_pulse_energy(n), dtype=numpy.float64)}
+
+    def _get_next_pulse_energy(self, n=None):
+        p = self._pulse_energy_variation.get(self.pulse_energy_mean, n)
         # Non-random
         if self._pulse_energy_variation._mode in [None,"range"]:
-            if p <= 0:
+            if numpy.any(p <= 0):
                 log_and_raise_error(logger, "Pulse energy smaller-equals zero. Change your configuration.")
             else:
                 return p
         # Random
         else:
-            if p <= 0.:
+            if numpy.any(p <= 0.):
                 log_warning(logger, "Pulse energy smaller-equals zero. Try again.")
-                self._get_next_pulse_energy()
+                if n is None:
+                    return self._get_next_pulse_energy()
+                else:
+                    p[p <= 0.] = self._get_next_pulse_energy((p <= 0.).sum())
+                    return p
             else:
                 return p
 
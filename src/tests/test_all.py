@@ -5,6 +5,17 @@ from test_rotation import TestCaseRotation
 from test_photon import TestCasePhoton
 from test_diffraction import TestCaseDiffraction
 from test_material import TestCaseMaterial
+from test_particle_atoms import TestCaseParticleAtoms
+from test_particle_beads import TestCaseParticleBeads
+from test_particle_radial import TestCaseParticleRadial
+from test_spheroid_diffraction import TestCaseSpheroidDiffraction
+from test_cylinder_diffraction import TestCaseCylinderDiffraction
+from test_lattice_diffraction import TestCaseLatticeDiffraction
+from test_scattering_vector import TestCaseScatteringVector
+from test_symmetry import TestCaseSymmetry
+from test_detector import TestCaseDetector
+from test_rng import TestCaseRng
+from test_experiment import TestCaseExperiment
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -0,0 +1,33 @@
+import unittest
+import numpy
+from scipy.special import j1
+from condor.utils.rotation import Rotation
+from condor.utils import cylinder_diffraction
+
+class TestCaseCylinderDiffraction(unittest.TestCase):
+    def test_limits(self):
+        r = 20E-9
+        l = 200E-9
+        q = numpy.linspace(0., 2E8, 50)
+        qmap = numpy.zeros((len(q), 3))
+        # Parallel to the axis
+        qmap[:,1] = q
+        f = cylinder_diffraction.F_cylinder_diffraction(1., qmap, r, l)
+        self.assertTrue(numpy.allclose(f, numpy.sinc(q*l/2./numpy.pi)))
+        # Perpendicular to the axis
+        qmap[:,1] = 0.
+        qmap[:,2] = q
+        f = cylinder_diffraction.F_cylinder_diffraction(1., qmap, r, l)
+        f_exp = numpy.ones_like(q)
+        f_exp[1:] = 2*j1(q[1:]*r)/(q[1:]*r)
+        self.assertTrue(numpy.allclose(f, f_exp))
+
+    def test_rotation(self):
+        # Rotation of the cylinder axis from y to x
+        r = 20E-9
+        l = 200E-9
+        R = Rotation(values=numpy.array([[0., 1., 0.], [-1., 0., 0.], [0., 0., 1.]]), formalism="rotation_matrix")
+        qmap = numpy.random.randn(100, 3) * 1E8
+        f_rot = cylinder_diffraction.F_cylinder_diffraction(1., qmap, r, l, extrinsic_rotation=R)
+        f = cylinder_diffraction.F_cylinder_diffraction(1., qmap[:,[1,0,2]], r, l)
+        self.assertTrue(numpy.allclose(f_rot, f))
@@ -0,0 +1,14 @@
+import unittest
+import numpy
+import condor
+
+class TestCaseDetector(unittest.TestCase):
+    def test_center_variation_resolution(self):
+        # The resolution element assumes a maximum deviation of the center of 1/2 (uniform) and 3/2 (normal) times the spread
+        wavelength = 1E-9
+        for center_variation, cx in [("uniform", 8.), ("normal", 4.)]:
+            D = condor.Detector(distance=0.05, pixel_size=440E-6, nx=21, ny=21, center_variation=center_variation, center_spread_x=4., center_spread_y=4.)
+            dx = D.get_resolution_element_r(wavelength, center_variation=True)
+            dx_shifted = D.get_resolution_element_r(wavelength, cx=cx, cy=cx)
+            self.assertTrue(numpy.allclose(dx, dx_shifted, rtol=1E-12, atol=0.))
+            self.assertTrue(dx < D.get_resolution_element_r(wavelength))
@@ -1,4 +1,5 @@
 import unittest
+import numpy
 from condor.utils import diffraction
 
 class TestCaseDiffraction(unittest.TestCase):
@@ -22,3 +23,15 @@ class TestCaseDiffraction(unittest.TestCase):
         nypx_expected  = 0.01
         nypx = diffraction.nyquist_pixel_size(wavelength, detector_distance, particle_size)
         self.assertAlmostEqual(nypx/1E-3 , nypx_expected/1E-3, 1)
+
+    def test_structure_factor(self):
+        # Chunked evaluation has to agree with the direct sum
+        numpy.random.seed(0)
+        qmap = numpy.random.uniform(-1E9, 1E9, size=(7, 5, 3))
+        positions = numpy.random.uniform(-1E-7, 1E-7, size=(11, 3))
+        weights = numpy.random.uniform(0.5, 1.5, size=11)
+        S_exp = (weights * numpy.exp(-1.j*numpy.dot(qmap, positions.T))).sum(axis=-1)
+        S = diffraction.structure_factor(qmap, positions, weights, chunk_size=30)
+        self.assertTrue(numpy.allclose(S, S_exp))
+        # Forward direction
+        self.assertAlmostEqual(abs(diffraction.structure_factor(numpy.zeros((1, 3)), positions)[0]), 11.)
@@ -0,0 +1,320 @@
+import unittest
+import os, tempfile, shutil
+import numpy
+import h5py
+import condor
+import condor.schedule
+from condor.utils.pixelmask import PixelMask
+
+class TestCaseExperiment(unittest.TestCase):
+    def test_missing_pixels(self):
+        # Amplitudes of pixels that are not missing have to agree with the amplitudes at arbitrary scattering vectors
+        S = condor.Source(wavelength=1E-9, pulse_energy=1E-3, focus_diameter=2E-6, polarization="ignore")
+        D = condor.Detector(distance=0.2, pixel_size=440E-6, nx=20, ny=20, solid_angle_correction=False, x_gap_size_in_pixel=2, hole_diameter_in_pixel=4)
+        P = condor.ParticleSpheroid(diameter=40E-9, flattening=0.7, material_type="protein", position=[1E-8, 0., 0.],
+                                    rotation_values=numpy.array([0.9, 0.3, -0.2, 0.25])/numpy.sqrt(0.9**2+0.3**2+0.2**2+0.25**2), rotation_formalism="quaternion")
+        E = condor.Experiment(S, {"particle_spheroid": P}, D)
+        O = E.propagate()
+        F = O["entry_1"]["data_1"]["data_fourier"]
+        missing = (O["entry_1"]["data_1"]["mask"] & PixelMask.PIXEL_IS_MISSING) != 0
+        self.assertTrue(missing.any())
+        self.assertTrue((F[missing] == 0).all())
+        qmap = D.generate_qmap(1E-9, cx=D.get_cx_mean_value(), cy=D.get_cy_mean_value())
+        F_q = E.evaluate_at_q(qmap[~missing])["entry_1"]["data_1"]["data_fourier"]
+        self.assertTrue(numpy.allclose(F[~missing], F_q, atol=1E-6*abs(F_q).max()))
+
+    def test_tiles(self):
+        # Processing the detector in blocks of rows must not change the result
+        S = condor.Source(wavelength=1E-9, pulse_energy=1E-3, focus_diameter=2E-6, polarization="vertical")
+        D = condor.Detector(distance=0.05, pixel_size=440E-6, nx=24, ny=17, solid_angle_correction=True, hole_diameter_in_pixel=3)
+        P = condor.ParticleCylinder(diameter=20E-9, length=40E-9, material_type="protein", position=[1E-8, 0., 0.],
+                                    rotation_values=numpy.array([0.9, 0.3, -0.2, 0.25])/numpy.sqrt(0.9**2+0.3**2+0.2**2+0.25**2), rotation_formalism="quaternion")
+        E = condor.Experiment(S, {"particle_cylinder": P}, D)
+        F = E.propagate()["entry_1"]["data_1"]["data_fourier"]
+        F_tiled = E.propagate(tile_rows=5)["entry_1"]["data_1"]["data_fourier"]
+        self.assertTrue((F == F_tiled).all())
+
+    def test_single_precision(self):
+        # Documented error bound: relative error of 1E-5 of the maximum amplitude
+        S = condor.Source(wavelength=1E-9, pulse_energy=1E-3, focus_diameter=2E-6, polarization="ignore")
+        D = condor.Detector(distance=0.05, pixel_size=440E-6, nx=24, ny=17, solid_angle_correction=False)
+        q = numpy.array([0.9, 0.3, -0.2, 0.25])/numpy.sqrt(0.9**2+0.3**2+0.2**2+0.25**2)
+        particles = {"particle_sphere": condor.ParticleSphere(diameter=40E-9, material_type="protein", position=[1E-8, 0., 0.]),
+                     "particle_spheroid": condor.ParticleSpheroid(diameter=40E-9, flattening=0.7, material_type="protein", rotation_values=q, rotation_formalism="quaternion"),
+                     "particle_beads": condor.ParticleBeads(bead_positions=[[0., 0., 0.], [3E-9, 1E-9, -2E-9]], bead_radii=[1E-9, 1.5E-9], bead_electrons=[10, 20],
+                                                            rotation_values=q, rotation_formalism="quaternion")}
+        for name, P in particles.items():
+            for propagate in ["propagate", "propagate3d"]:
+                O_double = getattr(condor.Experiment(S, {name: P}, D), propagate)()
+                O_single = getattr(condor.Experiment(S, {name: P}, D, precision="single"), propagate)()
+                F_double = O_double["entry_1"]["data_1"]["data_fourier"]
+                F_single = O_single["entry_1"]["data_1"]["data_fourier"]
+                self.assertIn(F_single.dtype, [numpy.float32, numpy.complex64])
+                self.assertEqual(O_single["entry_1"]["data_1"]["data"].dtype, numpy.float32)
+                self.assertTrue(abs(F_single - F_double).max() < 1E-5*abs(F_double).max())
+
+    def test_reuse_buffers(self):
+        # Reusing buffers must not change the result, and after the first shot no buffers are allocated
+        S = condor.Source(wavelength=1E-9, pulse_energy=1E-3, focus_diameter=2E-6, polarization="vertical")
+        particles = {"particle_sphere": condor.ParticleSphere(diameter=40E-9, material_type="protein", position=[1E-8, 0., 0.]),
+                     "particle_beads": condor.ParticleBeads(bead_positions=[[0., 0., 0.], [3E-9, 1E-9, -2E-9]], bead_radii=[1E-9, 1.5E-9], bead_electrons=[10, 20],
+                                                            position=[0., 3E-9, 0.], rotation_formalism="random")}
+        for hole in [0, 3]:
+            D = condor.Detector(distance=0.05, pixel_size=440E-6, nx=24, ny=17, solid_angle_correction=True, hole_diameter_in_pixel=hole)
+            E = condor.Experiment(S, particles, D)
+            E_buffers = condor.Experiment(S, particles, D, reuse_buffers=True)
+            numpy.random.seed(0)
+            O = [E.propagate() for i in range(3)]
+            numpy.random.seed(0)
+            O_buffers = []
+            for i in range(3):
+                O_buffers.append(E_buffers.propagate())
+                self.assertTrue((O_buffers[-1]["entry_1"]["data_1"]["data_fourier"] == O[i]["entry_1"]["data_1"]["data_fourier"]).all())
+                self.assertTrue((O_buffers[-1]["entry_1"]["data_1"]["mask"] == O[i]["entry_1"]["data_1"]["mask"]).all())
+                if i == 0:
+                    n_allocations = E_buffers._buffers.n_allocations
+            self.assertEqual(E_buffers._buffers.n_allocations, n_allocations)
+            self.assertTrue(numpy.may_share_memory(O_buffers[0]["entry_1"]["data_1"]["data_fourier"], O_buffers[2]["entry_1"]["data_1"]["data_fourier"]))
+
+    def test_propagate_batch(self):
+        # Without noise a batch has to reproduce the patterns of individual shots with the same parameters
+        S = condor.Source(wavelength=1E-9, pulse_energy=1E-3, focus_diameter=2E-6, polarization="vertical", pulse_energy_variation="normal", pulse_energy_spread=1E-4)
+        D = condor.Detector(distance=0.05, pixel_size=440E-6, nx=24, ny=17, solid_angle_correction=True, hole_diameter_in_pixel=3)
+        particles = {"particle_sphere": condor.ParticleSphere(diameter=40E-9, material_type="protein", position=[1E-8, 0., 0.], diameter_variation="normal", diameter_spread=3E-9,
+                                                              number=1.5, arrival="random"),
+                     "particle_spheroid": condor.ParticleSpheroid(diameter=40E-9, flattening=0.7, material_type="protein", rotation_formalism="random",
+                                                                  flattening_variation="uniform", flattening_spread=0.2)}
+        E = condor.Experiment(S, particles, D)
+        # Parameters drawn at once are those of a schedule drawn from the same random numbers
+        numpy.random.seed(0)
+        schedule = condor.schedule.schedule_from_experiment(E, 10)
+        numpy.random.seed(0)
+        B = E.propagate_batch(10)
+        self.assertTrue((B["source"]["pulse_energy"] == schedule.shots["source"]["pulse_energy"]).all())
+        self.assertTrue((B["particles"]["frame"] == schedule.particles["shot"]).all())
+        self.assertTrue((B["particles"]["extrinsic_quaternion"] == schedule.particles["extrinsic_quaternion"]).all())
+        E.set_schedule(schedule)
+        O = [E.propagate() for i in range(10)]
+        schedule.reset_counter()
+        B_schedule = E.propagate_batch(10)
+        for O_batch in [B, B_schedule]:
+            F_batch = O_batch["entry_1"]["data_1"]["data_fourier"]
+            M_batch = O_batch["entry_1"]["data_1"]["mask"]
+            self.assertEqual(F_batch.shape, (10, 17, 24))
+            self.assertEqual(list(numpy.bincount(O_batch["particles"]["frame"], minlength=10)), [len(Oi["particles"]) for Oi in O])
+            for i in range(10):
+                F = O[i]["entry_1"]["data_1"]["data_fourier"]
+                self.assertTrue(numpy.allclose(F_batch[i], F, rtol=0., atol=1E-12*abs(F).max()))
+                self.assertTrue((M_batch[i] == O[i]["entry_1"]["data_1"]["mask"]).all())
+        # With a seed every shot of a batch is the shot of the same index
+        E = condor.Experiment(S, particles, D, seed=5)
+        B = E.propagate_batch(4)
+        self.assertEqual(list(B["shot"]), range(4))
+        for i in range(4):
+            Oi = E.propagate(shot=i)
+            F = Oi["entry_1"]["data_1"]["data_fourier"]
+            self.assertEqual((B["particles"]["frame"] == i).sum(), len(Oi["particles"]))
+            self.assertTrue(numpy.allclose(B["entry_1"]["data_1"]["data_fourier"][i], F, rtol=0., atol=1E-12*abs(F).max()))
+
+    def test_schedule(self):
+        # Replaying a schedule (also after saving and loading it) has to reproduce the drawn parameters
+        S = condor.Source(wavelength=1E-9, pulse_energy=1E-3, focus_diameter=2E-6, polarization="vertical", pulse_energy_variation="normal", pulse_energy_spread=1E-4)
+        D = condor.Detector(distance=0.05, pixel_size=440E-6, nx=24, ny=17, center_variation="uniform", center_spread_x=2., center_spread_y=2.)
+        particles = {"particle_sphere": condor.ParticleSphere(diameter=40E-9, material_type="protein", diameter_variation="range", diameter_spread=10E-9, diameter_variation_n=4,
+                                                              position_variation="normal", position_spread=[1E-8, 1E-8, 1E-8], number=1.5, arrival="random"),
+                     "particle_spheroid": condor.ParticleSpheroid(diameter=40E-9, flattening=0.7, material_type="protein", flattening_variation="uniform", flattening_spread=0.2,
+                                                                  rotation_formalism="random", rotation_mode="intrinsic")}
+        E = condor.Experiment(S, particles, D)
+        schedule = condor.schedule.schedule_from_experiment(E, 10)
+        self.assertTrue((schedule.shots["number_of_particles"] >= 1).all())
+        self.assertEqual(len(schedule.particles), schedule.shots["number_of_particles"].sum())
+        filename = tempfile.mktemp(suffix=".h5")
+        try:
+            schedule.save(filename)
+            loaded = condor.schedule.schedule_from_file(filename)
+        finally:
+            os.remove(filename)
+        E.set_schedule(schedule)
+        O = [E.propagate() for i in range(10)]
+        self.assertRaises(RuntimeError, E.propagate)
+        E.set_schedule(loaded)
+        for i in range(10):
+            O_loaded = E.propagate()
+            self.assertEqual(O[i]["source"]["pulse_energy"], schedule.shots["source"]["pulse_energy"][i])
+            self.assertEqual(O[i]["detector"]["cx"], schedule.shots["detector"]["cx"][i])
+            self.assertEqual(len(O[i]["particles"]), schedule.shots["number_of_particles"][i])
+            self.assertTrue((O_loaded["entry_1"]["data_1"]["data_fourier"] == O[i]["entry_1"]["data_1"]["data_fourier"]).all())
+        diameters = schedule.particles["diameter"][schedule.particles["name"] == "particle_sphere"]
+        self.assertTrue(numpy.allclose(diameters, 40E-9 + numpy.linspace(-5E-9, 5E-9, 4)[numpy.arange(len(diameters)) % 4], rtol=0., atol=1E-20))
+
+    def test_propagate_schedule(self):
+        # Reordering the shots of a schedule must not change the results but increase the cache hit rate
+        S = condor.Source(wavelength=1E-9, pulse_energy=1E-3, focus_diameter=2E-6, polarization="ignore")
+        # Fixed detector centre, the suggested map spacing does not depend on the centre variation heuristic
+        D = condor.Detector(distance=0.05, pixel_size=880E-6, nx=12, ny=10)
+        q = numpy.array([[1., 0., 0., 0.], [0.9, 0.3, -0.2, 0.25]])
+        q[1] /= numpy.sqrt((q[1]**2).sum())
+        P = condor.ParticleMap(geometry="sphere", diameter=30E-9, material_type="protein", diameter_variation="range", diameter_spread=10E-9, diameter_variation_n=3,
+                               rotation_values=q, rotation_formalism="quaternion")
+        E = condor.Experiment(S, {"particle_map": P}, D)
+        schedule = condor.schedule.schedule_from_experiment(E, 12)
+        O, hit_rates = E.propagate_schedule(schedule, reorder=False)
+        O_reordered, hit_rates_reordered = E.propagate_schedule(schedule)
+        self.assertEqual(hit_rates["map"], 0.)
+        self.assertEqual(hit_rates_reordered["map"], 0.75)
+        for i in range(12):
+            self.assertEqual(O_reordered[i]["particles"]["particle_00"]["diameter"], schedule.particles["diameter"][i])
+            F = O[i]["entry_1"]["data_1"]["data_fourier"]
+            self.assertTrue(numpy.allclose(O_reordered[i]["entry_1"]["data_1"]["data_fourier"], F, rtol=0., atol=1E-12*numpy.nanmax(abs(F)), equal_nan=True))
+
+    def test_cache_amplitudes(self):
+        # Shots that differ only by pulse energy and particle positions have to reuse the amplitudes of the previous shot
+        S = condor.Source(wavelength=1E-9, pulse_energy=1E-3, focus_diameter=2E-6, polarization="vertical", pulse_energy_variation="normal", pulse_energy_spread=1E-4)
+        D = condor.Detector(distance=0.05, pixel_size=440E-6, nx=24, ny=17, solid_angle_correction=True, hole_diameter_in_pixel=3)
+        q = numpy.array([0.9, 0.3, -0.2, 0.25])/numpy.sqrt(0.9**2+0.3**2+0.2**2+0.25**2)
+        particles = {"particle_sphere": condor.ParticleSphere(diameter=40E-9, material_type="protein", position_variation="normal", position_spread=[1E-8, 1E-8, 1E-8]),
+                     "particle_spheroid": condor.ParticleSpheroid(diameter=40E-9, flattening=0.7, material_type="protein", rotation_values=q, rotation_formalism="quaternion",
+                                                                  number=2., position_variation="uniform", position_spread=[1E-8, 1E-8, 1E-8])}
+        E = condor.Experiment(S, particles, D)
+        schedule = condor.schedule.schedule_from_experiment(E, 5)
+        for reuse_buffers in [False, True]:
+            E_cache = condor.Experiment(S, particles, D, reuse_buffers=reuse_buffers, cache_amplitudes=True)
+            E.set_schedule(schedule.take(range(5)))
+            E_cache.set_schedule(schedule.take(range(5)))
+            for i in range(5):
+                F = E.propagate()["entry_1"]["data_1"]["data_fourier"]
+                O = E_cache.propagate()
+                self.assertEqual(O["statistics"], {"amplitudes_calculated": 0 if i else 2, "amplitudes_reused": 2 if i else 0})
+                self.assertTrue(numpy.allclose(O["entry_1"]["data_1"]["data_fourier"], F, rtol=0., atol=1E-12*abs(F).max()))
+
+    def test_pattern_memo(self):
+        # Repeated parameters of a grid have to reuse the kept noise-free pattern, only the noise is drawn again
+        D = condor.Detector(distance=0.05, pixel_size=440E-6, nx=16, ny=13, noise="poisson")
+        particles = {"particle_spheroid": condor.ParticleSpheroid(diameter=40E-9, flattening=0.7, material_type="protein")}
+        get_source = lambda: condor.Source(wavelength=1E-9, pulse_energy=1E-3, focus_diameter=2E-6, pulse_energy_variation="range", pulse_energy_spread=1E-4, pulse_energy_variation_n=3)
+        # Least recently used patterns are discarded, a memo smaller than the grid is never hit
+        for pattern_memo_size, reused in [(3, [0, 0, 0, 1, 1, 1]), (2, [0, 0, 0, 0, 0, 0])]:
+            for reuse_buffers in [False, True]:
+                E = condor.Experiment(get_source(), particles, D)
+                E_memo = condor.Experiment(get_source(), particles, D, reuse_buffers=reuse_buffers, pattern_memo_size=pattern_memo_size)
+                for i in range(6):
+                    F = E.propagate()["entry_1"]["data_1"]["data_fourier"]
+                    O = E_memo.propagate()
+                    self.assertEqual(O["statistics"]["pattern_reused"], reused[i])
+                    self.assertEqual(len(E_memo._pattern_memo), min(i+1, pattern_memo_size))
+                    self.assertTrue((O["entry_1"]["data_1"]["data_fourier"] == F).all())
+                    self.assertEqual(O["particles"]["particle_00"]["intensity"], E.source.get_intensity([0,0,0], "ph/m2", pulse_energy=O["source"]["pulse_energy"]))
+
+    def test_cache_directory(self):
+        # A repeated run with the same configuration and shot parameters has to load the amplitudes from the cache directory
+        S = condor.Source(wavelength=1E-9, pulse_energy=1E-3, focus_diameter=2E-6, pulse_energy_variation="normal", pulse_energy_spread=1E-4)
+        D = condor.Detector(distance=0.05, pixel_size=440E-6, nx=16, ny=13, noise="poisson")
+        get_particles = lambda diameter: {"particle_map": condor.ParticleMap(geometry="custom", map3d=numpy.ones((6,6,6)), dx=5E-9, material_type="protein", position_variation="normal", position_spread=[1E-8, 1E-8, 1E-8]),
+                                          "particle_sphere": condor.ParticleSphere(diameter=diameter, material_type="protein")}
+        schedule = condor.schedule.schedule_from_experiment(condor.Experiment(S, get_particles(40E-9), D), 4)
+        directory = tempfile.mkdtemp()
+        try:
+            for diameter, loaded in [(40E-9, 0), (40E-9, 1), (50E-9, 0)]:
+                E = condor.Experiment(S, get_particles(diameter), D)
+                E_cache = condor.Experiment(S, get_particles(diameter), D, cache_directory=directory)
+                E.set_schedule(schedule.take(range(4)))
+                E_cache.set_schedule(schedule.take(range(4)))
+                for i in range(4):
+                    F = E.propagate()["entry_1"]["data_1"]["data_fourier"]
+                    O = E_cache.propagate()
+                    self.assertEqual(O["statistics"]["pattern_loaded"], loaded)
+                    self.assertTrue((O["entry_1"]["data_1"]["data_fourier"] == F).all())
+            self.assertEqual(len(os.listdir(directory)), 8)
+            # The size limit removes the entries that were used least recently
+            cache = condor.utils.diskcache.DiskCache(directory, max_size=E_cache._disk_cache.get_nbytes() / 2)
+            cache.put("new", F=F)
+            self.assertEqual(len(os.listdir(directory)), 4)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_seed(self):
+        # With a seed every shot can be simulated on its own and a run can be resumed from file
+        S = condor.Source(wavelength=1E-9, pulse_energy=1E-3, focus_diameter=2E-6, pulse_energy_variation="normal", pulse_energy_spread=1E-4)
+        D = condor.Detector(distance=0.05, pixel_size=440E-6, nx=16, ny=13, noise="poisson")
+        particles = {"particle_spheroid": condor.ParticleSpheroid(diameter=40E-9, diameter_variation="range", diameter_spread=10E-9, diameter_variation_n=3, flattening=0.7,
+                                                                  material_type="protein", rotation_formalism="random", position_variation="normal", position_spread=[1E-8, 1E-8, 1E-8])}
+        get_experiment = lambda: condor.Experiment(S, particles, D, seed=17)
+        E = get_experiment()
+        O = [E.propagate() for i in range(5)]
+        self.assertEqual([Oi["shot"] for Oi in O], range(5))
+        self.assertTrue(numpy.allclose([Oi["particles"]["particle_00"]["diameter"] for Oi in O], 40E-9 + numpy.array([-5E-9, 0., 5E-9, -5E-9, 0.])))
+        # Shots in arbitrary order are identical to the shots of the sequential run
+        E = get_experiment()
+        for i in [3, 1, 4]:
+            Oi = E.propagate(shot=i)
+            self.assertTrue((Oi["entry_1"]["data_1"]["data"] == O[i]["entry_1"]["data_1"]["data"]).all())
+            self.assertTrue((Oi["entry_1"]["data_1"]["data_fourier"] == O[i]["entry_1"]["data_1"]["data_fourier"]).all())
+        # Different seeds draw different random numbers
+        self.assertFalse((condor.Experiment(S, particles, D, seed=18).propagate(shot=1)["entry_1"]["data_1"]["data"] == O[1]["entry_1"]["data_1"]["data"]).all())
+        self.assertRaises(RuntimeError, condor.Experiment(S, particles, D).propagate, shot=1)
+        # Resume an interrupted run (the file is not closed by the writer)
+        filename = tempfile.mktemp(suffix=".cxi")
+        try:
+            E = get_experiment()
+            W = condor.utils.cxiwriter.CXIWriter(filename)
+            for i in range(3):
+                W.write(E.propagate())
+            W._f.close()
+            E = get_experiment()
+            W = condor.utils.cxiwriter.CXIWriter(filename, append=True)
+            self.assertEqual(W.get_number_of_frames(), 3)
+            for i in range(W.get_number_of_frames(), 5):
+                W.write(E.propagate(shot=i))
+            W.close()
+            with h5py.File(filename, "r") as f:
+                self.assertEqual(list(f["/shot"][:]), range(5))
+                self.assertTrue((f["/entry_1/data_1/data"][:] == numpy.array([Oi["entry_1"]["data_1"]["data"] for Oi in O])).all())
+        finally:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def test_hit_rate(self):
+        # Misses have no particles and consist of the detector noise only, no amplitudes are calculated for them
+        S = condor.Source(wavelength=1E-9, pulse_energy=1E-3, focus_diameter=2E-6)
+        D = condor.Detector(distance=0.05, pixel_size=440E-6, nx=16, ny=13, noise="normal", noise_spread=1., hole_diameter_in_pixel=3)
+        particles = {"particle_sphere": condor.ParticleSphere(diameter=40E-9, material_type="protein", position_variation="normal", position_spread=[1E-8, 1E-8, 1E-8])}
+        E = condor.Experiment(S, particles, D, seed=3, hit_rate=0.25, cache_amplitudes=True)
+        O = [E.propagate() for i in range(40)]
+        hit = numpy.array([Oi["hit"] for Oi in O])
+        self.assertTrue(0 < hit.sum() < 40)
+        for Oi in O:
+            self.assertEqual(len(Oi["particles"]) > 0, Oi["hit"] == 1)
+            self.assertEqual(Oi["statistics"]["amplitudes_calculated"] + Oi["statistics"]["amplitudes_reused"], len(Oi["particles"]))
+            self.assertEqual((Oi["entry_1"]["data_1"]["data_fourier"] == 0).all(), Oi["hit"] == 0)
+            self.assertTrue((Oi["entry_1"]["data_1"]["mask"] == D.get_mask()).all())
+            self.assertTrue(abs(Oi["entry_1"]["data_1"]["data"]).max() > 0)
+        # Batches and schedules produce misses as well
+        B = E.propagate_batch(10)
+        self.assertEqual(list(B["hit"]), list(numpy.bincount(B["particles"]["frame"], minlength=10) > 0))
+        self.assertTrue((B["entry_1"]["data_1"]["data_fourier"][B["hit"] == 0] == 0).all())
+        schedule = condor.schedule.schedule_from_experiment(E, 40)
+        self.assertTrue(0 < (schedule.shots["number_of_particles"] == 0).sum() < 40)
+        outputs, hit_rates = E.propagate_schedule(schedule)
+        self.assertEqual([Oi["hit"] for Oi in outputs], list(schedule.shots["number_of_particles"] > 0))
+
+    def test_seed_symmetry_check(self):
+        # The grid points of the symmetry check are drawn from the random state of the shot and not from the global random state
+        S = condor.Source(wavelength=1E-9, pulse_energy=1E-3, focus_diameter=2E-6)
+        D = condor.Detector(distance=0.05, pixel_size=440E-6, nx=8, ny=8, solid_angle_correction=False)
+        P = condor.ParticleMap(geometry="icosahedron", diameter=40E-9, material_type="protein")
+        E = condor.Experiment(S, {"particle_map": P}, D, seed=1)
+        state = numpy.random.get_state()
+        E.propagate3d(qn=8, use_symmetry=True, symmetry_check=5, shot=0)
+        self.assertTrue((numpy.random.get_state()[1] == state[1]).all())
+        self.assertEqual(numpy.random.get_state()[2], state[2])
+
+    def test_symmetry_rotated_maps(self):
+        # Filling the Fourier volume of rotated voxel maps by symmetry has to reproduce direct evaluation (a voxelised sphere has only cubic symmetry)
+        S = condor.Source(wavelength=1E-9, pulse_energy=1E-3, focus_diameter=2E-6)
+        D = condor.Detector(distance=0.05, pixel_size=440E-6, nx=11, ny=11, solid_angle_correction=False)
+        for geometry in ["sphere", "spheroid"]:
+            P = condor.ParticleMap(geometry=geometry, diameter=40E-9, flattening=0.7, material_type="protein", rotation_formalism="random")
+            E = condor.Experiment(S, {"particle_map": P}, D, seed=2)
+            F = E.propagate3d(qn=11, shot=0)["entry_1"]["data_1"]["data_fourier"]
+            F_symmetry = E.propagate3d(qn=11, use_symmetry=True, shot=0)["entry_1"]["data_1"]["data_fourier"]
+            self.assertTrue(numpy.allclose(F_symmetry, F, rtol=0., atol=1E-12*numpy.nanmax(abs(F)), equal_nan=True))
@@ -0,0 +1,26 @@
+import unittest
+import numpy
+from condor.utils.rotation import Rotation
+from condor.utils import lattice_diffraction
+
+class TestCaseLatticeDiffraction(unittest.TestCase):
+    def test_laue_function(self):
+        for N in [1, 4, 7]:
+            x = numpy.linspace(-3*numpy.pi, 3*numpy.pi, 121)
+            L = lattice_diffraction.laue_function(N, x)
+            L_exp = numpy.exp(-1.j*numpy.outer(x, numpy.arange(N)-(N-1)/2.)).sum(axis=1)
+            self.assertTrue(numpy.allclose(L, L_exp))
+
+    def test_lattice_factor(self):
+        # Closed form, occupancy mask and explicit sum have to agree
+        A = numpy.array([[10E-9, 0., 0.], [2E-9, 12E-9, 0.], [0., 1E-9, 15E-9]])
+        shape = (3, 4, 5)
+        R = Rotation(formalism="random")
+        qmap = numpy.random.randn(6, 7, 3) * 3E8
+        S = lattice_diffraction.F_lattice_diffraction(qmap, A, shape, extrinsic_rotation=R)
+        S_mask = lattice_diffraction.F_lattice_diffraction(qmap, A, shape, mask=numpy.ones(shape, dtype=numpy.bool), extrinsic_rotation=R)
+        n = numpy.array(numpy.nonzero(numpy.ones(shape))).T - (numpy.array(shape)-1)/2.
+        r = R.rotate_vectors(n.dot(A))
+        S_exp = numpy.exp(-1.j*qmap.dot(r.T)).sum(axis=-1)
+        self.assertTrue(numpy.allclose(S, S_exp))
+        self.assertTrue(numpy.allclose(S_mask, S_exp))
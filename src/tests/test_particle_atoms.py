@@ -0,0 +1,31 @@
+import unittest
+import numpy
+from scipy import constants
+import condor
+import condor.utils.material
+
+class TestCaseParticleAtoms(unittest.TestCase):
+    def test_gridded_map(self):
+        # Gridded map (with gridding correction) has to reproduce the analytic transform of the Gaussian atoms
+        wavelength = 1E-9
+        photon_energy_eV = constants.h*constants.c/wavelength/constants.e
+        Z = numpy.array([6, 7, 8, 16])
+        r = numpy.array([[0., 0., 0.], [1.3E-10, 0.4E-10, -0.2E-10], [-0.8E-10, 1.1E-10, 0.9E-10], [0.3E-10, -1.7E-10, 1.2E-10]])
+        P = condor.ParticleAtoms(atomic_numbers=Z, atomic_positions=r, as_map=True)
+        dx = 0.5E-10
+        map3d_dn, dx = P.get_dn_map(dx, wavelength)
+        N = map3d_dn.shape[0]
+        # Voxel positions with respect to the centre of mass (order z,y,x)
+        k = numpy.array(numpy.nonzero(map3d_dn)).T
+        r_v = (k - N/2) * dx
+        values = map3d_dn[map3d_dn != 0] * dx**3
+        # Scattering vectors (order x,y,z)
+        q = numpy.array([[0., 0., 0.], [1E10, 0., 0.], [0., -2E10, 1E10], [1.5E10, 1E10, -1E10]])
+        F_map = numpy.exp(-1.j*numpy.dot(q[:,::-1], r_v.T)).dot(values)
+        F_map *= P.get_gridding_correction(numpy.sqrt((q**2).sum(axis=1)), dx)
+        f = numpy.array([condor.utils.material.get_f_element(condor.utils.material.atomic_names[z-1], photon_energy_eV) for z in Z])
+        s = P.get_atomic_kernel_widths()
+        r_c = r - P.get_center_of_mass()
+        F_exp = constants.value("classical electron radius")/(2*numpy.pi)*wavelength**2 * \
+                (f * numpy.exp(-0.5*numpy.outer((q**2).sum(axis=1), s**2)) * numpy.exp(-1.j*numpy.dot(q, r_c.T))).sum(axis=1)
+        self.assertTrue(numpy.allclose(F_map, F_exp, rtol=1E-2, atol=1E-2*abs(F_exp).max()))
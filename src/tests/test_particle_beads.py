@@ -0,0 +1,30 @@
+import unittest
+import numpy
+import condor
+from condor.utils.bead_diffraction import F_bead_diffraction
+from condor.utils.sphere_diffraction import F_sphere_diffraction
+
+class TestCaseParticleBeads(unittest.TestCase):
+    def test_single_bead(self):
+        # Small angle limit: Gaussian bead has the same radius of gyration as the sphere
+        R = 10E-9
+        P = condor.ParticleBeads(bead_positions=[[0., 0., 0.]], bead_radii=R, bead_electrons=100.)
+        q = numpy.linspace(0., 0.2/R, 20)
+        qmap = numpy.zeros((len(q), 3))
+        qmap[:,1] = q
+        F = F_bead_diffraction(qmap, P.get_bead_positions(), P.get_bead_sigmas(), P.get_bead_electrons())
+        F_sphere = F_sphere_diffraction(100.**2, q, R)
+        self.assertTrue(numpy.allclose(F, F_sphere, rtol=1E-4))
+
+    def test_chunks(self):
+        # Chunked evaluation has to agree with the explicit sum over beads
+        N = 50
+        r = numpy.random.randn(N, 3) * 20E-9
+        s = numpy.random.rand(N) * 2E-9
+        n = numpy.random.rand(N) * 100.
+        qmap = numpy.random.randn(7, 5, 3) * 1E8
+        F = F_bead_diffraction(qmap, r, s, n, chunk_size=N*3)
+        F_exp = numpy.zeros((7, 5), dtype=numpy.complex128)
+        for j in range(N):
+            F_exp += n[j] * numpy.exp(-0.5*(qmap**2).sum(axis=2)*s[j]**2) * numpy.exp(-1.j*(qmap*r[j]).sum(axis=2))
+        self.assertTrue(numpy.allclose(F, F_exp))
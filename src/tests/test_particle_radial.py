@@ -0,0 +1,44 @@
+import unittest
+import numpy
+import condor
+from condor.utils.sphere_diffraction import F_sphere_diffraction, f_layered_sphere, f_radial_profile
+
+class TestCaseParticleRadial(unittest.TestCase):
+    def test_uniform_sphere(self):
+        wavelength = 1E-9
+        D = 100E-9
+        P = condor.ParticleRadial(diameter=D, material_type="custom", electron_density=3E29)
+        S = condor.ParticleSphere(diameter=D, material_type="custom", electron_density=3E29)
+        q = numpy.linspace(0., 1E9, 500)
+        f = P.get_form_factor(q, D, wavelength)
+        V = 4/3.*numpy.pi*(D/2.)**3
+        f_sphere = F_sphere_diffraction((V*S.get_dn(wavelength))**2, q, D/2.)
+        self.assertTrue(numpy.allclose(abs(f), abs(f_sphere), rtol=1E-3, atol=1E-4*abs(f_sphere).max()))
+
+    def test_core_shell(self):
+        # Layered core-shell particle and the equivalent sampled profile have to agree
+        wavelength = 1E-9
+        D = 100E-9
+        rho_core  = 5E29
+        rho_shell = 3E29
+        P_layers = condor.ParticleRadial(diameter=D, layer_radii=[0.6, 1.], material_type=["custom", "custom"], electron_density=[rho_core, rho_shell])
+        P_profile = condor.ParticleRadial(diameter=D, profile_radii=[0., 0.6, 0.6+1E-9, 1.], profile_densities=[rho_core/rho_shell, rho_core/rho_shell, 1., 1.],
+                                          material_type="custom", electron_density=rho_shell)
+        q = numpy.linspace(0., 3E8, 100)
+        f_layers  = P_layers.get_form_factor(q, D, wavelength)
+        f_profile = P_profile.get_form_factor(q, D, wavelength)
+        self.assertTrue(numpy.allclose(f_layers, f_profile, rtol=1E-5, atol=1E-6*abs(f_layers).max()))
+        # Diameter variation by scaling
+        f_double = P_layers.get_form_factor(q/2., 2*D, wavelength)
+        self.assertTrue(numpy.allclose(f_double, 8*f_layers, rtol=1E-3, atol=1E-4*abs(f_double).max()))
+
+    def test_multi_shell_profile(self):
+        # Sampled profile with steps at the layer boundaries has to reproduce the analytical layered form factor
+        s = numpy.linspace(0., 60., 400)
+        radii = [0.3, 0.5, 1.]
+        dn = numpy.array([1.+0.1j, 3., 0.5])
+        r  = [0., 0.3, 0.3+1E-12, 0.5, 0.5+1E-12, 1.]
+        dn_r = dn[[0, 0, 1, 1, 2, 2]]
+        f_layers = f_layered_sphere(s, radii, dn)
+        f_profile = f_radial_profile(s, r, dn_r)
+        self.assertTrue(numpy.allclose(f_profile, f_layers, rtol=1E-6, atol=1E-6*abs(f_layers).max()))
@@ -0,0 +1,33 @@
+import unittest
+import threading
+import numpy
+from condor.utils.rng import get_random_state, get_shot_random_state, using_random_state
+
+class TestCaseRng(unittest.TestCase):
+    def test_threads(self):
+        # Random states of shots in overlapping threads must not interfere, the global random state is restored in every thread
+        expected = dict([(seed, get_shot_random_state(seed, 0).random_sample(2)) for seed in [1, 2]])
+        entered = threading.Event()
+        drawn = threading.Event()
+        values = {}
+        def draw(seed, first):
+            with using_random_state(get_shot_random_state(seed, 0)):
+                if first:
+                    entered.set()
+                    drawn.wait()
+                else:
+                    entered.wait()
+                values[seed] = [get_random_state().random_sample()]
+                if not first:
+                    drawn.set()
+                values[seed].append(get_random_state().random_sample())
+            values[(seed, "restored")] = get_random_state() is numpy.random
+        threads = [threading.Thread(target=draw, args=(1, True)), threading.Thread(target=draw, args=(2, False))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for seed in [1, 2]:
+            self.assertTrue(numpy.allclose(values[seed], expected[seed], rtol=0., atol=0.))
+            self.assertTrue(values[(seed, "restored")])
+        self.assertTrue(get_random_state() is numpy.random)
@@ -0,0 +1,63 @@
+import unittest
+import numpy
+from condor.utils import scattering_vector
+
+class TestCaseScatteringVector(unittest.TestCase):
+    def test_qgrid_3d(self):
+        # The lazy grid has to reproduce the materialised 3D qmap, phase ramps and structure factors
+        qn = 9
+        qmax = 1E9
+        G = scattering_vector.QGrid3D(qn=qn, qmax=qmax)
+        qmap = scattering_vector.generate_qmap_3d(qn, qmax, order="xyz")
+        self.assertTrue(numpy.allclose(G.get_qmap(), qmap))
+        self.assertTrue(numpy.allclose(G.get_abs_q(), numpy.sqrt((qmap**2).sum(axis=3))))
+        v = numpy.array([3E-9, -7E-9, 11E-9])
+        F = numpy.random.uniform(size=(qn, qn, qn)) + 0.j
+        self.assertTrue(numpy.allclose(G.apply_phase_ramp(F, v), F * numpy.exp(-1.j*qmap.dot(v))))
+        positions = numpy.array([v, -2*v, [0., 1E-9, 0.]])
+        weights = numpy.array([1., 2., 0.5])
+        S_exp = (weights * numpy.exp(-1.j*numpy.dot(qmap, positions.T))).sum(axis=-1)
+        self.assertTrue(numpy.allclose(G.get_structure_factor(positions, weights), S_exp))
+
+    def test_qgrid_3d_rotated_slabs(self):
+        # Slab-wise evaluation of the rotated grid has to agree with rotating every scattering vector
+        from condor.utils.rotation import Rotation
+        qn = 7
+        qmax = 1E9
+        R = Rotation(values=numpy.array([0.9, 0.2, -0.3, 0.25])/numpy.sqrt(0.9**2+0.2**2+0.3**2+0.25**2), formalism="quaternion")
+        G = scattering_vector.QGrid3D(qn=qn, qmax=qmax, slab_size=2*qn*qn).rotated(R)
+        self.assertEqual(len(G.get_slabs()), 4)
+        qmap0 = scattering_vector.QGrid3D(qn=qn, qmax=qmax).get_qmap()
+        R_inv = Rotation(values=R.get_as_quaternion(), formalism="quaternion")
+        R_inv.invert()
+        qmap_exp = R_inv.rotate_vectors(qmap0.ravel()).reshape(qmap0.shape)
+        self.assertTrue(numpy.allclose(G.get_qmap(), qmap_exp))
+        self.assertTrue(numpy.allclose(G.get_qmap(order="zyx"), qmap_exp[:,:,:,::-1]))
+        self.assertTrue(numpy.allclose(G.evaluate(lambda q: q[:,:,:,0] - 2.j*q[:,:,:,2]), qmap_exp[:,:,:,0] - 2.j*qmap_exp[:,:,:,2]))
+        v = numpy.array([3E-9, -7E-9, 11E-9])
+        self.assertTrue(numpy.allclose(G.apply_phase_ramp(numpy.ones((qn, qn, qn), dtype=numpy.complex128), v), numpy.exp(-1.j*qmap_exp.dot(v))))
+
+    def test_qgrid_3d_subgrid(self):
+        # Slabs of the grid have to reproduce the corresponding parts of the entire volume
+        qn = 8
+        G = scattering_vector.QGrid3D(qn=qn, qmax=1E9)
+        v = numpy.array([3E-9, -7E-9, 11E-9])
+        F = G.apply_phase_ramp(numpy.ones((qn, qn, qn), dtype=numpy.complex128), v)
+        for z0, z1 in [(0, 3), (3, 8)]:
+            S = G.get_subgrid(z0, z1)
+            self.assertEqual(S.shape, (z1-z0, qn, qn, 3))
+            self.assertTrue(numpy.allclose(S.get_qmap(), G.get_qmap()[z0:z1]))
+            self.assertTrue(numpy.allclose(S.get_abs_q(), G.get_abs_q()[z0:z1]))
+            self.assertTrue(numpy.allclose(S.get_structure_factor([v]), F[z0:z1]))
+
+    def test_qgrid_3d_threads(self):
+        # Parallel evaluation of slabs has to give the same result as serial evaluation
+        qn = 10
+        G1 = scattering_vector.QGrid3D(qn=qn, qmax=1E9)
+        G4 = scattering_vector.QGrid3D(qn=qn, qmax=1E9, n_threads=4)
+        self.assertEqual(len(G4.get_slabs()), 4)
+        f = lambda q: numpy.exp(-1.j*q[:,:,:,0]*1E-9) * q[:,:,:,2]
+        self.assertTrue(numpy.array_equal(G1.evaluate(f), G4.evaluate(f)))
+        g = lambda q: numpy.sinc(q*1E-9)
+        self.assertTrue(numpy.array_equal(G1.evaluate_abs_q(g, dtype=numpy.float64), G4.evaluate_abs_q(g, dtype=numpy.float64)))
+        self.assertTrue(numpy.allclose(G1.evaluate_abs_q(g, dtype=numpy.float64), g(G1.get_abs_q())))
@@ -0,0 +1,30 @@
+import unittest
+import numpy
+from condor.utils.rotation import Rotation
+from condor.utils import spheroid_diffraction
+
+class TestCaseSpheroidDiffraction(unittest.TestCase):
+    def test_ellipsoid_vs_spheroid(self):
+        # Fused evaluator has to agree with the spheroid formula in the plane q_z = 0
+        a = 40E-9
+        c = 70E-9
+        qmap = numpy.zeros((30, 40, 3))
+        qmap[:,:,0], qmap[:,:,1] = numpy.meshgrid(numpy.linspace(-2E8, 2E8, 40), numpy.linspace(-1.5E8, 1.5E8, 30))
+        for i in range(5):
+            R = Rotation(formalism="random")
+            v = R.rotate_vector(numpy.array([0., 1., 0.]))
+            theta = numpy.arcsin(v[2])
+            phi = numpy.arctan2(-v[0], v[1])
+            F_spheroid = spheroid_diffraction.F_spheroid_diffraction(2., qmap[:,:,0], qmap[:,:,1], a, c, theta, phi)
+            F_ellipsoid = spheroid_diffraction.F_ellipsoid_diffraction(2., qmap, a, c, a, extrinsic_rotation=R)
+            self.assertTrue(numpy.allclose(F_spheroid, F_ellipsoid, atol=1E-6))
+
+    def test_ellipsoid_output(self):
+        qmap = numpy.random.randn(20, 3) * 1E8
+        qmap[0] = 0.
+        F = spheroid_diffraction.F_ellipsoid_diffraction(1., qmap, 30E-9, 50E-9, 70E-9)
+        self.assertAlmostEqual(F[0], 1.)
+        out = numpy.empty(20, dtype=numpy.float32)
+        F32 = spheroid_diffraction.F_ellipsoid_diffraction(1., qmap, 30E-9, 50E-9, 70E-9, out=out)
+        self.assertTrue(F32 is out)
+        self.assertTrue(numpy.allclose(F, F32, atol=1E-5))
@@ -0,0 +1,39 @@
+import unittest
+import numpy
+from condor.utils import symmetry
+from condor.utils import scattering_vector
+from condor.utils.rotation import Rotation
+
+class TestCaseSymmetry(unittest.TestCase):
+    def test_grid_symmetry_operations(self):
+        # Orders of the subgroups that map the Cartesian grid onto itself
+        self.assertEqual(len(symmetry.get_grid_symmetry_operations("spherical")), 48)
+        self.assertEqual(len(symmetry.get_grid_symmetry_operations("cubic")), 48)
+        self.assertEqual(len(symmetry.get_grid_symmetry_operations("icosahedral")), 24)
+        self.assertEqual(len(symmetry.get_grid_symmetry_operations("uniaxial")), 16)
+        # A generic rotation leaves only the inversion (and the identity)
+        R = Rotation(values=numpy.array([0.9, 0.2, -0.3, 0.25])/numpy.sqrt(0.9**2+0.2**2+0.3**2+0.25**2), formalism="quaternion")
+        self.assertEqual(len(symmetry.get_grid_symmetry_operations("icosahedral", R)), 2)
+
+    def test_symmetric_evaluation(self):
+        # Filling the grid by symmetry has to reproduce direct evaluation, also with an origin offset
+        qn = 9
+        a = numpy.array([1., 2., 1.])*1E-9
+        v = numpy.array([2E-9, -1E-9, 0.5E-9])
+        f = lambda q: numpy.exp(-((q*a)**2).sum(axis=-1)) * numpy.exp(-1.j*q.dot(v))
+        G = scattering_vector.QGrid3D(qn=qn, qmax=1E9, use_symmetry=True)
+        ops = symmetry.get_grid_symmetry_operations("uniaxial")
+        unit, representative, conjugated = G.get_asymmetric_unit(ops)
+        self.assertEqual(len(unit), 5*15)
+        self.assertTrue(numpy.allclose(G.evaluate(f, symmetry=ops, symmetry_origin=v), f(G.get_qmap())))
+
+    def test_friedel_evaluation(self):
+        # Transform of a real (non-centrosymmetric) density, only half of the Friedel mates are evaluated
+        qn = 8
+        r = numpy.array([[1E-9, 0., 0.], [-0.3E-9, 2E-9, 0.7E-9]])
+        v = numpy.array([0.5E-9, 0., -1E-9])
+        f = lambda q: numpy.exp(-1.j*q.dot(r.T)).sum(axis=-1) * numpy.exp(-1.j*q.dot(v))
+        G = scattering_vector.QGrid3D(qn=qn, qmax=1E9)
+        unit, representative, conjugated = G.get_asymmetric_unit([numpy.identity(3), -numpy.identity(3)], [False, True])
+        self.assertEqual(len(unit), qn**3/2)
+        self.assertTrue(numpy.allclose(G.evaluate(f, friedel=True, symmetry_origin=v), f(G.get_qmap())))
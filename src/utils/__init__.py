@@ -35,13 +35,20 @@ import nfft
 import icosahedron
 # Native python code
 import bodies
+import buffers
+import diskcache
 import diffraction
 import linalg
 import log
 import pixelmask
 import resample
+import rng
 import scattering_vector
 import sphere_diffraction
 import spheroid_diffraction
+import bead_diffraction
+import cylinder_diffraction
+import lattice_diffraction
+import symmetry
 import variation
 import cxiwriter
@@ -0,0 +1,68 @@
+# -----------------------------------------------------------------------------------------------------
+# CONDOR
+# Simulator for diffractive single-particle imaging experiments with X-ray lasers
+# http://xfel.icm.uu.se/condor/
+# -----------------------------------------------------------------------------------------------------
+# Copyright 2016 Max Hantke, Filipe R.N.C. Maia, Tomas Ekeberg
+# Condor is distributed under the terms of the BSD 2-Clause License
+# -----------------------------------------------------------------------------------------------------
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------------------------------
+# General note:
+# All variables are in SI units by default. Exceptions explicit by variable name.
+# -----------------------------------------------------------------------------------------------------
+
+import numpy
+
+def F_bead_diffraction(qmap, positions, sigmas, weights, chunk_size=4194304):
+    r"""
+    Scattering amplitude from a set of Gaussian beads (form factor sum without intensity scaling)
+
+    .. math::
+
+      F(\vec{q}) = \sum_j n_j \, e^{-q^2 \sigma_j^2 / 2} \, e^{-i \vec{q} \cdot \vec{r}_j}
+
+    The sum is evaluated as a matrix product over blocks of scattering vectors with at most ``chunk_size`` elements (scattering vectors times beads) in memory at once.
+
+    Args:
+      :qmap (array): Scattering vectors [*qx*, *qy*, *qz*] in unit inverse meter. Array shape: (..., 3)
+
+      :positions (array): Bead centres :math:`\vec{r}_j` [*x*, *y*, *z*] in unit meter. Array shape: (:math:`N`, 3)
+
+      :sigmas (float/array): Standard deviation(s) :math:`\sigma_j` of the Gaussian beads in unit meter. Array shape: (:math:`N`,)
+
+      :weights (array): Real or complex weights :math:`n_j` of the beads (for example numbers of electrons). Array shape: (:math:`N`,)
+
+    Kwargs:
+      :chunk_size (int): Maximum number of matrix elements that are computed at once (default ``4194304``)
+    """
+    positions = numpy.asarray(positions, dtype=numpy.float64)
+    sigmas2   = numpy.asarray(sigmas, dtype=numpy.float64)**2 * numpy.ones(len(positions))
+    weights   = numpy.asarray(weights) * numpy.ones(len(positions))
+    shape = qmap.shape[:-1]
+    q = qmap.reshape((qmap.size/3, 3))
+    F = numpy.zeros(len(q), dtype=numpy.result_type(q.dtype, numpy.complex64))
+    n_q = max([1, chunk_size/len(positions)])
+    for i0 in range(0, len(q), n_q):
+        qc = q[i0:i0+n_q]
+        q2 = (qc**2).sum(axis=1)
+        F[i0:i0+n_q] = numpy.exp(-0.5*q2[:,numpy.newaxis]*sigmas2 - 1.j*qc.dot(positions.T)).dot(weights)
+    return F.reshape(shape)
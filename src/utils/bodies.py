@@ -97,6 +97,53 @@ def make_spheroid_map(N, nA, nC, rotation=None):
     spheroidmap[spheroidmap>1] = 0
     return spheroidmap
 
+def make_gaussian_map(N, positions, sigmas, weights, truncation=3., chunk_size=10000):
+    """
+    Generate a 3D map by splatting Gaussian kernels onto a regular grid
+
+    Every kernel is sampled on the grid points within ``truncation`` standard deviations and normalised such that its samples sum up to its weight. The map values are therefore integrated quantities per voxel (divide by the voxel volume for a density).
+
+    Args:
+      :N (int): Edge length of the grid in unit pixels
+
+      :positions (array): Kernel centres [*z*, *y*, *x*] in unit pixels with respect to the grid origin (voxel ``[0,0,0]``). Array shape: (:math:`n`, 3)
+
+      :sigmas (float/array): Standard deviation(s) of the kernels in unit pixels. Array shape: (:math:`n`,)
+
+      :weights (array): Real or complex weights of the kernels. Array shape: (:math:`n`,)
+
+    Kwargs:
+      :truncation (float): Kernels are truncated at this multiple of their standard deviation (default ``3.``)
+
+      :chunk_size (int): Number of kernels that are splatted at once (default ``10000``)
+    """
+    positions = numpy.asarray(positions, dtype=numpy.float64)
+    weights   = numpy.asarray(weights)
+    sigmas    = numpy.asarray(sigmas, dtype=numpy.float64) * numpy.ones(len(positions))
+    gmap = numpy.zeros(N**3, dtype=(numpy.complex128 if numpy.iscomplexobj(weights) else numpy.float64))
+    # Kernels of equal width share the same stencil
+    for sigma in numpy.unique(sigmas):
+        sel = sigmas == sigma
+        r = int(numpy.ceil(truncation*sigma))
+        d = numpy.arange(-r, r+2)
+        for i0 in range(0, sel.sum(), chunk_size):
+            p = positions[sel][i0:i0+chunk_size]
+            w = weights[sel][i0:i0+chunk_size]
+            i = numpy.int64(numpy.floor(p))[:,:,numpy.newaxis] + d
+            # Separable kernel: one row of samples per axis
+            g = numpy.exp(-0.5*((i-p[:,:,numpy.newaxis])/sigma)**2)
+            g = g / g.sum(axis=2)[:,:,numpy.newaxis]
+            g[(i < 0) | (i >= N)] = 0.
+            i = numpy.clip(i, 0, N-1)
+            values = w[:,None,None,None] * g[:,0,:,None,None] * g[:,1,None,:,None] * g[:,2,None,None,:]
+            indices = (i[:,0,:,None,None]*N + i[:,1,None,:,None])*N + i[:,2,None,None,:]
+            if numpy.iscomplexobj(gmap):
+                gmap += numpy.bincount(indices.ravel(), weights=values.real.ravel(), minlength=N**3)
+                gmap += 1.j*numpy.bincount(indices.ravel(), weights=values.imag.ravel(), minlength=N**3)
+            else:
+                gmap += numpy.bincount(indices.ravel(), weights=values.ravel(), minlength=N**3)
+    return gmap.reshape((N,N,N))
+
 def make_icosahedron_map(N,nRmax,extrinsic_rotation=None):
     """
     Generate map of a uniform icosahedron (density = 1) on a regular grid
@@ -0,0 +1,118 @@
+# -----------------------------------------------------------------------------------------------------
+# CONDOR
+# Simulator for diffractive single-particle imaging experiments with X-ray lasers
+# http://xfel.icm.uu.se/condor/
+# -----------------------------------------------------------------------------------------------------
+# Copyright 2016 Max Hantke, Filipe R.N.C. Maia, Tomas Ekeberg
+# Condor is distributed under the terms of the BSD 2-Clause License
+# -----------------------------------------------------------------------------------------------------
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------------------------------
+# General note:
+# All variables are in SI units by default. Exceptions explicit by variable name.
+# -----------------------------------------------------------------------------------------------------
+
+
+import numpy
+
+import logging
+logger = logging.getLogger(__name__)
+
+from log import log_and_raise_error,log_warning,log_info,log_debug
+
+class BufferArena:
+    """
+    Pool of preallocated arrays that are reused by repeated calculations (for example by subsequent shots of a simulation)
+
+    Buffers are addressed by name. A buffer is only reallocated if a request needs more elements or a different data type than the buffer has, smaller requests return a view of the first elements of the existing buffer. The content of a buffer is undefined until it is written and is overwritten by the next user of the same name.
+
+    Arrays that only depend on a few parameters (for example the scattering vectors of a detector for a given geometry) are stored with :meth:`get_cached` and recalculated only if the parameters change. The numbers of requests of cached arrays that were served from the cache and that had to be calculated are counted in ``n_cache_hits`` and ``n_cache_misses``.
+    """
+    def __init__(self):
+        self._buffers = {}
+        self._cache = {}
+        self.n_allocations = 0
+        self.n_cache_hits = 0
+        self.n_cache_misses = 0
+
+    def get(self, name, shape, dtype):
+        """
+        Return the buffer of the given name as an uninitialised array of the requested shape and data type
+
+        Args:
+          :name (str): Name of the buffer
+
+          :shape (tuple): Shape of the array
+
+          :dtype: Data type of the array
+        """
+        shape = tuple(shape)
+        dtype = numpy.dtype(dtype)
+        size = int(numpy.prod(shape))
+        buf = self._buffers.get(name)
+        if buf is None or buf.dtype != dtype or buf.size < size:
+            log_debug(logger, "Allocating buffer %s of %i elements of type %s" % (name, size, dtype.name))
+            buf = numpy.empty(size, dtype=dtype)
+            self._buffers[name] = buf
+            self.n_allocations += 1
+        return buf[:size].reshape(shape)
+
+    def get_cached(self, name, key, function):
+        """
+        Return the array stored under the given name if it was calculated for the same key, otherwise calculate it by calling ``function()`` and store it
+
+        Args:
+          :name (str): Name of the array
+
+          :key: Parameters the array depends on, compared with ``==``
+
+          :function: Function without arguments that calculates the array
+        """
+        if name in self._cache and self._cache[name][0] == key:
+            self.n_cache_hits += 1
+            return self._cache[name][1]
+        log_debug(logger, "Calculating cached array %s" % name)
+        self.n_cache_misses += 1
+        value = function()
+        self._cache[name] = (key, value)
+        self.n_allocations += 1
+        return value
+
+    def get_nbytes(self):
+        """
+        Return the total number of bytes held by the buffers and cached arrays
+        """
+        return sum([buf.nbytes for buf in self._buffers.values()]) + sum([numpy.asarray(v).nbytes for k, v in self._cache.values()])
+
+    def clear(self):
+        """
+        Release all buffers and cached arrays
+        """
+        self._buffers = {}
+        self._cache = {}
+
+def get_buffer(buffers, name, shape, dtype):
+    """
+    Return the buffer of the given name from the :class:`BufferArena` instance ``buffers``, or a new uninitialised array if ``buffers`` is ``None``
+    """
+    if buffers is None:
+        return numpy.empty(shape, dtype=dtype)
+    return buffers.get(name, shape, dtype)
@@ -134,7 +134,11 @@ def _estimate_type(var):
 
 def _str_to_list(s):
     if s.startswith("[") and s.endswith("]"):
-        if s[1:-1].startswith("[") and s[1:-1].endswith("]"):
+        l = _split_top_level(s[1:-1])
+        if len(l) > 1 and all([w.startswith("[") for w in l]):
+            # Nested list, e.g. [[1,2,3],[4,5,6]]
+            return [_str_to_list(w) for w in l]
+        elif s[1:-1].startswith("[") and s[1:-1].endswith("]"):
             return _str_to_list(s[1:-1])
         else:
             l = s[1:-1].split(",")
@@ -142,6 +146,21 @@ def _str_to_list(s):
             return l
     else:
         return s
+
+def _split_top_level(s):
+    l = []
+    depth = 0
+    w = ""
+    for c in s:
+        if c == "," and depth == 0:
+            l.append(w)
+            w = ""
+            continue
+        depth += {"[": 1, "]": -1}.get(c, 0)
+        w += c
+    if len(w) > 0:
+        l.append(w)
+    return l
        
 def _list_to_str(L):
     if (hasattr(L, '__len__') and (not isinstance(L, str))) or isinstance(L, list):
@@ -43,12 +43,39 @@ except ImportError:
     log.log_warning(logger, "Could not import h5py.")
 
 class CXIWriter:
-    def __init__(self, filename, chunksize=2, gzip_compression=False):
+    """
+    Writer of the outputs of a series of shots to the stacks of a CXI file (one stack position per call of :meth:`write`)
+
+    The number of completely written frames is stored in the file after every frame. A run that was interrupted can therefore be resumed by opening the file with ``append=True`` and continuing with the frame returned by :meth:`get_number_of_frames`, for example for an experiment with a seed (see :class:`condor.experiment.Experiment`):
+
+    .. code-block:: python
+
+      W = condor.utils.cxiwriter.CXIWriter("condor.cxi", append=True)
+      for shot in range(W.get_number_of_frames(), number_of_shots):
+          W.write(E.propagate(shot=shot))
+      W.close()
+
+    Args:
+      :filename (str): Name of the CXI file
+
+    Kwargs:
+      :chunksize (int): Number of stack positions by which the datasets grow (default ``2``)
+
+      :gzip_compression (bool): If ``True`` the datasets are compressed with gzip (default ``False``)
+
+      :append (bool): If ``True`` and the file exists the frames are appended to the frames in the file, otherwise the file is overwritten (default ``False``)
+    """
+    def __init__(self, filename, chunksize=2, gzip_compression=False, append=False):
         self._filename = os.path.expandvars(filename)
-        if os.path.exists(filename):
-            log.log_warning(logger, "File %s exists and is being overwritten" % filename)
-        self._f = h5py.File(filename, "w")
-        self._i = 0
+        if append and os.path.exists(self._filename):
+            self._f = h5py.File(self._filename, "r+")
+            self._i = self._read_number_of_frames()
+            log.log_info(logger, "Appending to %i frames in file %s" % (self._i, self._filename))
+        else:
+            if os.path.exists(filename):
+                log.log_warning(logger, "File %s exists and is being overwritten" % filename)
+            self._f = h5py.File(filename, "w")
+            self._i = 0
         self._chunksize = chunksize
         self._create_dataset_kwargs = {}
         if gzip_compression:
@@ -56,8 +83,24 @@ class CXIWriter:
 
     def write(self, D):
         self._write_without_iterate(D)
-        self._f.flush()
         self._i += 1
+        # Frames beyond this number may be incomplete if the run is interrupted
+        self._f.attrs["number_of_frames"] = self._i
+        self._f.flush()
+
+    def get_number_of_frames(self):
+        """
+        Return the number of frames that have been written to the file
+        """
+        return self._i
+
+    def _read_number_of_frames(self):
+        if "number_of_frames" in self._f.attrs:
+            return int(self._f.attrs["number_of_frames"])
+        # Files that were closed without the attribute have stacks of the length of the number of frames
+        lengths = []
+        self._f.visititems(lambda name, obj: lengths.append(obj.shape[0]) if isinstance(obj, h5py.Dataset) and len(obj.shape) > 0 else None)
+        return min(lengths) if len(lengths) > 0 else 0
         
     def _write_without_iterate(self, D, group_prefix="/"):
         for k in D.keys():
@@ -111,6 +154,36 @@ class CXIWriter:
                 else:
                     self._f[name][self._i,:] = data[:]
 
+    def write_slab(self, name, data, z0, shape):
+        """
+        Write a slab of a volume to the dataset with the given name at the current stack position without iterating the stack
+
+        The slab covers the indices z0:z0+len(data) along the first dimension of the volume. If the dataset does not exist yet it is created for volumes of the given shape with one chunk per slab.
+
+        Args:
+          :name (str): Full name of the dataset (for example ``'/entry_1/data_1/data'``)
+
+          :data (array): Slab data, array shape: (:math:`n_z`, ...)
+
+          :z0 (int): Index of the first slice of the slab in the volume
+
+          :shape (tuple): Shape of the entire volume
+        """
+        data = numpy.asarray(data)
+        if name not in self._f:
+            maxshape = tuple([None]+list(shape))
+            chunks = tuple([1]+list(data.shape))
+            log.log_debug(logger, "Create dataset %s [shape=%s, dtype=%s, chunks=%s]" % (name,str(shape),str(data.dtype),str(chunks)))
+            self._f.create_dataset(name, tuple([self._chunksize]+list(shape)), maxshape=maxshape, dtype=data.dtype, chunks=chunks, **self._create_dataset_kwargs)
+            self._f[name].attrs.modify("axes",["experiment_identifier" + ["", ":x", ":y:x", ":z:y:x"][len(shape)]])
+        if self._f[name].shape[0] <= self._i:
+            new_shape = tuple([self._chunksize*(self._i/self._chunksize+1)]+list(shape))
+            log.log_debug(logger, "Resize dataset %s [old shape: %s, new shape: %s]" % (name,str(self._f[name].shape),str(new_shape)))
+            self._f[name].resize(new_shape)
+        log.log_debug(logger, "Write slab %i:%i to dataset %s at stack position %i" % (z0, z0+data.shape[0], name, self._i))
+        self._f[name][self._i,z0:z0+data.shape[0]] = data
+        self._f.flush()
+
     def _shrink_stacks(self, group_prefix="/"):
         for k in self._f[group_prefix].keys():
             name = group_prefix + k
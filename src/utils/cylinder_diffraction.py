@@ -0,0 +1,83 @@
+# -----------------------------------------------------------------------------------------------------
+# CONDOR
+# Simulator for diffractive single-particle imaging experiments with X-ray lasers
+# http://xfel.icm.uu.se/condor/
+# -----------------------------------------------------------------------------------------------------
+# Copyright 2016 Max Hantke, Filipe R.N.C. Maia, Tomas Ekeberg
+# Condor is distributed under the terms of the BSD 2-Clause License
+# -----------------------------------------------------------------------------------------------------
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------------------------------
+# General note:
+# All variables are in SI units by default. Exceptions explicit by variable name.
+# -----------------------------------------------------------------------------------------------------
+
+import numpy
+from scipy.special import j1
+
+def F_cylinder_diffraction(K, qmap, r, l, extrinsic_rotation=None):
+    r"""
+    Scattering amplitude from homogeneous finite cylinder (ref. [Feigin1987]_)
+
+    The cylinder axis is alligned parallel to the :math:`y`-axis before the rotation is applied.
+
+    .. math::
+
+      F(\vec{q}) = \sqrt{K} \cdot f(\vec{q})
+
+      f(\vec{q}) = \frac{2 J_1(q_r r)}{q_r r} \cdot \frac{\sin(q_a l/2)}{q_a l/2}
+
+    :math:`q_a`: Component of the scattering vector parallel to the cylinder axis
+
+    :math:`q_r`: Component of the scattering vector perpendicular to the cylinder axis
+
+    Args:
+      :K (float): Intensity scaling factor :math:`K = I_0 \left(\rho_e \frac{p}{D} r_0 V\right)^2` with :math:`V = \pi r^2 l` denoting the cylinder volume
+
+      :qmap (array): Scattering vectors [*qx*, *qy*, *qz*] in unit inverse meter. Array shape: (..., 3)
+
+      :r (float): Cylinder radius in unit meter
+
+      :l (float): Cylinder length in unit meter
+
+    Kwargs:
+      :extrinsic_rotation (:class:`condor.utils.rotation.Rotation`): Extrinsic rotation of the cylinder. If ``None`` no rotation is applied (default ``None``)
+    """
+    # Cylinder axis after rotation
+    v = numpy.array([0., 1., 0.])
+    if extrinsic_rotation is not None:
+        v = extrinsic_rotation.rotate_vector(v)
+    q_a = qmap.dot(v.astype(qmap.dtype))
+    q_r = numpy.sqrt(abs((qmap**2).sum(axis=-1) - q_a**2)) * r
+    q_a *= l/2.
+    # Radial part: 2 J1(x)/x with the limit 1 for x -> 0
+    small = q_r < 1E-6
+    q_r[small] = 1.
+    f = 2*j1(q_r)/q_r
+    f[small] = 1.
+    # Axial part: sin(x)/x
+    f *= numpy.sinc(q_a/numpy.pi)
+    return numpy.sqrt(abs(K)) * f
+
+to_cylinder_volume = lambda r,l: numpy.pi*r**2*l
+"""
+Volume of a cylinder with radius :math:`r` and length :math:`l`
+"""
@@ -132,3 +132,36 @@ def polarization_factor(x, y, detector_distance, polarization="ignore"):
         elif polarization == "unpolarized":
             P = ( 1. + numpy.cos( numpy.arcsin(numpy.sqrt(x**2+y**2)/r) )**2 )
     return P
+
+def structure_factor(qmap, positions, weights=None, chunk_size=4194304):
+    r"""
+    Returns the structure factor :math:`S` of a set of identical scatterers
+
+    .. math::
+
+      S(\vec{q}) = \sum_j w_j \, e^{-i \vec{q} \cdot \vec{r}_j}
+
+    The sum is evaluated as a matrix product over blocks of scattering vectors with at most ``chunk_size`` elements (scattering vectors times scatterers) in memory at once.
+
+    Args:
+      :qmap (array): Scattering vectors [*qx*, *qy*, *qz*] in unit inverse meter. Array shape: (..., 3)
+
+      :positions (array): Positions :math:`\vec{r}_j` [*x*, *y*, *z*] of the scatterers in unit meter. Array shape: (:math:`N`, 3)
+
+    Kwargs:
+      :weights (array): Real or complex weights :math:`w_j` of the scatterers. If ``None`` all weights are set to one (default ``None``). Array shape: (:math:`N`,)
+
+      :chunk_size (int): Maximum number of matrix elements that are computed at once (default ``4194304``)
+    """
+    positions = numpy.asarray(positions, dtype=numpy.float64).reshape((-1, 3))
+    if weights is None:
+        weights = numpy.ones(len(positions))
+    else:
+        weights = numpy.asarray(weights) * numpy.ones(len(positions))
+    shape = qmap.shape[:-1]
+    q = qmap.reshape((qmap.size/3, 3))
+    S = numpy.zeros(len(q), dtype=numpy.result_type(q.dtype, numpy.complex64))
+    n_q = max([1, chunk_size/len(positions)])
+    for i0 in range(0, len(q), n_q):
+        S[i0:i0+n_q] = numpy.exp(-1.j*q[i0:i0+n_q].dot(positions.T)).dot(weights)
+    return S.reshape(shape)
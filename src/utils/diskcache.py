@@ -0,0 +1,174 @@
+# -----------------------------------------------------------------------------------------------------
+# CONDOR
+# Simulator for diffractive single-particle imaging experiments with X-ray lasers
+# http://xfel.icm.uu.se/condor/
+# -----------------------------------------------------------------------------------------------------
+# Copyright 2016 Max Hantke, Filipe R.N.C. Maia, Tomas Ekeberg
+# Condor is distributed under the terms of the BSD 2-Clause License
+# -----------------------------------------------------------------------------------------------------
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------------------------------
+# General note:
+# All variables are in SI units by default. Exceptions explicit by variable name.
+# -----------------------------------------------------------------------------------------------------
+
+
+
+import numpy, os, hashlib, tempfile, zipfile
+
+import logging
+logger = logging.getLogger(__name__)
+
+from log import log_and_raise_error,log_warning,log_info,log_debug
+
+class DiskCache:
+    """
+    Content-addressed store of arrays in a local directory that persists between runs
+
+    Entries are addressed by a digest of their parameters (see :func:`get_digest`) and stored in one ``.npz`` file per entry. If the files in the directory exceed the size limit the entries that were not read or written for the longest time are removed. The numbers of requests that were served from the directory and that were not found are counted in ``n_cache_hits`` and ``n_cache_misses``.
+
+    Args:
+      :directory (str): Cache directory, created if it does not exist
+
+    Kwargs:
+      :max_size (int): Maximum total size of the entries in bytes (default ``1E9``)
+    """
+    def __init__(self, directory, max_size=1E9):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.max_size = int(max_size)
+        self.n_cache_hits = 0
+        self.n_cache_misses = 0
+
+    def _get_filename(self, digest):
+        return os.path.join(self.directory, digest + ".npz")
+
+    def get(self, digest):
+        """
+        Return the dictionary of arrays stored under the given digest or ``None`` if there is no such entry
+
+        Args:
+          :digest (str): Digest of the parameters of the entry
+        """
+        filename = self._get_filename(digest)
+        try:
+            with numpy.load(filename) as f:
+                arrays = dict([(k, f[k]) for k in f.files])
+        except (IOError, ValueError, zipfile.BadZipfile):
+            # Missing entry, or an entry that was removed or truncated by another process
+            self.n_cache_misses += 1
+            return None
+        # Reading counts as use for the eviction of old entries
+        os.utime(filename, None)
+        self.n_cache_hits += 1
+        return arrays
+
+    def put(self, digest, **arrays):
+        """
+        Store the given arrays under the given digest and remove old entries if the size limit is exceeded
+
+        Args:
+          :digest (str): Digest of the parameters of the entry
+
+        Kwargs:
+          Arrays to store, keyed by name
+        """
+        # Written to a temporary file first so that readers never see an incomplete entry
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            numpy.savez(f, **arrays)
+        os.rename(tmp, self._get_filename(digest))
+        self._limit_size()
+
+    def get_nbytes(self):
+        """
+        Return the total size of the entries in bytes
+        """
+        return sum([os.path.getsize(filename) for filename, mtime in self._get_entries()])
+
+    def clear(self):
+        """
+        Remove all entries
+        """
+        for filename, mtime in self._get_entries():
+            os.remove(filename)
+
+    def _get_entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz"):
+                filename = os.path.join(self.directory, name)
+                try:
+                    entries.append((filename, os.path.getmtime(filename)))
+                except OSError:
+                    pass
+        return entries
+
+    def _limit_size(self):
+        entries = sorted(self._get_entries(), key=lambda e: e[1])
+        sizes = [os.path.getsize(filename) for filename, mtime in entries]
+        nbytes = sum(sizes)
+        for (filename, mtime), size in zip(entries, sizes):
+            if nbytes <= self.max_size:
+                break
+            log_debug(logger, "Removing cache entry %s" % filename)
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+            nbytes -= size
+
+def get_digest(obj):
+    """
+    Return a hexadecimal SHA-1 digest of a (nested) structure of dictionaries, lists, tuples, arrays and scalars that is equal for equal content
+
+    Args:
+      :obj: Structure to digest
+    """
+    h = hashlib.sha1()
+    _update_digest(h, obj)
+    return h.hexdigest()
+
+def _update_digest(h, obj):
+    if isinstance(obj, dict):
+        h.update("{")
+        for k in sorted(obj.keys()):
+            _update_digest(h, k)
+            _update_digest(h, obj[k])
+        h.update("}")
+    elif isinstance(obj, (list, tuple)):
+        h.update("(")
+        for v in obj:
+            _update_digest(h, v)
+        h.update(")")
+    elif isinstance(obj, numpy.ndarray):
+        a = numpy.ascontiguousarray(obj)
+        h.update("array%s%s" % (a.dtype.str, a.shape))
+        h.update(a.tostring() if a.dtype != object else repr(a.tolist()))
+    elif hasattr(obj, "get_conf"):
+        # Model instances (for example the unit cell of a crystal) are digested by their configuration, not by their address in memory
+        h.update("%s:" % obj.__class__.__name__)
+        _update_digest(h, obj.get_conf())
+    else:
+        # Scalars of numpy and python types with equal values have equal representations
+        h.update(repr(obj.item() if isinstance(obj, numpy.generic) else obj))
+        h.update(";")
@@ -0,0 +1,93 @@
+# -----------------------------------------------------------------------------------------------------
+# CONDOR
+# Simulator for diffractive single-particle imaging experiments with X-ray lasers
+# http://xfel.icm.uu.se/condor/
+# -----------------------------------------------------------------------------------------------------
+# Copyright 2016 Max Hantke, Filipe R.N.C. Maia, Tomas Ekeberg
+# Condor is distributed under the terms of the BSD 2-Clause License
+# -----------------------------------------------------------------------------------------------------
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------------------------------
+# General note:
+# All variables are in SI units by default. Exceptions explicit by variable name.
+# -----------------------------------------------------------------------------------------------------
+
+import numpy
+
+import nfft
+
+def laue_function(N, x):
+    r"""
+    Return the Laue interference function of a row of :math:`N` equidistant scatterers centred around the origin
+
+    .. math::
+
+      L_N(x) = \sum_{n=0}^{N-1} e^{-i x (n - (N-1)/2)} = \frac{\sin(N x/2)}{\sin(x/2)}
+
+    Args:
+      :N (int): Number of scatterers
+
+      :x (array): Phase difference between neighbouring scatterers
+    """
+    x = numpy.asarray(x, dtype=numpy.float64)
+    s = numpy.sin(x/2.)
+    small = abs(s) < 1E-9
+    s[small] = 1.
+    L = numpy.sin(N*x/2.)/s
+    # Bragg condition (limit for x -> 2 pi m)
+    L[small] = N*numpy.cos(N*x[small]/2.)/numpy.cos(x[small]/2.)
+    return L
+
+def F_lattice_diffraction(qmap, lattice_vectors, shape, mask=None, extrinsic_rotation=None):
+    r"""
+    Return the lattice factor :math:`S(\vec{q}) = \sum_{\vec{n}} e^{-i \vec{q}\cdot(n_a \vec{a} + n_b \vec{b} + n_c \vec{c})}` of a finite crystal
+
+    The lattice points are centred around the origin. For a full block of :math:`N_a \times N_b \times N_c` unit cells the sum is the product of three Laue functions (see :func:`laue_function`). If an occupancy ``mask`` is given the sum is evaluated with the NFFT of the mask at the fractional Miller indices :math:`h_k = \vec{q}\cdot\vec{a}_k / 2\pi`.
+
+    Args:
+      :qmap (array): Scattering vectors [*qx*, *qy*, *qz*] in unit inverse meter. Array shape: (..., 3)
+
+      :lattice_vectors (array): Lattice vectors :math:`\vec{a}`, :math:`\vec{b}`, :math:`\vec{c}` [*x*, *y*, *z*] in unit meter as rows of a 3 x 3 array
+
+      :shape (array): Number of unit cells :math:`[N_a, N_b, N_c]` along the lattice vectors
+
+    Kwargs:
+      :mask (array): Boolean occupancy mask of shape ``shape`` that defines the crystal shape. If ``None`` all unit cells are occupied (default ``None``)
+
+      :extrinsic_rotation (:class:`condor.utils.rotation.Rotation`): Extrinsic rotation of the crystal. If ``None`` no rotation is applied (default ``None``)
+    """
+    A = numpy.array(lattice_vectors, dtype=numpy.float64)
+    if extrinsic_rotation is not None:
+        A = A.dot(extrinsic_rotation.get_as_rotation_matrix().T)
+    # Phase differences between neighbouring unit cells along a, b and c
+    x = qmap.dot(A.T)
+    if mask is None:
+        S = laue_function(shape[0], x[...,0]) * laue_function(shape[1], x[...,1]) * laue_function(shape[2], x[...,2])
+    else:
+        mask = numpy.asarray(mask)
+        # The lattice factor is periodic in the fractional Miller indices
+        h = x.reshape((x.size/3, 3)) / (2*numpy.pi)
+        S = nfft.nfft(numpy.complex128(mask), h - numpy.floor(h + 0.5))
+        # The NFFT places the origin at index N/2, shift it to the centre (N-1)/2 (not periodic in h for even N)
+        d = numpy.array([n/2 - (n-1)/2. for n in mask.shape])
+        S *= numpy.exp(-2.j*numpy.pi*h.dot(d))
+        S = S.reshape(x.shape[:-1])
+    return S
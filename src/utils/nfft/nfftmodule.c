@@ -12,18 +12,21 @@
 
 
 
-PyDoc_STRVAR(nfft__doc__, "nfft(real_space, coordinates)\n\nCalculate nfft from arbitrary dimensional array.\nreal_space should be an array (or any object that can trivially be converted to one.\ncoordinates should be a NxD array where N is the number of points where the Fourier transform should be evaluated and D is the dimensionality of the input array");
-static PyObject *nfft(PyObject *self, PyObject *args, PyObject *kwargs)
+/* Calculate the transform of in_obj at coord_obj. If out_obj is NULL a new output array is returned,
+   otherwise the result is written into out_obj (a C-contiguous complex128 or complex64 array with one
+   element per point) and a new reference to out_obj is returned. */
+static PyObject *transform(PyObject *in_obj, PyObject *coord_obj, PyObject *out_obj)
 {
-  PyObject *in_obj, *coord_obj;
-
-  
-  
-  static char *kwlist[] = {"real_space", "coordinates", NULL};
-  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OO", kwlist, &in_obj, &coord_obj)) {
-    return NULL;
+  /* Single precision input is transformed in double precision and returned in single precision */
+  int single_precision = PyArray_Check(in_obj) && PyArray_TYPE((PyArrayObject *)in_obj) == NPY_COMPLEX64;
+  if (out_obj != NULL) {
+    if (!PyArray_Check(out_obj) || !PyArray_ISCARRAY((PyArrayObject *)out_obj) ||
+	(PyArray_TYPE((PyArrayObject *)out_obj) != NPY_COMPLEX128 && PyArray_TYPE((PyArrayObject *)out_obj) != NPY_COMPLEX64)) {
+      PyErr_SetString(PyExc_ValueError, "Output must be a writeable C-contiguous array of type complex128 or complex64.\n");
+      return NULL;
+    }
+    single_precision = PyArray_TYPE((PyArrayObject *)out_obj) == NPY_COMPLEX64;
   }
-  
   PyObject *coord_array = PyArray_FROM_OTF(coord_obj, NPY_DOUBLE, NPY_IN_ARRAY);
   PyObject *in_array = PyArray_FROM_OTF(in_obj, NPY_COMPLEX128, NPY_IN_ARRAY);
   if (coord_array == NULL || in_array == NULL) {
@@ -35,6 +38,8 @@ static PyObject *nfft(PyObject *self, PyObject *args, PyObject *kwargs)
   int ndim = PyArray_NDIM(in_array);
   if (ndim <= 0) {
     PyErr_SetString(PyExc_ValueError, "Input array can't be 0 dimensional\n");
+    Py_XDECREF(coord_array);
+    Py_XDECREF(in_array);
     return NULL;
   }
 
@@ -46,6 +51,12 @@ static PyObject *nfft(PyObject *self, PyObject *args, PyObject *kwargs)
   }
   int number_of_points = (int) PyArray_DIM(coord_array, 0);
 
+  if (out_obj != NULL && PyArray_SIZE((PyArrayObject *)out_obj) != number_of_points) {
+    PyErr_SetString(PyExc_ValueError, "Output array must have one element per point.\n");
+    Py_XDECREF(coord_array);
+    Py_XDECREF(in_array);
+    return NULL;
+  }
   
   nfft_plan my_plan;
   int total_number_of_pixels = 1;
@@ -66,15 +77,34 @@ static PyObject *nfft(PyObject *self, PyObject *args, PyObject *kwargs)
   memcpy(my_plan.f_hat, PyArray_DATA(in_array), total_number_of_pixels*sizeof(fftw_complex));
   memcpy(my_plan.x, PyArray_DATA(coord_array), ndim*number_of_points*sizeof(double));
   
+  /* Planning and clean-up call the FFTW planner, which is not thread-safe,
+     the precomputation and the transform itself run without the GIL */
+  Py_BEGIN_ALLOW_THREADS
   if (my_plan.nfft_flags &PRE_PSI) {
     nfft_precompute_one_psi(&my_plan);
   }
 
   nfft_trafo(&my_plan);
-
-  int out_dim[] = {number_of_points};
-  PyObject *out_array = (PyObject *)PyArray_FromDims(1, out_dim, NPY_COMPLEX128);
-  memcpy(PyArray_DATA(out_array), my_plan.f, number_of_points*sizeof(fftw_complex));
+  Py_END_ALLOW_THREADS
+
+  PyObject *out_array;
+  if (out_obj != NULL) {
+    Py_INCREF(out_obj);
+    out_array = out_obj;
+  } else {
+    int out_dim[] = {number_of_points};
+    out_array = (PyObject *)PyArray_FromDims(1, out_dim, single_precision ? NPY_COMPLEX64 : NPY_COMPLEX128);
+  }
+  if (single_precision) {
+    float *out_data = (float *)PyArray_DATA(out_array);
+    int i;
+    for (i = 0; i < number_of_points; ++i) {
+      out_data[2*i] = (float) my_plan.f[i][0];
+      out_data[2*i+1] = (float) my_plan.f[i][1];
+    }
+  } else {
+    memcpy(PyArray_DATA(out_array), my_plan.f, number_of_points*sizeof(fftw_complex));
+  }
 
   // Clean up memory
   
@@ -90,8 +120,38 @@ static PyObject *nfft(PyObject *self, PyObject *args, PyObject *kwargs)
   return out_array;
 }
 
+PyDoc_STRVAR(nfft__doc__, "nfft(real_space, coordinates)\n\nCalculate nfft from arbitrary dimensional array.\nreal_space should be an array (or any object that can trivially be converted to one.\ncoordinates should be a NxD array where N is the number of points where the Fourier transform should be evaluated and D is the dimensionality of the input array.\nThe transform is calculated in double precision, if real_space is a complex64 array the output is returned as complex64 array.");
+static PyObject *nfft(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+  PyObject *in_obj, *coord_obj;
+
+  static char *kwlist[] = {"real_space", "coordinates", NULL};
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OO", kwlist, &in_obj, &coord_obj)) {
+    return NULL;
+  }
+  return transform(in_obj, coord_obj, NULL);
+}
+
+PyDoc_STRVAR(nfft_inplace__doc__, "nfft_inplace(real_space, coordinates, output)\n\nCalculate nfft from arbitrary dimensional array and write the result into output.\nreal_space and coordinates are the same as for nfft.\noutput has to be a C-contiguous complex128 or complex64 array with one element per point, it can have any shape. No new array is allocated, this allows reusing the same output buffer for repeated transforms.");
+static PyObject *nfft_inplace(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+  PyObject *in_obj, *coord_obj, *out_obj;
+
+  static char *kwlist[] = {"real_space", "coordinates", "output", NULL};
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OOO", kwlist, &in_obj, &coord_obj, &out_obj)) {
+    return NULL;
+  }
+  PyObject *out_array = transform(in_obj, coord_obj, out_obj);
+  if (out_array == NULL) {
+    return NULL;
+  }
+  Py_DECREF(out_array);
+  Py_RETURN_NONE;
+}
+
 static PyMethodDef NfftMethods[] = {
   {"nfft", (PyCFunction)nfft, METH_VARARGS|METH_KEYWORDS, nfft__doc__},
+  {"nfft_inplace", (PyCFunction)nfft_inplace, METH_VARARGS|METH_KEYWORDS, nfft_inplace__doc__},
   {NULL, NULL, 0, NULL}
 };
 
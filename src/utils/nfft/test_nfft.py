@@ -63,12 +63,28 @@ class TestNfft(unittest.TestCase):
         ft_fftw = numpy.fft.fftshift(numpy.fft.fft(numpy.fft.fftshift(a)))
         numpy.testing.assert_almost_equal(ft_nfft, ft_fftw, decimal=self._decimals)
 
+    def test_nfft_single_precision(self):
+        a = numpy.random.random(self._size).astype("complex64")
+        ft_nfft = nfft.nfft(a, self._coord_1d)
+        self.assertEqual(ft_nfft.dtype, numpy.complex64)
+        ft_fftw = numpy.fft.fftshift(numpy.fft.fft(numpy.fft.fftshift(a)))
+        numpy.testing.assert_almost_equal(ft_nfft, ft_fftw, decimal=5)
+
     def test_nfft_inplace_1d(self):
         a = numpy.random.random(self._size)
         ft_nfft = numpy.empty(self._size, dtype="complex128")
         nfft.nfft_inplace(a, self._coord_1d, ft_nfft)
         ft_fftw = numpy.fft.fftshift(numpy.fft.fft(numpy.fft.fftshift(a)))
         numpy.testing.assert_almost_equal(ft_nfft, ft_fftw, decimal=self._decimals)
+
+    def test_nfft_inplace_single_precision(self):
+        a = numpy.random.random(self._size)
+        ft_nfft = numpy.empty((2, self._size/2), dtype="complex64")
+        nfft.nfft_inplace(a, self._coord_1d, ft_nfft)
+        ft_fftw = numpy.fft.fftshift(numpy.fft.fft(numpy.fft.fftshift(a)))
+        numpy.testing.assert_almost_equal(ft_nfft.flatten(), ft_fftw, decimal=5)
+        self.assertRaises(ValueError, nfft.nfft_inplace, a, self._coord_1d, numpy.empty(self._size, dtype="float64"))
+        self.assertRaises(ValueError, nfft.nfft_inplace, a, self._coord_1d, numpy.empty(self._size+1, dtype="complex128"))
             
     def test_nfft_2d(self):
         a = numpy.random.random((self._size, )*2)
@@ -0,0 +1,95 @@
+# -----------------------------------------------------------------------------------------------------
+# CONDOR
+# Simulator for diffractive single-particle imaging experiments with X-ray lasers
+# http://xfel.icm.uu.se/condor/
+# -----------------------------------------------------------------------------------------------------
+# Copyright 2016 Max Hantke, Filipe R.N.C. Maia, Tomas Ekeberg
+# Condor is distributed under the terms of the BSD 2-Clause License
+# -----------------------------------------------------------------------------------------------------
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------------------------------
+# General note:
+# All variables are in SI units by default. Exceptions explicit by variable name.
+# -----------------------------------------------------------------------------------------------------
+
+
+
+import numpy, contextlib, threading
+
+import logging
+logger = logging.getLogger(__name__)
+
+from log import log_and_raise_error,log_warning,log_info,log_debug
+
+# Source of all random numbers that are drawn for a shot (parameter variations, random rotations, numbers of particles, noise and backgrounds of the detector). Every thread has its own random state so that shots can be simulated in parallel threads
+_local = threading.local()
+
+def get_random_state():
+    """
+    Return the random state from which random numbers are drawn
+
+    By default this is the global random state of the :mod:`numpy.random` module (seeded by :func:`numpy.random.seed`). While :class:`condor.experiment.Experiment` simulates a shot with a seed every random number is drawn from the random state of that shot (see :func:`get_shot_random_state`). The random state is set for the calling thread only
+    """
+    return getattr(_local, "random_state", numpy.random)
+
+def set_random_state(random_state):
+    """
+    Set the random state from which random numbers are drawn in the calling thread and return the previous one
+
+    Args:
+      :random_state: :class:`numpy.random.RandomState` instance, or the :mod:`numpy.random` module for its global random state
+    """
+    previous = get_random_state()
+    _local.random_state = random_state
+    return previous
+
+def get_shot_random_state(seed, shot):
+    """
+    Return a random state that depends only on the seed and the index of the shot
+
+    The random numbers of a shot can therefore be reproduced without drawing the random numbers of the preceding shots. The state is initialised from the key [``seed``, ``shot``] (see :class:`numpy.random.RandomState`), different keys give independent streams of random numbers.
+
+    Args:
+      :seed (int): Seed of the run, 0 <= ``seed`` < 2\ :sup:`32`
+
+      :shot (int): Index of the shot, 0 <= ``shot`` < 2\ :sup:`32`
+    """
+    if seed < 0 or seed >= 2**32 or shot < 0 or shot >= 2**32:
+        log_and_raise_error(logger, "Seed (%i) and shot index (%i) have to be within 0 and 2**32-1." % (seed, shot))
+        return
+    return numpy.random.RandomState([seed, shot])
+
+@contextlib.contextmanager
+def using_random_state(random_state):
+    """
+    Context manager within which all random numbers are drawn from the given random state, the previous random state is restored at exit
+
+    Args:
+      :random_state: :class:`numpy.random.RandomState` instance. If ``None`` the random state is left unchanged
+    """
+    if random_state is None:
+        yield
+        return
+    previous = set_random_state(random_state)
+    try:
+        yield
+    finally:
+        set_random_state(previous)
@@ -9,6 +9,7 @@ logger = logging.getLogger(__name__)
 
 from log import log_and_raise_error,log_warning,log_info,log_debug
 import linalg
+from rng import get_random_state
 
 # CANONICAL ROTATION MATRICES   
 # Rotation matrix around x-axis - observing the right hand rule
@@ -167,21 +168,21 @@ class Rotation:
         """
         Set new random rotation around the :math:`x`-axis.
         """
-        ang = numpy.random.rand()*2*numpy.pi
+        ang = get_random_state().rand()*2*numpy.pi
         self.rotation_matrix = R_x(ang)
 
     def set_as_random_y(self):
         """
         Set new random rotation around the :math:`y`-axis.
         """
-        ang = numpy.random.rand()*2*numpy.pi
+        ang = get_random_state().rand()*2*numpy.pi
         self.rotation_matrix = R_y(ang)
 
     def set_as_random_z(self):
         """
         Set new random rotation around the :math:`z`-axis.
         """
-        ang = numpy.random.rand()*2*numpy.pi
+        ang = get_random_state().rand()*2*numpy.pi
         self.rotation_matrix = R_z(ang)
 
     def invert(self):
@@ -336,6 +337,15 @@ class Rotations:
         Return formalism that defines how the rotation values are geometrically interpreted
         """
         return self._formalism
+
+    def set_counter(self, i):
+        """
+        Set counter to the given value, the next rotation is then the ``i``-th rotation of the list (cyclically)
+
+        Args:
+          :i (int): Counter value
+        """
+        self._i = i
                 
     def get_next_rotation(self):
         """
@@ -347,6 +357,28 @@ class Rotations:
         self._i += 1
         return rotation
     
+    def get_next_quaternions(self, n):
+        """
+        Iterate ``n`` times and return the rotations as an array of quaternions of shape (``n``, 4)
+
+        Args:
+          :n (int): Number of rotations
+        """
+        if self._formalism == "random":
+            q = rand_quat(n)
+        elif self._formalism in ["random_x","random_y","random_z"]:
+            ang = get_random_state().rand(n)*2*numpy.pi
+            q = numpy.zeros(shape=(n, 4))
+            q[:,0] = numpy.cos(ang/2.)
+            q[:,["random_x","random_y","random_z"].index(self._formalism)+1] = numpy.sin(ang/2.)
+        else:
+            Q = numpy.array([rotation.get_as_quaternion() for rotation in self._rotations])
+            q = Q[(self._i + numpy.arange(n)) % len(self._rotations)]
+        if self._formalism in ["random","random_x","random_y","random_z"] and n > 0:
+            self._rotations[0].set_with_quaternion(q[-1])
+        self._i += n
+        return q
+    
     def get_current_rotation(self):
         """
         Return current rotation
@@ -390,7 +422,7 @@ def rotmx_from_quat(q):
     Create a rotation matrix from given quaternion ([Shoemake1992]_ page 128)
 
     Args:
-       :quaternion (array): :math:`q = w + ix + jy + kz` (``values``: :math:`[w,x,y,z]`)
+       :quaternion (array): :math:`q = w + ix + jy + kz` (``values``: :math:`[w,x,y,z]`). For an array of shape (4, n) of n quaternions the n rotation matrices are returned as an array of shape (3, 3, n)
 
     The direction of rotation follows the right hand rule
     """
@@ -641,11 +673,14 @@ def rotate_quat(v, q):
     """
     return quat_vec_mult(q, v)
 
-def rand_quat():
+def rand_quat(n=None):
     r""" 
     Obtain a uniform random rotation in quaternion representation ([Shoemake1992]_ pages 129f)  
+
+    Kwargs:
+       :n (int): If not ``None`` ``n`` random rotations are returned as an array of shape (``n``, 4) (default ``None``)
     """
-    x0,x1,x2 = numpy.random.random(3)
+    x0,x1,x2 = get_random_state().random_sample(3 if n is None else (3,n))
     theta1 = 2.*numpy.pi*x1
     theta2 = 2.*numpy.pi*x2
     s1 = numpy.sin(theta1)
@@ -655,4 +690,4 @@ def rand_quat():
     r1 = numpy.sqrt(1-x0)
     r2 = numpy.sqrt(x0)
     q = numpy.array([s1*r1, c1*r1, s2*r2, c2*r2])
-    return q
+    return q if n is None else q.T
@@ -31,6 +31,7 @@
 # -----------------------------------------------------------------------------------------------------
 
 import numpy, copy
+from multiprocessing.pool import ThreadPool
 
 import logging
 logger = logging.getLogger(__name__)
@@ -38,6 +39,7 @@ logger = logging.getLogger(__name__)
 from log import log_and_raise_error,log_warning,log_info,log_debug
 import rotation
 import linalg
+from rng import get_random_state
 
 
 def q_from_p(p, wavelength):
@@ -57,14 +59,14 @@ def q_from_p(p, wavelength):
     return q
 
 
-def generate_qmap(X,Y,pixel_size,detector_distance,wavelength,extrinsic_rotation=None, order="xyz"):
+def generate_qmap(X,Y,pixel_size,detector_distance,wavelength,extrinsic_rotation=None, order="xyz", dtype=numpy.float64):
     r"""
     Generate scattering vector map from experimental parameters
 
     Args:
-      :X (array): :math:`x`-coordinates of pixels in unit meter
+      :X (array): :math:`x`-coordinates of pixels in unit meter (any array shape)
 
-      :Y (array): :math:`y`-coordinates of pixels in unit meter
+      :Y (array): :math:`y`-coordinates of pixels in unit meter (same array shape as ``X``)
 
       :pixel_size (float): Pixel size (i.e. edge length) in unit meter
 
@@ -76,8 +78,12 @@ def generate_qmap(X,Y,pixel_size,detector_distance,wavelength,extrinsic_rotation
       :extrinsic_rotation (:class:`condor.utils.rotation.Rotation`): Extrinsic rotation of the sample. If ``None`` no rotation is applied (default ``None``)
 
       :order (str): Order of scattering vector coordinates in the output array. Choose either ``'xyz'`` or ``'zyx'`` (default ``'xyz'``)    
+
+      :dtype: Floating point type of the calculation and the output, for example ``numpy.float32`` (default ``numpy.float64``)
     """
-    log_debug(logger, "Allocating qmap (%i,%i,%i)" % (X.shape[0],X.shape[1],3))
+    log_debug(logger, "Allocating qmap %s" % str(X.shape + (3,)))
+    X = numpy.asarray(X, dtype=dtype)
+    Y = numpy.asarray(Y, dtype=dtype)
     R_Ewald = 2*numpy.pi/wavelength
     p_x = X*pixel_size
     p_y = Y*pixel_size
@@ -86,45 +92,391 @@ def generate_qmap(X,Y,pixel_size,detector_distance,wavelength,extrinsic_rotation
     r_x = p_x/l
     r_y = p_y/l
     r_z = p_z/l - 1.
-    qmap = numpy.zeros(shape=(X.shape[0],X.shape[1],3))
-    if order == "xyz":
-        qmap[:,:,0] = r_x * R_Ewald
-        qmap[:,:,1] = r_y * R_Ewald
-        qmap[:,:,2] = r_z * R_Ewald
-    elif order == "zyx":
-        qmap[:,:,0] = r_z * R_Ewald
-        qmap[:,:,1] = r_y * R_Ewald
-        qmap[:,:,2] = r_x * R_Ewald
-    else:
-        log_and_raise_error(logger, "Indexing with order=%s is invalid." % order)
+    qmap = numpy.zeros(shape=X.shape+(3,), dtype=dtype)
+    qmap[...,0] = r_x * R_Ewald
+    qmap[...,1] = r_y * R_Ewald
+    qmap[...,2] = r_z * R_Ewald
     if extrinsic_rotation is not None:
         log_debug(logger, "Applying qmap rotation.")
-        intrinsic_rotation = copy.deepcopy(extrinsic_rotation)
-        intrinsic_rotation.invert()
-        qmap = intrinsic_rotation.rotate_vectors(qmap.ravel(), order=order).reshape(qmap.shape)
-    return qmap
+    return rotate_qmap(qmap, extrinsic_rotation=extrinsic_rotation, order=order)
+
+def rotate_qmap(qmap, extrinsic_rotation=None, order="xyz", out=None):
+    """
+    Return scattering vectors in the frame of a rotated sample
+
+    Args:
+      :qmap (array): Scattering vectors [*qx*, *qy*, *qz*] in unit inverse meter. Array shape: (..., 3)
+
+    Kwargs:
+      :extrinsic_rotation (:class:`condor.utils.rotation.Rotation`): Extrinsic rotation of the sample. If ``None`` no rotation is applied (default ``None``)
+
+      :order (str): Order of scattering vector coordinates in the output array. Choose either ``'xyz'`` or ``'zyx'`` (default ``'xyz'``)
+
+      :out (array): Array of the shape and data type of ``qmap`` the result is written into. If ``None`` a new array is returned (default ``None``)
+    """
+    if order not in ['xyz', 'zyx']:
+        log_and_raise_error(logger, "Indexing with order=%s is invalid." % order)
+        return
+    if out is not None:
+        # Same operations as below, evaluated in place
+        components = [out[...,j] for j in range(3)]
+        if order == "zyx":
+            components = components[::-1]
+        if extrinsic_rotation is None:
+            for j in range(3):
+                components[j][...] = qmap[...,j]
+        else:
+            R = extrinsic_rotation.get_as_rotation_matrix().astype(qmap.dtype)
+            tmp = numpy.empty(qmap.shape[:-1], dtype=qmap.dtype)
+            for j in range(3):
+                numpy.multiply(qmap[...,0], R[0,j], out=components[j])
+                components[j] += numpy.multiply(qmap[...,1], R[1,j], out=tmp)
+                components[j] += numpy.multiply(qmap[...,2], R[2,j], out=tmp)
+        return out
+    if extrinsic_rotation is not None:
+        # Inverse rotation q' = R^T q, evaluated component by component such that the result does not depend on the array shape
+        R = extrinsic_rotation.get_as_rotation_matrix().astype(qmap.dtype)
+        qmap_rot = numpy.empty_like(qmap)
+        for j in range(3):
+            qmap_rot[...,j] = qmap[...,0]*R[0,j] + qmap[...,1]*R[1,j] + qmap[...,2]*R[2,j]
+        qmap = qmap_rot
+    if order == "zyx":
+        qmap = qmap[...,::-1]
+    return numpy.ascontiguousarray(qmap)
 
 def generate_qmap_3d(qn, qmax, extrinsic_rotation=None, order='xyz'):
-    q = numpy.linspace(-qmax, qmax, qn)
-    Qz, Qy, Qx = numpy.meshgrid(q, q, q, indexing='ij')
-    qmap = numpy.zeros(shape=(qn, qn, qn, 3), dtype='float')
-    if order == 'xyz':
-        qmap[:, :, :, 0] = Qx[:, :, :]
-        qmap[:, :, :, 1] = Qy[:, :, :]
-        qmap[:, :, :, 2] = Qz[:, :, :]
-    elif order == 'zyx':
-        qmap[:, :, :, 2] = Qx[:, :, :]
-        qmap[:, :, :, 1] = Qy[:, :, :]
-        qmap[:, :, :, 0] = Qz[:, :, :]
-    else:
+    if order not in ['xyz', 'zyx']:
         log_and_raise_error(logger, "order=\'%s\' is not a recognised argument for this function." % str(order))
         return
     if extrinsic_rotation is not None:
         log_debug(logger, "Applying qmap rotation.")
-        intrinsic_rotation = copy.deepcopy(extrinsic_rotation)
-        intrinsic_rotation.invert()
-        qmap = intrinsic_rotation.rotate_vectors(qmap.ravel(), order=order).reshape(qmap.shape)
-    return qmap
+    return QGrid3D(qn, qmax, extrinsic_rotation=extrinsic_rotation).get_qmap(order=order)
+
+class QGrid3D:
+    r"""
+    Lazy representation of the Cartesian grid of scattering vectors of a 3D Fourier volume
+
+    The grid is the Cartesian product of the 1D axis :math:`q_i = -q_{max}, ..., q_{max}` (:math:`q_n` samples) with itself, optionally rotated like the output of :func:`generate_qmap_3d`. Only the axis and the rotation are stored. Scattering vectors are generated slab by slab along the first (*z*) array dimension on request, so that memory is dominated by the output volume. For the unrotated grid phase factors :math:`e^{-i \vec{q} \cdot \vec{r}}` factorise into three 1D exponentials and are applied by broadcasting.
+
+    Args:
+      :qn (int): Number of samples along each dimension
+
+      :qmax (float): Maximum scattering vector component in unit inverse meter
+
+    Kwargs:
+      :extrinsic_rotation: Extrinsic rotation of the particle (the scattering vectors are rotated inversely). If ``None`` no rotation (default ``None``)
+
+      :slab_size (int): Maximum number of scattering vectors that are generated at once (default ``4194304``)
+
+      :z_range (tuple): Index range (z0, z1) along the first array dimension that the grid is restricted to. If ``None`` the entire volume (default ``None``)
+
+      :n_threads (int): Number of threads that evaluate slabs in parallel (default ``1``)
+
+      :use_symmetry (bool): If ``True`` functions with known symmetry operations are only evaluated on the asymmetric unit of the grid (see :meth:`evaluate`) (default ``False``)
+
+      :symmetry_check (int): Number of randomly chosen grid points at which results obtained by symmetry are compared to direct evaluation (default ``0``)
+
+      :use_friedel_symmetry (bool): If ``True`` Fourier transforms of refractive index maps are assumed to obey Friedel's law and only half of the grid is evaluated (see :meth:`evaluate`), if ``False`` Friedel's law is never exploited. If ``None`` Friedel's law is exploited for maps without absorption (default ``None``)
+
+      :dtype: Floating point type of the scattering vectors, for example ``numpy.float32``. Complex results are returned in the complex type of the same precision (default ``numpy.float64``)
+    """
+    def __init__(self, qn, qmax, extrinsic_rotation=None, slab_size=4194304, z_range=None, n_threads=1, use_symmetry=False, symmetry_check=0, use_friedel_symmetry=None, dtype=numpy.float64):
+        self.qn = qn
+        self.qmax = qmax
+        self.dtype = numpy.dtype(dtype)
+        self.complex_dtype = numpy.result_type(self.dtype, numpy.complex64)
+        self.q = numpy.linspace(-qmax, qmax, qn).astype(self.dtype, copy=False)
+        self.z_range = (0, qn) if z_range is None else tuple(z_range)
+        self.qz = self.q[self.z_range[0]:self.z_range[1]]
+        self.nz = len(self.qz)
+        self.shape = (self.nz, qn, qn, 3)
+        self.extrinsic_rotation = copy.deepcopy(extrinsic_rotation)
+        self.slab_size = slab_size
+        self.n_threads = n_threads
+        self.use_symmetry = use_symmetry
+        self.symmetry_check = symmetry_check
+        self.use_friedel_symmetry = use_friedel_symmetry
+
+    def _copy(self, **kwargs):
+        D = {"extrinsic_rotation": self.extrinsic_rotation, "slab_size": self.slab_size, "z_range": self.z_range,
+             "n_threads": self.n_threads, "use_symmetry": self.use_symmetry, "symmetry_check": self.symmetry_check,
+             "use_friedel_symmetry": self.use_friedel_symmetry, "dtype": self.dtype}
+        D.update(kwargs)
+        return QGrid3D(self.qn, self.qmax, **D)
+
+    def rotated(self, extrinsic_rotation):
+        """
+        Return a copy of the grid with the given extrinsic rotation (``None`` for no rotation)
+        """
+        return self._copy(extrinsic_rotation=extrinsic_rotation)
+
+    def get_subgrid(self, z0, z1):
+        """
+        Return a copy of the grid that is restricted to the slab z0:z1 (indices relative to this grid)
+        """
+        return self._copy(z_range=(self.z_range[0]+z0, self.z_range[0]+z1))
+
+    def get_axes(self):
+        """
+        Return the scattering vector components along the grid axes (before rotation) as broadcastable arrays (qx, qy, qz) of shapes (1, 1, qn), (1, qn, 1) and (nz, 1, 1)
+        """
+        return self.q[numpy.newaxis, numpy.newaxis, :], self.q[numpy.newaxis, :, numpy.newaxis], self.qz[:, numpy.newaxis, numpy.newaxis]
+
+    def get_slabs(self):
+        """
+        Return the list of index ranges (z0, z1) of the slabs along the first array dimension (at least one slab per thread if possible)
+        """
+        n = max([1, min([self.slab_size/(self.qn*self.qn), int(numpy.ceil(self.nz/float(self.n_threads)))])])
+        return [(z0, min([z0+n, self.nz])) for z0 in range(0, self.nz, n)]
+
+    def get_qmap(self, order="xyz", z0=0, z1=None):
+        """
+        Return the array of scattering vectors of the slab z0:z1 (by default the entire volume). Array shape: (z1-z0, qn, qn, 3)
+
+        Kwargs:
+          :order (str): Order of the vector components, either ``'xyz'`` or ``'zyx'`` (default ``'xyz'``)
+
+          :z0 (int): First index of the slab (default ``0``)
+
+          :z1 (int): Index after the last index of the slab. If ``None`` up to the end (default ``None``)
+        """
+        if z1 is None:
+            z1 = self.nz
+        qmap = numpy.empty(shape=(z1-z0, self.qn, self.qn, 3), dtype=self.dtype)
+        qmap[:,:,:,0] = self.q[numpy.newaxis, numpy.newaxis, :]
+        qmap[:,:,:,1] = self.q[numpy.newaxis, :, numpy.newaxis]
+        qmap[:,:,:,2] = self.qz[z0:z1, numpy.newaxis, numpy.newaxis]
+        if self.extrinsic_rotation is not None:
+            # Inverse rotation q' = R^T q in row vector form q'^T = q^T R
+            qmap = qmap.dot(self.extrinsic_rotation.get_as_rotation_matrix().astype(self.dtype))
+        if order == "zyx":
+            qmap = qmap[:,:,:,::-1].copy()
+        return qmap
+
+    def get_abs_q(self):
+        """
+        Return the absolute values of the scattering vectors (independent of rotation). Array shape: (nz, qn, qn)
+        """
+        qx, qy, qz = self.get_axes()
+        return numpy.sqrt(qz**2 + qy**2 + qx**2)
+
+    def evaluate(self, function, order="xyz", dtype=None, symmetry=None, symmetry_origin=None, friedel=False):
+        r"""
+        Evaluate a function of the scattering vectors slab by slab and return the results as array of shape (nz, qn, qn)
+
+        If symmetry operations are given and the grid was created with ``use_symmetry=True`` the function is only evaluated on the asymmetric unit of the grid and the remaining values are filled in by symmetry. The function values are assumed to be :math:`f(\vec{q}) = S(\vec{q}) \, e^{-i \vec{q} \cdot \vec{v}}` with :math:`S(P\vec{q}) = S(\vec{q})` for all operations :math:`P`, where :math:`\vec{v}` is the symmetry origin (in the frame of the grid before rotation). If ``friedel=True`` the function is in addition assumed to obey Friedel's law :math:`f(-\vec{q}) = f(\vec{q})^*` (Fourier transform of a real function) and only one half of the Friedel mates is evaluated.
+
+        Args:
+          :function: Function that takes an array of scattering vectors of shape (..., 3) and returns an array of shape (...)
+
+        Kwargs:
+          :order (str): Order of the vector components that are passed to the function, either ``'xyz'`` or ``'zyx'`` (default ``'xyz'``)
+
+          :dtype: Data type of the output. If ``None`` the complex type of the precision of the grid (default ``None``)
+
+          :symmetry (list): Signed permutation matrices (order x,y,z) that leave the function invariant on the grid before rotation, see :func:`condor.utils.symmetry.get_grid_symmetry_operations` (default ``None``)
+
+          :symmetry_origin (array): Origin :math:`\vec{v}` [*x*, *y*, *z*] of the symmetry operations in unit meter. If ``None`` the origin (default ``None``)
+
+          :friedel (bool): If ``True`` Friedel's law is exploited (default ``False``)
+        """
+        if dtype is None:
+            dtype = self.complex_dtype
+        operations = [numpy.identity(3, dtype=numpy.int64)]
+        if self.use_symmetry and symmetry is not None:
+            operations = list(symmetry)
+        conjugate = [False] * len(operations)
+        if friedel:
+            operations = operations + [-P for P in operations]
+            conjugate = conjugate + [True] * len(conjugate)
+        if len(operations) > 1:
+            if self.nz == self.qn:
+                return self._evaluate_symmetric(function, order, dtype, operations, conjugate, symmetry_origin)
+            log_debug(logger, "Grid is restricted to a slab, symmetry is not exploited.")
+        out = numpy.empty(shape=(self.nz, self.qn, self.qn), dtype=dtype)
+        def evaluate_slab(slab):
+            z0, z1 = slab
+            out[z0:z1] = function(self.get_qmap(order=order, z0=z0, z1=z1))
+        self._map_slabs(evaluate_slab)
+        return out
+
+    def get_qmap_at_indices(self, indices, order="xyz"):
+        """
+        Return the scattering vectors at the given flat indices of the grid. Array shape: (len(indices), 3)
+        """
+        indices = numpy.asarray(indices)
+        qmap = numpy.empty(shape=(len(indices), 3), dtype=self.dtype)
+        qmap[:,0] = self.q[indices % self.qn]
+        qmap[:,1] = self.q[(indices / self.qn) % self.qn]
+        qmap[:,2] = self.qz[indices / (self.qn*self.qn)]
+        if self.extrinsic_rotation is not None:
+            qmap = qmap.dot(self.extrinsic_rotation.get_as_rotation_matrix().astype(self.dtype))
+        if order == "zyx":
+            qmap = qmap[:,::-1].copy()
+        return qmap
+
+    def get_asymmetric_unit(self, symmetry, conjugate=None):
+        """
+        Return the flat indices of the asymmetric unit of the grid, for every grid point the flat index of the equivalent point in the asymmetric unit (array of shape (qn, qn, qn)) and for every grid point whether the equivalent point is related by an operation with complex conjugation (boolean array of shape (qn, qn, qn), ``None`` if no operation involves conjugation)
+
+        Args:
+          :symmetry (list): Signed permutation matrices (order x,y,z), see :func:`condor.utils.symmetry.get_grid_symmetry_operations`
+
+        Kwargs:
+          :conjugate (list): Flags for every operation whether it involves complex conjugation. If ``None`` no operation involves conjugation (default ``None``)
+        """
+        if conjugate is None:
+            conjugate = [False] * len(symmetry)
+        qn = self.qn
+        dtype = numpy.int32 if qn**3 < 2**31 else numpy.int64
+        i = [numpy.arange(qn, dtype=dtype)[numpy.newaxis, numpy.newaxis, :],
+             numpy.arange(qn, dtype=dtype)[numpy.newaxis, :, numpy.newaxis],
+             numpy.arange(qn, dtype=dtype)[:, numpy.newaxis, numpy.newaxis]]
+        representative = None
+        conjugated = numpy.zeros(shape=(qn, qn, qn), dtype=numpy.bool_) if any(conjugate) else None
+        for P, c in zip(symmetry, conjugate):
+            # Grid indices of the transformed scattering vectors (the 1D axis is symmetric, q[qn-1-i] = -q[i])
+            j = []
+            for a in range(3):
+                b = int(numpy.argmax(abs(P[a])))
+                j.append(i[b] if P[a][b] > 0 else (qn-1) - i[b])
+            index = (j[2]*qn + j[1])*qn + j[0]
+            if representative is None:
+                representative = numpy.array(numpy.broadcast_to(index, (qn, qn, qn)))
+                if c:
+                    conjugated[:] = True
+            else:
+                if conjugated is not None:
+                    smaller = index < representative
+                    conjugated[smaller] = c
+                numpy.minimum(representative, index, out=representative)
+        unit = numpy.flatnonzero(representative.ravel() == numpy.arange(qn**3, dtype=dtype))
+        return unit, representative, conjugated
+
+    def _evaluate_symmetric(self, function, order, dtype, symmetry, conjugate, symmetry_origin):
+        unit, representative, conjugated = self.get_asymmetric_unit(symmetry, conjugate)
+        log_debug(logger, "Evaluating %i of %i grid points (%i symmetry operations)." % (len(unit), self.qn**3, len(symmetry)))
+        v = numpy.zeros(3) if symmetry_origin is None else numpy.asarray(symmetry_origin, dtype=numpy.float64)
+        qx, qy, qz = self.get_axes()
+        def symmetric_part(indices):
+            # Remove the phase of the origin (in the frame of the grid before rotation)
+            values = function(self.get_qmap_at_indices(indices, order=order))
+            if (v != 0).any():
+                values = values * numpy.exp(1.j*(qx.ravel()[indices % self.qn]*v[0] + qy.ravel()[(indices / self.qn) % self.qn]*v[1] + qz.ravel()[indices / (self.qn*self.qn)]*v[2]))
+            return values
+        values = numpy.empty(len(unit), dtype=dtype if (v == 0).all() else self.complex_dtype)
+        n = max([1, self.slab_size])
+        def evaluate_chunk(chunk):
+            i0, i1 = chunk
+            values[i0:i1] = symmetric_part(unit[i0:i1])
+        self._map_slabs(evaluate_chunk, [(i0, min([i0+n, len(unit)])) for i0 in range(0, len(unit), n)])
+        # Fill the volume by symmetry
+        out = numpy.empty(shape=(self.qn, self.qn, self.qn), dtype=values.dtype)
+        for z0, z1 in self.get_slabs():
+            out[z0:z1] = values[numpy.searchsorted(unit, representative[z0:z1])]
+            if conjugated is not None:
+                out[z0:z1][conjugated[z0:z1]] = out[z0:z1][conjugated[z0:z1]].conj()
+        del representative, conjugated
+        if (v != 0).any():
+            # Phase of the origin (separable on the grid before rotation)
+            ex, ey, ez = self.get_phase_factors(v)
+            out *= ez
+            out *= ey
+            out *= ex
+        out = out.astype(dtype, copy=False)
+        if self.symmetry_check > 0:
+            indices = get_random_state().randint(self.qn**3, size=self.symmetry_check)
+            expected = function(self.get_qmap_at_indices(indices, order=order))
+            deviation = abs(out.ravel()[indices] - expected).max()
+            if deviation > (1E-6 if self.dtype == numpy.float64 else 1E-3)*max([abs(expected).max(), numpy.finfo(numpy.float64).tiny]):
+                log_warning(logger, "Symmetry check failed: maximum deviation at %i random grid points is %e (maximum value %e)." % (self.symmetry_check, deviation, abs(expected).max()))
+            else:
+                log_debug(logger, "Symmetry check passed at %i random grid points (maximum deviation %e)." % (self.symmetry_check, deviation))
+        return out
+
+    def evaluate_abs_q(self, function, dtype=None):
+        """
+        Evaluate a function of the absolute values of the scattering vectors slab by slab and return the results as array of shape (nz, qn, qn)
+
+        Args:
+          :function: Function that takes an array of absolute values of scattering vectors of shape (n, qn, qn) and returns an array of the same shape
+
+        Kwargs:
+          :dtype: Data type of the output. If ``None`` the complex type of the precision of the grid (default ``None``)
+        """
+        out = numpy.empty(shape=(self.nz, self.qn, self.qn), dtype=self.complex_dtype if dtype is None else dtype)
+        qx, qy, qz = self.get_axes()
+        def evaluate_slab(slab):
+            z0, z1 = slab
+            out[z0:z1] = function(numpy.sqrt(qz[z0:z1]**2 + qy**2 + qx**2))
+        self._map_slabs(evaluate_slab)
+        return out
+
+    def _map_slabs(self, function, slabs=None):
+        if slabs is None:
+            slabs = self.get_slabs()
+        if self.n_threads > 1 and len(slabs) > 1:
+            # Slabs write into disjoint parts of the output, numpy and the nfft release the GIL for the heavy lifting
+            pool = ThreadPool(min([self.n_threads, len(slabs)]))
+            try:
+                pool.map(function, slabs)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for slab in slabs:
+                function(slab)
+
+    def get_phase_factors(self, v):
+        r"""
+        Return the phase factors :math:`e^{-i \vec{q} \cdot \vec{v}}` of the unrotated grid as three broadcastable 1D exponentials (x, y, z)
+
+        Args:
+          :v (array): Translation vector [*x*, *y*, *z*] in unit meter
+        """
+        qx, qy, qz = self.get_axes()
+        return numpy.exp(-1.j*v[0]*qx), numpy.exp(-1.j*v[1]*qy), numpy.exp(-1.j*v[2]*qz)
+
+    def apply_phase_ramp(self, F, v):
+        r"""
+        Return the 3D array F multiplied by the phase factors :math:`e^{-i \vec{q} \cdot \vec{v}}`
+
+        Args:
+          :F (array): Complex array of shape (nz, qn, qn)
+
+          :v (array): Translation vector [*x*, *y*, *z*] in unit meter
+        """
+        if self.extrinsic_rotation is not None:
+            # The grid axes are not the Cartesian axes, therefore rotate the translation vector instead
+            v = self.extrinsic_rotation.rotate_vector(numpy.asarray(v, dtype=numpy.float64))
+        ex, ey, ez = self.get_phase_factors(v)
+        F = F * ez
+        F *= ey
+        F *= ex
+        return F
+
+    def get_structure_factor(self, positions, weights=None):
+        r"""
+        Return the structure factor :math:`S(\vec{q}) = \sum_j w_j e^{-i \vec{q} \cdot \vec{r}_j}` on the grid (see :func:`condor.utils.diffraction.structure_factor`)
+
+        Args:
+          :positions (array): Positions :math:`\vec{r}_j` [*x*, *y*, *z*] of the scatterers in unit meter. Array shape: (:math:`N`, 3)
+
+        Kwargs:
+          :weights (array): Real or complex weights :math:`w_j` of the scatterers. If ``None`` all weights are set to one (default ``None``)
+        """
+        positions = numpy.asarray(positions, dtype=numpy.float64).reshape((-1, 3))
+        if weights is None:
+            weights = numpy.ones(len(positions))
+        else:
+            weights = numpy.asarray(weights) * numpy.ones(len(positions))
+        S = numpy.zeros(shape=(self.nz, self.qn, self.qn), dtype=self.complex_dtype)
+        for v, w in zip(positions, weights):
+            if self.extrinsic_rotation is not None:
+                v = self.extrinsic_rotation.rotate_vector(v)
+            ex, ey, ez = self.get_phase_factors(v)
+            S += (w * ez * ey) * ex
+        return S
 
 def generate_rpix_3d(qn, qmax, wavelength, detector_distance, pixel_size):
     R_Ewald = 2*numpy.pi/wavelength
@@ -35,9 +35,29 @@ import numpy
 from scattering_vector import generate_qmap
 
 _F_sphere_diffraction = lambda K,q,r: numpy.sqrt(abs(K))*3*(numpy.sin(q*r)-q*r*numpy.cos(q*r))/((q*r)**3+numpy.finfo("float64").eps)
-F_sphere_diffraction = lambda K,q,r: ((q*r)**6 < numpy.finfo("float64").resolution)*numpy.sqrt(abs(K)) + ((q*r)**6 >= numpy.finfo("float64").resolution)*_F_sphere_diffraction(K,q,r)
+
+def _F_sphere_diffraction_double(K,q,r):
+    # Same expression as _F_sphere_diffraction with qr evaluated only once
+    x = q*r
+    f = numpy.sqrt(abs(K))*3*(numpy.sin(x)-x*numpy.cos(x))/(x**3+numpy.finfo("float64").eps)
+    return numpy.where(x**6 < numpy.finfo("float64").resolution, numpy.sqrt(abs(K)), f)
+
+def _F_sphere_diffraction_single(K,q,r):
+    x = q*r
+    # The closed form suffers from cancellation in single precision, below this value of qr the Taylor expansion is used
+    small = x < 3E-1
+    x2_small = x[small]**2
+    x[small] = 1.
+    f = numpy.sin(x)
+    f -= x*numpy.cos(x)
+    f /= x**3
+    f *= 3.
+    f[small] = 1. - x2_small/10. + x2_small**2/280.
+    return numpy.sqrt(abs(K))*f
+
+F_sphere_diffraction = lambda K,q,r: _F_sphere_diffraction_single(K,q,r) if isinstance(q, numpy.ndarray) and q.dtype == numpy.float32 else _F_sphere_diffraction_double(K,q,r)
 r"""
-Scattering amplitude from homogeneous sphere (ref. [Feigin1987]_)
+Scattering amplitude from homogeneous sphere (ref. [Feigin1987]_). For scattering vectors in single precision (``numpy.float32``) the result is calculated and returned in single precision
 
 .. math::
 
@@ -82,6 +102,72 @@ Args:
   :r (float): :math:`r`: See :func:`condor.utils.sphere_diffraction.F_sphere_diffraction`
 """
 
+def f_layered_sphere(s, radii, dn):
+    r"""
+    Form factor of a spherically symmetric particle built from concentric uniform layers (sum of homogeneous spheres)
+
+    .. math::
+
+      f(s) = \sum_i \left( \delta n_i - \delta n_{i+1} \right) \, \frac{4\pi}{3} r_i^3 \, \frac{ 3 \left[ \sin(s r_i) - s r_i \cos(s r_i) \right]}{ (s r_i)^3 } \quad \text{with} \quad \delta n_{N+1} = 0
+
+    Args:
+      :s (float/array): Length of scattering vector
+
+      :radii (array): Outer radii :math:`r_i` of the layers in increasing order (same length unit as :math:`1/s`)
+
+      :dn (array): Real or complex refractive index decrements :math:`\delta n_i` of the layers
+    """
+    s = numpy.asarray(s, dtype=numpy.float64)
+    radii = numpy.asarray(radii, dtype=numpy.float64)
+    dn = numpy.asarray(dn)
+    ddn = dn - numpy.append(dn[1:], 0.)
+    f = numpy.zeros(s.shape, dtype=numpy.complex128)
+    for r_i, ddn_i in zip(radii, ddn):
+        f += ddn_i * 4/3.*numpy.pi*r_i**3 * F_sphere_diffraction(1., s, r_i)
+    return f
+
+def f_radial_profile(s, r, dn, n_samples=None):
+    r"""
+    Form factor of a spherically symmetric particle with a sampled radial profile (1D sine transform)
+
+    .. math::
+
+      f(s) = 4\pi \int_0^{r_{max}} \delta n(r) \, r^2 \, \frac{\sin(s r)}{s r} \, dr
+
+    The profile is interpolated linearly on ``n_samples`` equidistant radii, merged with the sample radii ``r`` so that steps in the profile are resolved exactly, and integrated with the trapezoidal rule.
+
+    Args:
+      :s (float/array): Length of scattering vector
+
+      :r (array): Radii of the profile samples in increasing order (same length unit as :math:`1/s`). The profile is zero outside the largest radius
+
+      :dn (array): Real or complex refractive index decrements :math:`\delta n(r)` at the sample radii
+
+    Kwargs:
+      :n_samples (int): Number of equidistant radial integration samples. If ``None`` the number is chosen from the product of the largest scattering vector and the largest radius such that the phase :math:`s\,r` advances by at most 0.01 between samples (at least 1000 samples) (default ``None``)
+    """
+    s = numpy.asarray(s, dtype=numpy.float64)
+    r = numpy.asarray(r, dtype=numpy.float64)
+    dn = numpy.asarray(dn)
+    if n_samples is None:
+        s_max = abs(s).max() if s.size > 0 else 0.
+        n_samples = max([1000, int(numpy.ceil(s_max*r[-1]/0.01))+1])
+    rr = numpy.union1d(numpy.linspace(0., r[-1], n_samples), r[r >= 0.])
+    dnr = numpy.interp(rr, r, dn.real) + 1.j*numpy.interp(rr, r, dn.imag)
+    # Trapezoidal weights on the non-equidistant grid
+    drr = numpy.diff(rr)
+    w = numpy.zeros(len(rr))
+    w[:-1] += 0.5*drr
+    w[1:] += 0.5*drr
+    w *= 4*numpy.pi * rr**2
+    f = numpy.zeros(s.size, dtype=numpy.complex128)
+    s_flat = s.ravel()
+    # Chunked to limit the size of the (s, r) matrix
+    n = max([1, 4194304/len(rr)])
+    for i0 in range(0, s.size, n):
+        f[i0:i0+n] = numpy.sinc(numpy.outer(s_flat[i0:i0+n], rr) / numpy.pi).dot(w * dnr)
+    return f.reshape(s.shape)
+
 #Fringe_sphere_diffraction = None
 
 #def get_sphere_diffraction_formula(p,D,wavelength,X=None,Y=None):
@@ -32,6 +32,10 @@
 
 import numpy
 
+import logging
+logger = logging.getLogger(__name__)
+
+from log import log_and_raise_error,log_warning,log_info,log_debug
 from scattering_vector import generate_qmap
 import rotation
 
@@ -109,6 +113,114 @@ Args:
   :phi (float): See :func:`condor.utils.spheroid_diffraction.F_spheroid_diffraction`
 """
 
+def F_ellipsoid_diffraction(K, qmap, a, b, c, extrinsic_rotation=None, out=None, dtype=numpy.float64):
+    r"""
+    Scattering amplitude from homogeneous (triaxial) ellipsoid
+
+    Fused evaluation from the full 3D scattering vector. :math:`qH` is calculated only once per scattering vector from the quadratic form :math:`(qH)^2 = \vec{q}^T M \vec{q}` with :math:`M = R \, \mathrm{diag}(a^2, b^2, c^2) \, R^T` and :math:`R` denoting the rotation matrix of the ellipsoid.
+
+    .. math::
+
+      F(\vec{q}) = \sqrt{K} \cdot \frac{ 3 \left[\sin(qH) - qH \cos(qH) \right]}{ (qH)^3}
+
+    Before the rotation is applied the semi-diameters :math:`a`, :math:`b` and :math:`c` are aligned with the :math:`x`-, :math:`y`- and :math:`z`-axis. The spheroid of :func:`condor.utils.spheroid_diffraction.F_spheroid_diffraction` corresponds to :math:`(a, c, a)`.
+
+    Args:
+      :K (float): Intensity scaling factor (see :func:`condor.utils.spheroid_diffraction.F_spheroid_diffraction`)
+
+      :qmap (array): Scattering vectors [*qx*, *qy*, *qz*] in unit inverse meter. Array shape: (..., 3)
+
+      :a (float): Semi-diameter along the :math:`x`-axis in unit meter
+
+      :b (float): Semi-diameter along the :math:`y`-axis in unit meter
+
+      :c (float): Semi-diameter along the :math:`z`-axis in unit meter
+
+    Kwargs:
+      :extrinsic_rotation (:class:`condor.utils.rotation.Rotation`): Extrinsic rotation of the ellipsoid. If ``None`` no rotation is applied (default ``None``)
+
+      :out (array): Output array of shape ``qmap.shape[:-1]``. If ``None`` a new array is allocated (default ``None``)
+
+      :dtype: Floating point type of the output if ``out`` is ``None``, for example ``numpy.float32`` (default ``numpy.float64``)
+    """
+    if out is None:
+        out = numpy.empty(qmap.shape[:-1], dtype=dtype)
+    elif out.shape != qmap.shape[:-1]:
+        log_and_raise_error(logger, "Output array has shape %s but shape %s is required." % (str(out.shape), str(qmap.shape[:-1])))
+        return
+    dtype = out.dtype
+    M = numpy.diag([a**2, b**2, c**2])
+    if extrinsic_rotation is not None:
+        R = extrinsic_rotation.get_as_rotation_matrix()
+        M = R.dot(M).dot(R.T)
+    q = qmap.reshape((qmap.size/3, 3)).astype(dtype, copy=False)
+    x = (q.dot(M.astype(dtype)) * q).sum(axis=1)
+    numpy.sqrt(x, out=x)
+    o = out.reshape(x.shape)
+    _f_ellipsoid(x, o)
+    o *= numpy.sqrt(abs(K))
+    if not numpy.may_share_memory(o, out):
+        out[...] = o.reshape(out.shape)
+    return out
+
+def F_ellipsoids_diffraction(K, qmap, a, b, c, rotation_matrices=None, dtype=numpy.float64):
+    r"""
+    Scattering amplitudes of several homogeneous (triaxial) ellipsoids at once (see :func:`condor.utils.spheroid_diffraction.F_ellipsoid_diffraction`)
+
+    The quadratic forms :math:`(qH)^2 = \vec{q}^T M \vec{q}` of all ellipsoids are evaluated by a single matrix product of the six independent elements of the matrices :math:`M` with the six products of the components of the scattering vectors. The result is an array of shape (``len(K)``,) + ``qmap.shape[:-1]``
+
+    Args:
+      :K (array): Intensity scaling factors of the ellipsoids (see :func:`condor.utils.spheroid_diffraction.F_spheroid_diffraction`)
+
+      :qmap (array): Scattering vectors [*qx*, *qy*, *qz*] in unit inverse meter. Array shape: (..., 3)
+
+      :a (array): Semi-diameters along the :math:`x`-axis in unit meter
+
+      :b (array): Semi-diameters along the :math:`y`-axis in unit meter
+
+      :c (array): Semi-diameters along the :math:`z`-axis in unit meter
+
+    Kwargs:
+      :rotation_matrices (array): Extrinsic rotation matrices of the ellipsoids (array shape (``len(K)``, 3, 3)). If ``None`` no rotation is applied (default ``None``)
+
+      :dtype: Floating point type of the output, for example ``numpy.float32`` (default ``numpy.float64``)
+    """
+    K = numpy.asarray(K, dtype=numpy.float64).ravel()
+    d = numpy.array([numpy.asarray(a)**2, numpy.asarray(b)**2, numpy.asarray(c)**2], dtype=numpy.float64).reshape((3, len(K))).T
+    if rotation_matrices is None:
+        M = numpy.zeros(shape=(len(K), 3, 3))
+        M[:,[0,1,2],[0,1,2]] = d
+    else:
+        R = numpy.asarray(rotation_matrices, dtype=numpy.float64)
+        M = numpy.matmul(R * d[:,numpy.newaxis,:], R.transpose((0,2,1)))
+    m = numpy.array([M[:,0,0], M[:,1,1], M[:,2,2], 2*M[:,0,1], 2*M[:,0,2], 2*M[:,1,2]], dtype=dtype).T
+    q = qmap.reshape((qmap.size/3, 3)).astype(dtype, copy=False)
+    qq = numpy.array([q[:,0]**2, q[:,1]**2, q[:,2]**2, q[:,0]*q[:,1], q[:,0]*q[:,2], q[:,1]*q[:,2]], dtype=dtype)
+    x = m.dot(qq)
+    # The expanded quadratic form can be slightly negative by rounding
+    numpy.maximum(x, 0., out=x)
+    numpy.sqrt(x, out=x)
+    o = numpy.empty(x.shape, dtype=dtype)
+    _f_ellipsoid(x, o)
+    o *= numpy.sqrt(abs(K)).astype(dtype)[:,numpy.newaxis]
+    return o.reshape((len(K),) + qmap.shape[:-1])
+
+def _f_ellipsoid(x, o):
+    # Writes f(qH) to o, the values of qH in x are overwritten
+    # Below this value of qH the Taylor expansion is more accurate than the closed form
+    x_small = 1E-2 if x.dtype == numpy.float64 else 3E-1
+    small = x < x_small
+    x2_small = x[small]**2
+    x[small] = 1.
+    numpy.sin(x, out=o)
+    tmp = numpy.cos(x)
+    tmp *= x
+    o -= tmp
+    x **= 3
+    o /= x
+    o *= 3.
+    o[small] = 1. - x2_small/10. + x2_small**2/280.
+
 to_spheroid_semi_diameter_a = lambda diameter,flattening: flattening**(1/3.)*diameter/2.
 """
 Conversion from spheroid (sphere volume equivalent) diameter and flattening (:math:`a/c`) to semi-diameter :math:`a`
@@ -0,0 +1,114 @@
+# -----------------------------------------------------------------------------------------------------
+# CONDOR
+# Simulator for diffractive single-particle imaging experiments with X-ray lasers
+# http://xfel.icm.uu.se/condor/
+# -----------------------------------------------------------------------------------------------------
+# Copyright 2016 Max Hantke, Filipe R.N.C. Maia, Tomas Ekeberg
+# Condor is distributed under the terms of the BSD 2-Clause License
+# -----------------------------------------------------------------------------------------------------
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# -----------------------------------------------------------------------------------------------------
+# General note:
+# All variables are in SI units by default. Exceptions explicit by variable name.
+# -----------------------------------------------------------------------------------------------------
+
+
+import numpy, itertools
+
+import logging
+logger = logging.getLogger(__name__)
+
+from log import log_and_raise_error,log_warning,log_info,log_debug
+
+point_groups = ["spherical", "uniaxial", "cubic", "icosahedral"]
+r"""
+Supported point groups of particles (in the frame of the particle before rotation)
+
+  - ``'spherical'`` - all rotations and reflections
+  - ``'uniaxial'`` - rotations about the *y*-axis and reflections that map the *y*-axis onto itself (for example spheroids and cylinders)
+  - ``'cubic'`` - full octahedral group of a cube with faces perpendicular to the Cartesian axes
+  - ``'icosahedral'`` - full icosahedral group of an icosahedron with 2-fold axes parallel to the Cartesian axes (orientation of :func:`condor.utils.bodies.make_icosahedron_map`)
+"""
+
+def get_signed_permutation_matrices():
+    """
+    Return the 48 signed permutation matrices, i.e. the orthogonal transformations that map a Cartesian grid centred at the origin onto itself
+    """
+    M = []
+    for perm in itertools.permutations(range(3)):
+        for signs in itertools.product([1, -1], repeat=3):
+            m = numpy.zeros(shape=(3, 3), dtype=numpy.int64)
+            for i in range(3):
+                m[i, perm[i]] = signs[i]
+            M.append(m)
+    return M
+
+def _get_icosahedron_vertices():
+    # Cyclic permutations of (+-phi, +-1, 0) in order x,y,z (see icosahedron extension)
+    phi = (1+numpy.sqrt(5))/2.
+    V = []
+    for s1 in [1, -1]:
+        for s2 in [1, -1]:
+            v = numpy.array([s1*phi, s2*1., 0.])
+            for i in range(3):
+                V.append(numpy.roll(v, i))
+    return numpy.array(V)
+
+def is_symmetry_operation(M, point_group, tol=1E-6):
+    """
+    Return ``True`` if the orthogonal matrix M is an element of the given point group
+
+    Args:
+      :M (array): Orthogonal 3x3 matrix acting on vectors in order x,y,z
+
+      :point_group (str): Point group (see :attr:`condor.utils.symmetry.point_groups`)
+
+    Kwargs:
+      :tol (float): Numerical tolerance (default ``1E-6``)
+    """
+    if point_group == "spherical":
+        return True
+    elif point_group == "uniaxial":
+        return abs(abs(M[1,1]) - 1.) < tol
+    elif point_group == "cubic":
+        return numpy.allclose(M, numpy.round(M), atol=tol)
+    elif point_group == "icosahedral":
+        V = _get_icosahedron_vertices()
+        MV = numpy.dot(V, numpy.asarray(M).T)
+        d = ((MV[:, numpy.newaxis, :] - V[numpy.newaxis, :, :])**2).sum(axis=2)
+        return bool((d.min(axis=1) < tol).all())
+    else:
+        log_and_raise_error(logger, "point_group=\"%s\" is invalid. Valid point groups are: %s." % (point_group, str(point_groups)))
+
+def get_grid_symmetry_operations(point_group, extrinsic_rotation=None):
+    r"""
+    Return the signed permutation matrices :math:`P` that are symmetry operations of a rotated particle of the given point group
+
+    Scattering amplitudes :math:`F(\vec{q}) = F_p(R^T \vec{q})` of a particle rotated by :math:`R` satisfy :math:`F(P\vec{q}) = F(\vec{q})` if :math:`R^T P R` is an element of the point group of the particle. Only signed permutations map the Cartesian grid of a 3D Fourier volume onto itself.
+
+    Args:
+      :point_group (str): Point group of the particle before rotation (see :attr:`condor.utils.symmetry.point_groups`)
+
+    Kwargs:
+      :extrinsic_rotation: Extrinsic rotation of the particle (:class:`condor.utils.rotation.Rotation`). If ``None`` no rotation (default ``None``)
+    """
+    R = numpy.identity(3) if extrinsic_rotation is None else extrinsic_rotation.get_as_rotation_matrix()
+    return [P for P in get_signed_permutation_matrices() if is_symmetry_operation(numpy.dot(R.T, numpy.dot(P, R)), point_group)]
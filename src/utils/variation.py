@@ -40,6 +40,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 from log import log_and_raise_error,log_warning,log_info,log_debug
+from rng import get_random_state
 
 class Variation:
     """
@@ -61,6 +62,7 @@ class Variation:
         self.set_mode(mode)
         self.set_spread(spread)
         self.n = n
+        self._grid = None
         self.reset_counter()
         self.validate()
         
@@ -88,6 +90,17 @@ class Variation:
         """
         self._i = 0
 
+    def set_counter(self, i):
+        """
+        Set counter to the given value, the next value is then the ``i``-th value of the range
+
+        This counter is relevant only if ``mode=\'range\'``
+
+        Args:
+          :i (int): Counter value
+        """
+        self._i = i
+
     def set_number_of_dimensions(self, number_of_dimensions):
         if number_of_dimensions < 1 or number_of_dimensions > 3:
             log_and_raise_error(logger, "Number of dimensions for variation objects can be only either 1, 2 or 3.")
@@ -147,20 +160,17 @@ class Variation:
     def _get_grid(self):
         mode = self.get_mode()
         if mode == "range":
-            if self._number_of_dimensions == 1:
-                return numpy.array([numpy.linspace(-self._spread/2.,self._spread/2.,n)])
-            elif self._number_of_dimensions == 2:
-                Y,X = numpy.meshgrid(numpy.linspace(-self._spread[0]/2.,self._spread[0]/2.,n),numpy.linspace(-self._spread[1]/2.,self._spread[1]/2.,n),indexing="ij")
-                return numpy.array([Y.flatten(),X.flatten()])
-            elif self._number_of_dimensions == 3:
-                if numpy.isscalar(self.n):
-                    n = [self.n]*3
-                else:
-                    n = self.n
-                Z,Y,X = numpy.meshgrid(numpy.linspace(-self._spread[0]/2.,self._spread[0]/2.,n[0]),
-                                       numpy.linspace(-self._spread[1]/2.,self._spread[1]/2.,n[1]),
-                                       numpy.linspace(-self._spread[2]/2.,self._spread[2]/2.,n[2]),indexing="ij")
-                return numpy.array([Z.flatten(),Y.flatten(),X.flatten()])                
+            if numpy.isscalar(self.n):
+                n = [self.n]*self._number_of_dimensions
+            else:
+                n = list(self.n)
+            # The grid is calculated only once for a given configuration
+            key = (list(self._spread), n)
+            if self._grid is None or self._grid[0] != key:
+                axes = [numpy.linspace(-self._spread[dim]/2.,self._spread[dim]/2.,n[dim]) for dim in range(self._number_of_dimensions)]
+                grids = numpy.meshgrid(*axes,indexing="ij")
+                self._grid = (key, numpy.array([g.flatten() for g in grids]))
+            return self._grid[1]
         else:
             return None
 
@@ -187,35 +197,41 @@ class Variation:
         else:
             return self._spread[0]
     
-    def get(self, v0):
+    def get(self, v0, n=None):
         """
         Get next value(s)
 
         Args:
           :v0 (float/int/array): Value(s) without variational deviation
+
+        Kwargs:
+          :n (int): If not ``None`` the next ``n`` values are drawn at once and returned as an array of length ``n`` (shape (``n``, number of dimensions) for more than one dimension). The counter of the variation is advanced by ``n`` (default ``None``)
         """
         if self._number_of_dimensions == 1:
-            v1 = self._get_values_for_one_dim(v0,0)
+            v1 = self._get_values_for_one_dim(v0,0,n)
         else:
             v1 = []
             for dim in range(self._number_of_dimensions):
-                v1.append(self._get_values_for_one_dim(v0[dim],dim))
+                v1.append(self._get_values_for_one_dim(v0[dim],dim,n))
             v1 = numpy.array(v1)
-        self._i += 1        
+            if n is not None:
+                v1 = v1.T
+        self._i += 1 if n is None else n
         return v1
         
-    def _get_values_for_one_dim(self,v0,dim):
+    def _get_values_for_one_dim(self,v0,dim,n=None):
         if self._mode is None:
-            v1 = v0
+            v1 = v0 if n is None else numpy.repeat(v0,n)
         elif self._mode == "normal":
-            v1 = numpy.random.normal(v0,self._spread[dim]) if (self._spread[dim] > 0) else v0
+            v1 = get_random_state().normal(v0,self._spread[dim],n) if (self._spread[dim] > 0) else (v0 if n is None else numpy.repeat(v0,n))
         elif self._mode == "normal_poisson":
-            v1 = numpy.random.normal(numpy.random.poisson(v0),self._spread[dim])
+            v1 = get_random_state().normal(get_random_state().poisson(v0,n),self._spread[dim])
         elif self._mode == "poisson":
-            v1 = numpy.random.poisson(v0)
+            v1 = get_random_state().poisson(v0,n)
         elif self._mode == "uniform":
-            v1 = numpy.random.uniform(v0-self._spread[dim]/2.,v0+self._spread[dim]/2.) if (self._spread[dim] > 0) else v0
+            v1 = get_random_state().uniform(v0-self._spread[dim]/2.,v0+self._spread[dim]/2.,n) if (self._spread[dim] > 0) else (v0 if n is None else numpy.repeat(v0,n))
         elif self._mode == "range":
             g = self._get_grid()
-            v1 = v0 + g[dim,self._i % g.shape[1]]
+            i = self._i if n is None else (self._i + numpy.arange(n))
+            v1 = v0 + g[dim,i % g.shape[1]]
         return v1